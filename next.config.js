@@ -5,6 +5,22 @@ const nextConfig = {
   experimental: {},
   // El alias '@' lo resuelve Turbopack automáticamente via tsconfig paths
   turbopack: {},
+  // Exportación particionada (scripts/exportacion_estatica.py) copiada a
+  // public/entrenamientos: las sesiones tienen nombre por hash de contenido y
+  // se cachean para siempre; el índice se revalida en cada visita. Los mismos
+  // headers están en vercel.json para el CDN.
+  async headers() {
+    return [
+      {
+        source: '/entrenamientos/sesiones/:archivo*',
+        headers: [{ key: 'Cache-Control', value: 'public, max-age=31536000, immutable' }],
+      },
+      {
+        source: '/entrenamientos/index.json',
+        headers: [{ key: 'Cache-Control', value: 'no-cache' }],
+      },
+    ]
+  },
   webpack: (config) => {
     config.resolve.alias = {
       ...config.resolve.alias,
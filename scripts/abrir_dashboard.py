@@ -3,18 +3,157 @@ Script simple para abrir el dashboard con un servidor HTTP local.
 Esto evita problemas de CORS al abrir archivos HTML directamente.
 """
 
+import argparse
 import http.server
+import json
 import socketserver
 import webbrowser
 import os
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from demonio_sesiones import ErrorDemonio, consultar
+from eventos_dashboard import VigilanteExportacion, transmitir_eventos
+from exportacion_estatica import CACHE_INDICE, CACHE_INMUTABLE, DIRECTORIO_ESTATICO
 
 PORT = 8000
 DIRECTORY = Path(__file__).parent
 
+# Rutas /api/... que se responden consultando a demonio_sesiones.py:
+# ruta → (comando, parámetros admitidos en la query, parámetros obligatorios)
+RUTAS_API = {
+    '/api/estado':      ('ping', (), ()),
+    '/api/sesiones':    ('sesiones', (), ()),
+    '/api/listar':      ('listar', (), ()),
+    '/api/sesion':      ('sesion', ('id',), ('id',)),
+    '/api/diagnostico': ('diagnosticar', ('id',), ()),
+    '/api/ventana':     ('ventana', ('id', 'desde', 'hasta'), ('id', 'desde', 'hasta')),
+}
+
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    directorio = DIRECTORY
+    usar_demonio = False
+    vigilante = None
+    # (mtime, índice) de similitud.npz, cargado en la primera consulta
+    _similitud = (None, None)
+
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=str(DIRECTORY), **kwargs)
+        super().__init__(*args, directory=str(self.directorio), **kwargs)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.usar_demonio and url.path in RUTAS_API:
+            self.responder_api(*RUTAS_API[url.path], parse_qs(url.query))
+        elif self.vigilante and url.path == '/api/eventos':
+            transmitir_eventos(self, self.vigilante)
+        elif self.vigilante and url.path == '/api/sesion-export':
+            clave = parse_qs(url.query).get('id', [''])[0]
+            sesion = self.vigilante.sesion(clave)
+            if sesion is None:
+                self.responder_json({'error': f'Sesión desconocida: {clave}'}, 404)
+            else:
+                self.responder_json(sesion)
+        elif url.path == '/api/similares':
+            self.responder_similares(parse_qs(url.query))
+        elif not self.enviar_estatico(url.path):
+            super().do_GET()
+
+    def responder_api(self, comando, permitidos, obligatorios, query):
+        """Reenvía el pedido al demonio y devuelve su resultado como JSON."""
+        desconocidos = sorted(set(query) - set(permitidos))
+        if desconocidos:
+            self.responder_json({'error': f"Parámetros no admitidos: {', '.join(desconocidos)}"}, 400)
+            return
+        faltantes = [k for k in obligatorios if k not in query]
+        if faltantes:
+            self.responder_json({'error': f"Faltan parámetros: {', '.join(faltantes)}"}, 400)
+            return
+        parametros = {k: query[k][0] for k in permitidos if k in query}
+        try:
+            resultado = consultar(comando, parametros)
+        except ErrorDemonio as e:
+            self.responder_json({'error': str(e)}, 502)
+        except Exception as e:
+            self.responder_json({'error': f"{type(e).__name__}: {e}"}, 500)
+        else:
+            self.responder_json(resultado)
+
+    def responder_similares(self, query):
+        """Las k sesiones más parecidas a ?id=... o ?fecha=... según el índice de similitud."""
+        # NumPy se importa recién aquí: `serve` arranca sin cargarlo
+        import similitud_sesiones
+
+        ruta = self.directorio / 'entrenamientos_dashboard' / similitud_sesiones.ARCHIVO_SIMILITUD
+        try:
+            mtime = ruta.stat().st_mtime
+        except OSError:
+            self.responder_json({'error': 'No hay índice de similitud (se crea al exportar)'}, 404)
+            return
+        if MyHTTPRequestHandler._similitud[0] != mtime:
+            MyHTTPRequestHandler._similitud = (mtime, similitud_sesiones.cargar_indice(ruta))
+        indice = MyHTTPRequestHandler._similitud[1]
+        if indice is None:
+            self.responder_json({'error': 'Índice de similitud de otra versión: volver a exportar'}, 404)
+            return
+
+        clave = query.get('id', [None])[0]
+        fecha = query.get('fecha', [None])[0]
+        if not clave and not fecha:
+            self.responder_json({'error': 'Falta el parámetro id o fecha'}, 400)
+            return
+        posicion = similitud_sesiones.buscar_posicion(indice, clave=clave, fecha=fecha)
+        if posicion is None:
+            self.responder_json({'error': f'Sesión no indexada: {clave or fecha}'}, 404)
+            return
+        try:
+            k = int(query.get('k', [similitud_sesiones.VECINOS])[0])
+        except ValueError:
+            k = similitud_sesiones.VECINOS
+        self.responder_json({
+            'id':       str(indice['claves'][posicion]),
+            'similares': similitud_sesiones.vecinos(indice, posicion, k),
+        })
+
+    def enviar_estatico(self, ruta_url):
+        """
+        Sirve los JSON de la exportación particionada con su Cache-Control
+        (índice revalidado, sesiones inmutables) y, si el navegador lo acepta,
+        el .br o .gz precomprimido. Retorna False si la ruta no es de ahí.
+        """
+        if f'/{DIRECTORIO_ESTATICO}/' not in ruta_url or not ruta_url.endswith('.json'):
+            return False
+        ruta = Path(self.translate_path(ruta_url))
+        if not ruta.is_file():
+            return False
+
+        cache = CACHE_INDICE if ruta.name == 'index.json' else CACHE_INMUTABLE
+        aceptadas = self.headers.get('Accept-Encoding', '')
+        codificacion = None
+        for nombre, sufijo in (('br', '.br'), ('gzip', '.gz')):
+            comprimido = ruta.with_name(ruta.name + sufijo)
+            if nombre in aceptadas and comprimido.is_file():
+                ruta, codificacion = comprimido, nombre
+                break
+
+        datos = ruta.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if codificacion:
+            self.send_header('Content-Encoding', codificacion)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', cache)
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+        return True
+
+    def responder_json(self, cuerpo, estado=200):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
     
     def end_headers(self):
         # Permitir CORS para desarrollo local
@@ -23,10 +162,28 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
 
-def main():
+class ServidorDashboard(socketserver.ThreadingTCPServer):
+    # Un hilo por conexión: las conexiones SSE quedan abiertas
+    daemon_threads = True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sirve el dashboard con un servidor HTTP local.')
+    parser.add_argument('--puerto', type=int, default=PORT, help=f'Puerto (por defecto {PORT})')
+    parser.add_argument('--directorio', type=Path, default=DIRECTORY,
+                        help='Carpeta a servir (debe contener entrenamientos_dashboard/)')
+    parser.add_argument('--no-abrir', action='store_true', help='No abrir el navegador')
+    parser.add_argument('--demonio', action='store_true',
+                        help='Responder /api/... con los datos de demonio_sesiones.py')
+    parser.add_argument('--intervalo', type=float, default=1.0,
+                        help='Segundos entre revisiones del JSON exportado (actualización en vivo)')
+    args = parser.parse_args(argv)
+    puerto = args.puerto
+    MyHTTPRequestHandler.directorio = args.directorio
+    MyHTTPRequestHandler.usar_demonio = args.demonio
+
     # Verificar que existe el archivo JSON
-    json_file = DIRECTORY / 'entrenamientos_dashboard' / 'entrenamientos.json'
-    if not json_file.exists():
+    json_file = args.directorio / 'entrenamientos_dashboard' / 'entrenamientos.json'
+    if not json_file.exists() and not args.demonio:
         print("="*80)
         print("⚠ ADVERTENCIA: No se encontró el archivo JSON")
         print("="*80)
@@ -37,20 +194,27 @@ def main():
         input("\nPresiona ENTER para salir...")
         return
     
+    # Vigilar la exportación para empujar los cambios al dashboard (SSE)
+    if json_file.exists():
+        MyHTTPRequestHandler.vigilante = VigilanteExportacion(json_file, args.intervalo)
+        MyHTTPRequestHandler.vigilante.actualizar()
+        MyHTTPRequestHandler.vigilante.start()
+
     print("="*80)
     print("🚀 Iniciando servidor local para el Dashboard")
     print("="*80)
-    print(f"\nServidor corriendo en: http://localhost:{PORT}")
-    print(f"Directorio: {DIRECTORY}")
+    print(f"\nServidor corriendo en: http://localhost:{puerto}")
+    print(f"Directorio: {args.directorio}")
     print(f"\nEl dashboard se abrirá automáticamente en tu navegador.")
     print("Presiona Ctrl+C para detener el servidor.\n")
     
     try:
-        with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+        with ServidorDashboard(("", puerto), MyHTTPRequestHandler) as httpd:
             # Abrir el navegador automáticamente
-            url = f"http://localhost:{PORT}/ejemplo_dashboard.html"
-            print(f"Abriendo: {url}\n")
-            webbrowser.open(url)
+            url = f"http://localhost:{puerto}/ejemplo_dashboard.html"
+            if not args.no_abrir:
+                print(f"Abriendo: {url}\n")
+                webbrowser.open(url)
             
             # Servir archivos
             httpd.serve_forever()
@@ -58,9 +222,9 @@ def main():
         print("\n\n✅ Servidor detenido. ¡Hasta luego!")
     except OSError as e:
         if "Address already in use" in str(e):
-            print(f"\n❌ Error: El puerto {PORT} ya está en uso.")
+            print(f"\n❌ Error: El puerto {puerto} ya está en uso.")
             print("Cierra otras aplicaciones que puedan estar usando ese puerto,")
-            print("o modifica el valor de PORT en este script.")
+            print("o elige otro con --puerto.")
         else:
             print(f"\n❌ Error: {e}")
 
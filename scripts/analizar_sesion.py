@@ -6,13 +6,16 @@ especialmente la distancia calculada.
 import sys
 from datetime import datetime
 
-# Agregar el path de la librería instalada
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
-
 from polar_rcx5_datalink.datalink import DataLink
-from polar_rcx5_datalink.parser import TrainingSession, Sample
+from polar_rcx5_datalink.parser import Sample
 from polar_rcx5_datalink.exceptions import SyncError, ParserError
-import geopy.distance
+import calidad_gps
+import distancia_gps
+from sincronizacion import LecturaSesiones, iterar_sesiones
+
+# La distancia se calcula para toda la sesión con distancia_gps en lugar de
+# llamar a geopy por cada par de muestras dentro de parse_samples().
+distancia_gps.parchear()
 
 
 def analizar_distancia(sess):
@@ -44,11 +47,15 @@ def analizar_distancia(sess):
         print(f"  - Primera muestra: Lat={first.lat:.7f}, Lon={first.lon:.7f}")
         print(f"  - Última muestra: Lat={last.lat:.7f}, Lon={last.lon:.7f}")
         
+        # Distancias de todos los segmentos de la sesión en una sola pasada
+        lats = [s.lat for s in sess.samples]
+        lons = [s.lon for s in sess.samples]
+        segmentos = distancia_gps.distancias_segmentos(lats, lons, 'vincenty')
+
         # Calcular distancia entre primera y última
-        distancia_directa = geopy.distance.distance(
-            (first.lat, first.lon),
-            (last.lat, last.lon)
-        ).meters
+        distancia_directa = distancia_gps.distancias_segmentos(
+            [first.lat, last.lat], [first.lon, last.lon], 'vincenty'
+        )[0]
         
         print(f"\n📏 Distancia calculada:")
         print(f"  - Distancia total acumulada: {sess.distance:.2f} metros ({sess.distance/1000:.2f} km)")
@@ -58,81 +65,53 @@ def analizar_distancia(sess):
         # Verificar coherencia
         if sess.distance > 0:
             print(f"\n✅ La distancia se calcula sumando la distancia entre muestras consecutivas")
-            print(f"   usando coordenadas GPS (geopy.distance).")
+            print(f"   usando coordenadas GPS (distancia_gps, Vincenty sobre WGS-84).")
             
             # Analizar algunas muestras
             print(f"\n🔍 Análisis de muestras:")
             print(f"  - Muestras analizadas: {min(10, len(sess.samples))} primeras")
             
-            distancia_acumulada = 0
-            for i in range(min(10, len(sess.samples))):
-                if i > 0:
-                    prev = sess.samples[i-1]
-                    curr = sess.samples[i]
-                    dist_segmento = geopy.distance.distance(
-                        (prev.lat, prev.lon),
-                        (curr.lat, curr.lon)
-                    ).meters
-                    distancia_acumulada += dist_segmento
-                    print(f"    Muestra {i+1}: Distancia desde anterior = {dist_segmento:.2f}m")
-            
-            # Verificar si las coordenadas son realistas
-            print(f"\n🌍 Verificación de coordenadas:")
-            coordenadas_validas = True
+            for i in range(1, min(10, len(sess.samples))):
+                print(f"    Muestra {i+1}: Distancia desde anterior = {segmentos[i-1]:.2f}m")
             
-            # Verificar rango de latitud (-90 a 90)
-            for i, sample in enumerate(sess.samples[:10]):
-                if not (-90 <= sample.lat <= 90):
-                    print(f"  ⚠️ Latitud inválida en muestra {i+1}: {sample.lat}")
-                    coordenadas_validas = False
-                if not (-180 <= sample.lon <= 180):
-                    print(f"  ⚠️ Longitud inválida en muestra {i+1}: {sample.lon}")
-                    coordenadas_validas = False
-            
-            if coordenadas_validas:
+            # Verificar todas las muestras de la sesión en una pasada
+            calidad = calidad_gps.calidad_sesion(sess, 'vincenty')
+
+            print(f"\n🌍 Verificación de coordenadas ({calidad['num_muestras']} muestras):")
+            if calidad['fuera_de_rango']:
+                print(f"  ⚠️ Coordenadas inválidas o fuera de rango: {calidad['fuera_de_rango']} muestras")
+            else:
                 print(f"  ✅ Todas las coordenadas están en rangos válidos")
-            
+            if calidad['saltos']:
+                print(f"  ⚠️ Saltos de más de {calidad_gps.SALTO_MAX_M:.0f}m entre muestras: {calidad['saltos']}")
+            if calidad['velocidades_atipicas']:
+                print(f"  ⚠️ Segmentos con velocidad atípica: {calidad['velocidades_atipicas']}")
+            if calidad['rachas_estacionarias']:
+                print(f"  ⚠️ Rachas con el GPS quieto: {calidad['rachas_estacionarias']} "
+                      f"({calidad['muestras_estacionarias']} muestras)")
+
             # Verificar si las coordenadas están en el mismo lugar (GPS no funcionaba)
-            if len(sess.samples) > 1:
-                primera_lat = sess.samples[0].lat
-                primera_lon = sess.samples[0].lon
-                
-                # Verificar si todas las coordenadas son iguales
-                muestras_con_coords = [s for s in sess.samples if s.lat is not None and s.lon is not None]
-                if len(muestras_con_coords) > 1:
-                    todas_iguales = all(
-                        abs(s.lat - primera_lat) < 0.0001 and abs(s.lon - primera_lon) < 0.0001
-                        for s in muestras_con_coords[:min(20, len(muestras_con_coords))]
-                    )
-                    
-                    if todas_iguales:
-                        print(f"\n⚠️ ADVERTENCIA CRÍTICA: Las coordenadas GPS están fijas (mismo punto)")
-                        print(f"   Esto indica que:")
-                        print(f"   - El GPS NO estaba funcionando correctamente")
-                        print(f"   - El entrenamiento fue probablemente en interiores")
-                        print(f"   - La distancia calculada ({sess.distance:.2f}m) NO es confiable")
-                        print(f"   - Debería ser 0 o marcarse como 'no disponible'")
-                    else:
-                        # Calcular variación promedio
-                        variaciones = []
-                        for i in range(1, min(20, len(muestras_con_coords))):
-                            prev = muestras_con_coords[i-1]
-                            curr = muestras_con_coords[i]
-                            dist = geopy.distance.distance(
-                                (prev.lat, prev.lon),
-                                (curr.lat, curr.lon)
-                            ).meters
-                            variaciones.append(dist)
-                        
-                        if variaciones:
-                            variacion_promedio = sum(variaciones) / len(variaciones)
-                            print(f"\n✅ Las coordenadas GPS varían")
-                            print(f"   Variación promedio entre muestras: {variacion_promedio:.2f}m")
-                            
-                            if variacion_promedio < 1.0:
-                                print(f"   ⚠️ La variación es muy pequeña - posible GPS de baja calidad")
-                else:
-                    print(f"\n⚠️ No hay suficientes muestras con coordenadas para validar")
+            if calidad['todo_quieto']:
+                print(f"\n⚠️ ADVERTENCIA CRÍTICA: Las coordenadas GPS están fijas (mismo punto)")
+                print(f"   Esto indica que:")
+                print(f"   - El GPS NO estaba funcionando correctamente")
+                print(f"   - El entrenamiento fue probablemente en interiores")
+                print(f"   - La distancia calculada ({sess.distance:.2f}m) NO es confiable")
+                print(f"   - Debería ser 0 o marcarse como 'no disponible'")
+            elif len(segmentos):
+                variacion_promedio = segmentos.mean()
+                print(f"\n✅ Las coordenadas GPS varían")
+                print(f"   Variación promedio entre muestras: {variacion_promedio:.2f}m")
+
+                if variacion_promedio < 1.0:
+                    print(f"   ⚠️ La variación es muy pequeña - posible GPS de baja calidad")
+
+            print(f"\n📈 Calidad GPS: {calidad['puntaje']:.0%} de muestras buenas", end=' ')
+            if calidad['confiable']:
+                print("✅ distancia confiable")
+            else:
+                print("⚠️ distancia NO confiable")
+            print(f"   Distancia usando solo muestras buenas: {calidad['distancia_confiable_m']:.2f}m")
         else:
             print(f"\n⚠️ La distancia calculada es 0")
             print(f"   Esto podría indicar que las coordenadas no cambiaron")
@@ -158,27 +137,27 @@ def main():
         print("\n[1/2] Sincronizando con el reloj...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Buscar la sesión específica
-        print(f"\n[2/2] Buscando sesión del {fecha_buscada}...")
-        sesion_encontrada = None
-        
-        for raw_session in raw_sessions:
-            try:
-                sess = TrainingSession(raw_session)
+            lectura = LecturaSesiones(dl)
+            
+            # Buscar la sesión específica; las demás se descartan al avanzar
+            # y la lectura se corta en cuanto aparece
+            print(f"\n[2/2] Buscando sesión del {fecha_buscada}...")
+            sesion_encontrada = None
+            disponibles = []
+            
+            for sess in iterar_sesiones(lectura):
+                if len(disponibles) < 5:
+                    disponibles.append(f"{sess.id} ({sess.start_time})")
                 if fecha_buscada in sess.id or fecha_buscada in str(sess.start_time):
                     sesion_encontrada = sess
                     # Intentar parsear muestras
                     try:
                         sess.parse_samples()
+                        if sess.has_gps:
+                            distancia_gps.aplicar_distancias(sess, 'vincenty')
                     except:
                         pass
                     break
-            except:
-                continue
         
         if sesion_encontrada:
             print(f"✓ Sesión encontrada: {sesion_encontrada.id}")
@@ -191,7 +170,7 @@ def main():
             print(f"\n💡 Cómo funciona el cálculo de distancia:")
             print(f"   1. El reloj Polar RCX5 guarda coordenadas GPS en cada muestra")
             print(f"   2. El parser calcula la distancia entre muestras consecutivas")
-            print(f"   3. Usa la fórmula de Haversine (geopy.distance) para calcular")
+            print(f"   3. Usa la fórmula de Vincenty (distancia_gps) para calcular")
             print(f"      la distancia en línea recta entre dos puntos GPS")
             print(f"   4. Suma todas las distancias entre muestras para obtener la total")
             print(f"\n⚠️ Limitaciones:")
@@ -203,12 +182,8 @@ def main():
         else:
             print(f"✗ No se encontró ninguna sesión del {fecha_buscada}")
             print(f"\nSesiones disponibles:")
-            for raw_session in raw_sessions[:5]:  # Mostrar primeras 5
-                try:
-                    sess = TrainingSession(raw_session)
-                    print(f"  - {sess.id} ({sess.start_time})")
-                except:
-                    print(f"  - (sesión no parseable)")
+            for descripcion in disponibles:  # Mostrar primeras 5
+                print(f"  - {descripcion}")
         
     except SyncError as e:
         print(f"\n✗ Error de sincronización: {e}")
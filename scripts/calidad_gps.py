@@ -0,0 +1,133 @@
+"""
+Análisis vectorizado de la calidad del GPS de una sesión completa.
+
+Antes solo se revisaban las primeras 10-20 muestras con bucles de Python. Aquí
+se recorren todas las muestras de la sesión en una pasada de NumPy y se marcan:
+
+- coordenadas fuera de rango o ausentes,
+- rachas estacionarias (GPS "pegado" en el mismo punto),
+- saltos de teletransporte (segmentos imposiblemente largos),
+- velocidades atípicas por segmento.
+
+El resultado es una máscara por muestra y un puntaje de calidad (0..1) que el
+exportador usa para decidir si confiar en sess.distance.
+"""
+
+import numpy as np
+
+from distancia_gps import distancias_segmentos, mascara_coordenadas
+
+# Desplazamiento por debajo del cual consideramos que la muestra no se movió (m)
+UMBRAL_QUIETO_M = 1.0
+# Muestras quietas consecutivas a partir de las cuales el GPS se considera pegado
+MIN_RACHA_QUIETA = 12
+# Segmento más largo que esto entre dos muestras es un salto (m)
+SALTO_MAX_M = 500.0
+# Velocidad máxima plausible para un entrenamiento (m/s, 45 km/h)
+VELOCIDAD_MAX_MS = 12.5
+# Z-score robusto (mediana/MAD) a partir del cual la velocidad es atípica
+Z_VELOCIDAD_MAX = 6.0
+# Puntaje mínimo para confiar en la distancia total
+PUNTAJE_CONFIABLE = 0.8
+
+
+def rachas(mascara):
+    """Retorna (inicios, largos) de las rachas de True de una máscara 1-D."""
+    m = np.concatenate(([0], np.asarray(mascara, dtype=np.int8), [0]))
+    cambios = np.diff(m)
+    inicios = np.flatnonzero(cambios == 1)
+    fines = np.flatnonzero(cambios == -1)
+    return inicios, fines - inicios
+
+
+def _expandir_rachas(n, inicios, largos):
+    """Máscara de largo n con True en las posiciones cubiertas por las rachas."""
+    marca = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(marca, inicios, 1)
+    np.add.at(marca, inicios + largos, -1)
+    return np.cumsum(marca[:-1]) > 0
+
+
+def analizar_calidad_gps(lat, lon, sample_rate=5, modo='haversine'):
+    """
+    Analiza todas las muestras GPS de una sesión.
+
+    Retorna un dict con conteos, el puntaje de calidad, si la distancia es
+    confiable y 'mascara' (array bool por muestra, True = muestra buena).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = lat.size
+
+    validas = mascara_coordenadas(lat, lon)
+    segmentos = distancias_segmentos(lat, lon, modo)
+    seg_validos = validas[:-1] & validas[1:]
+    velocidades = segmentos / sample_rate
+
+    # Rachas estacionarias: segmentos válidos casi nulos, seguidos
+    quietos = seg_validos & (segmentos < UMBRAL_QUIETO_M)
+    inicios, largos = rachas(quietos)
+    largas = largos >= MIN_RACHA_QUIETA
+    seg_estacionarios = _expandir_rachas(segmentos.size, inicios[largas], largos[largas])
+
+    # Saltos y velocidades atípicas
+    saltos = seg_validos & (segmentos > SALTO_MAX_M)
+    candidatos = seg_validos & ~saltos & ~quietos
+    atipicos = candidatos & (velocidades > VELOCIDAD_MAX_MS)
+    if candidatos.sum() >= 3:
+        v = velocidades[candidatos]
+        mediana = np.median(v)
+        mad = np.median(np.abs(v - mediana)) * 1.4826
+        if mad > 0:
+            atipicos |= candidatos & (np.abs(velocidades - mediana) / mad > Z_VELOCIDAD_MAX)
+
+    # Una muestra es mala si es inválida, si se llegó a ella por un segmento
+    # malo o si forma parte de una racha estacionaria
+    mascara = validas.copy()
+    if n > 1:
+        malos = saltos | atipicos
+        mascara[1:] &= ~malos
+        mascara[1:] &= ~seg_estacionarios
+        mascara[:-1] &= ~seg_estacionarios
+
+    puntaje = float(mascara.mean()) if n else 0.0
+    todo_quieto = n > 1 and bool(seg_validos.any()) and bool(quietos[seg_validos].all())
+
+    return {
+        'num_muestras':          int(n),
+        'fuera_de_rango':        int(n - validas.sum()),
+        'muestras_estacionarias': int(largos[largas].sum() + largas.sum()),
+        'rachas_estacionarias':  int(largas.sum()),
+        'saltos':                int(saltos.sum()),
+        'velocidades_atipicas':  int(atipicos.sum()),
+        'todo_quieto':           todo_quieto,
+        'puntaje':               round(puntaje, 3),
+        'confiable':             puntaje >= PUNTAJE_CONFIABLE and not todo_quieto,
+        # Distancia sumando solo segmentos entre dos muestras buenas
+        'distancia_confiable_m': float(segmentos[mascara[:-1] & mascara[1:]].sum()) if n > 1 else 0.0,
+        'mascara':               mascara,
+    }
+
+
+def calidad_sesion(sess, modo='haversine'):
+    """Analiza la calidad GPS de una TrainingSession ya parseada."""
+    return analizar_calidad_gps(
+        [s.lat for s in sess.samples],
+        [s.lon for s in sess.samples],
+        sess.info.get('sample_rate', 5),
+        modo,
+    )
+
+
+def analizar_sesiones(sesiones, modo='haversine'):
+    """Analiza todas las sesiones con GPS. Retorna {id: resultado}."""
+    return {
+        sess.id: calidad_sesion(sess, modo)
+        for sess in sesiones
+        if sess.has_gps and len(sess.samples) > 1
+    }
+
+
+def resumen(calidad):
+    """Versión serializable (sin la máscara) para incluir en el JSON exportado."""
+    return {k: v for k, v in calidad.items() if k != 'mascara'}
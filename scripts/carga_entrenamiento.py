@@ -0,0 +1,183 @@
+"""
+Modelo incremental de carga de entrenamiento.
+
+Para cada sesión se calcula el TRIMP de Banister a partir de la serie de HR
+limpia (hr_series):
+
+    TRIMP = Σ dt[min] · HRr · 0.64 · e^(1.92 · HRr),   HRr = (HR - FC reposo) / (FC máx - FC reposo)
+
+Con la suma de TRIMP de cada día se mantienen dos promedios exponenciales:
+carga aguda (ATL, 7 días) y crónica (CTL, 42 días); su diferencia (TSB) indica
+la frescura.
+
+El estado (TRIMP por sesión, serie diaria y último ATL/CTL) se guarda en un
+JSON junto a la exportación, con una huella de la hr_series de la que salió
+cada TRIMP. Una exportación nueva solo calcula el TRIMP de las sesiones que no
+estaban en el estado o cuya serie cambió (p. ej. al subir VERSION_PARSEO) y
+extiende la serie desde el primer día afectado: no vuelve a recorrer las
+muestras del resto del historial.
+"""
+
+import hashlib
+import json
+import math
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+ARCHIVO_ESTADO = 'carga_entrenamiento.json'
+FC_REPOSO = 60
+FC_MAXIMA = 190
+DIAS_AGUDA = 7
+DIAS_CRONICA = 42
+
+
+def trimp(hr, sample_rate, fc_reposo=FC_REPOSO, fc_maxima=FC_MAXIMA):
+    """TRIMP de una serie uniforme de HR (NaN o None donde falta el dato)."""
+    hr = np.array(hr, dtype=float)
+    hr = hr[~np.isnan(hr)]
+    if hr.size == 0:
+        return 0.0
+    hrr = np.clip((hr - fc_reposo) / (fc_maxima - fc_reposo), 0.0, 1.0)
+    return round(float(np.sum(hrr * 0.64 * np.exp(1.92 * hrr)) * sample_rate / 60.0), 1)
+
+
+def trimp_sesion(datos, fc_reposo=FC_REPOSO, fc_maxima=FC_MAXIMA):
+    """TRIMP de una sesión exportada (None si no tiene serie de HR)."""
+    serie = datos.get('hr_series')
+    if not serie or not serie.get('hr'):
+        return None
+    hr = [np.nan if v is None else v for v in serie['hr']]
+    return trimp(hr, serie['interval_s'], fc_reposo, fc_maxima)
+
+
+def huella_serie(datos):
+    """Hash de la hr_series de una sesión exportada (None si no tiene)."""
+    serie = datos.get('hr_series')
+    if not serie:
+        return None
+    return hashlib.sha1(json.dumps(serie, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CargaEntrenamiento(object):
+    """
+    Estado persistente del modelo: TRIMP por sesión (por id, con la huella de
+    su hr_series) y serie diaria de carga con ATL, CTL y TSB.
+    """
+
+    def __init__(self, fc_reposo=FC_REPOSO, fc_maxima=FC_MAXIMA):
+        self.parametros = {'fc_reposo': fc_reposo, 'fc_maxima': fc_maxima,
+                           'dias_aguda': DIAS_AGUDA, 'dias_cronica': DIAS_CRONICA}
+        self.sesiones = {}
+        self.serie = []
+
+    @classmethod
+    def cargar(cls, ruta, fc_reposo=FC_REPOSO, fc_maxima=FC_MAXIMA):
+        """
+        Lee el estado guardado. Si no existe, está dañado o se calculó con otros
+        parámetros, arranca vacío (los TRIMP guardados ya no serían comparables).
+        """
+        carga = cls(fc_reposo, fc_maxima)
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                estado = json.load(f)
+        except (OSError, ValueError):
+            return carga
+        if estado.get('parametros') != carga.parametros:
+            return carga
+        carga.sesiones = estado.get('sesiones', {})
+        carga.serie = estado.get('serie', [])
+        return carga
+
+    def guardar(self, ruta):
+        ruta = Path(ruta)
+        temporal = ruta.with_suffix('.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': self.parametros, 'sesiones': self.sesiones,
+                       'serie': self.serie}, f, ensure_ascii=False)
+        temporal.replace(ruta)
+
+    def incorporar(self, sesiones, hasta=None):
+        """
+        Suma las sesiones que todavía no están en el estado, recalcula las que
+        cambiaron de hr_series desde el último cálculo y rehace la serie diaria
+        desde el día más antiguo afectado hasta `hasta` (por defecto, el día de
+        la última sesión). Retorna cuántas sesiones se incorporaron o
+        recalcularon.
+        """
+        desde = None
+        nuevas = 0
+        for datos in sesiones:
+            clave = datos.get('id') or datos.get('start_time')
+            if not clave or not datos.get('start_time'):
+                continue
+            huella = huella_serie(datos)
+            anterior = self.sesiones.get(clave)
+            if anterior is not None and anterior.get('serie') == huella:
+                continue
+            afectados = [anterior['date']] if anterior is not None else []
+
+            valor = trimp_sesion(datos, self.parametros['fc_reposo'], self.parametros['fc_maxima'])
+            if valor is None:
+                # La serie desapareció: su TRIMP anterior ya no cuenta
+                self.sesiones.pop(clave, None)
+            else:
+                dia = datos['start_time'][:10]
+                self.sesiones[clave] = {'date': dia, 'trimp': valor, 'serie': huella}
+                afectados.append(dia)
+            if not afectados:
+                continue
+            desde = min(afectados + ([desde] if desde is not None else []))
+            nuevas += 1
+
+        if self.serie:
+            ultimo = self.serie[-1]['date']
+            if desde is None or desde > ultimo:
+                # Nada que corregir hacia atrás: se extiende desde el día siguiente
+                desde = (date.fromisoformat(ultimo) + timedelta(days=1)).isoformat()
+        if desde is None or (not nuevas and (hasta is None or hasta < desde)):
+            return nuevas
+
+        if hasta is None:
+            hasta = max((s['date'] for s in self.sesiones.values()), default=desde)
+        hasta = max(hasta, desde)
+        self._extender(desde, hasta)
+        return nuevas
+
+    def _extender(self, desde, hasta):
+        """Recalcula la serie a partir de `desde`, partiendo del ATL/CTL del día anterior."""
+        conservar = [d for d in self.serie if d['date'] < desde]
+        atl = conservar[-1]['atl'] if conservar else 0.0
+        ctl = conservar[-1]['ctl'] if conservar else 0.0
+
+        inicio = date.fromisoformat(desde)
+        dias = (date.fromisoformat(hasta) - inicio).days + 1
+        cargas = np.zeros(dias)
+        for s in self.sesiones.values():
+            i = (date.fromisoformat(s['date']) - inicio).days
+            if 0 <= i < dias:
+                cargas[i] += s['trimp']
+
+        k_aguda = 1 - math.exp(-1 / self.parametros['dias_aguda'])
+        k_cronica = 1 - math.exp(-1 / self.parametros['dias_cronica'])
+        nuevos = []
+        for i, carga in enumerate(cargas.tolist()):
+            atl += (carga - atl) * k_aguda
+            ctl += (carga - ctl) * k_cronica
+            nuevos.append({
+                'date':  (inicio + timedelta(days=i)).isoformat(),
+                'trimp': round(carga, 1),
+                'atl':   round(atl, 2),
+                'ctl':   round(ctl, 2),
+                'tsb':   round(ctl - atl, 2),
+            })
+        self.serie = conservar + nuevos
+
+    def trimp_de(self, clave):
+        sesion = self.sesiones.get(clave)
+        return sesion['trimp'] if sesion else None
+
+    def resumen(self):
+        """Datos para el dashboard: parámetros y serie diaria."""
+        return {'parametros': self.parametros, 'serie': self.serie}
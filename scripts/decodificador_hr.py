@@ -0,0 +1,196 @@
+"""
+Decodificador del stream de HR (sesiones sin GPS) con índice de acceso directo.
+
+Cada muestra de HR depende de la anterior (deltas) y del contador de deltas
+cero (el valor se "congela" tras dos deltas cero seguidos), así que para leer
+la muestra N hay que decodificar desde el bit 0. Este decodificador reproduce
+exactamente TrainingSession.parse_samples() en modo sin GPS y, en la misma
+pasada, guarda un checkpoint cada INTERVALO_CHECKPOINT muestras con:
+
+    (número de muestra, cursor de bits, último HR, contador de deltas cero)
+
+Con ese índice, decodificar la ventana [t0, t1] de una sesión cuesta
+O(ventana) en lugar de O(sesión). Los checkpoints apuntan al stream de bits,
+así que no se exportan: el demonio (demonio_sesiones.py) los guarda junto a la
+sesión cruda, de la que vuelve a armar el stream, y responde el comando
+`ventana` con decodificar_ventana().
+
+Cuando se marca un lap, el reloj inserta un bloque de BITS_LAP bits (casi todos
+ceros) entre dos muestras. La librería (y decodificar_hr) lo decodifica como
+unas 38 muestras basura y sigue desalineada; decodificar_hr_con_laps salta
+esos bloques, así que la serie de HR y los cortes de lap salen de la misma
+decodificación y quedan alineados.
+"""
+
+import bisect
+
+from densidad_bits import PerfilDensidad
+
+# Cada cuántas muestras se guarda un checkpoint
+INTERVALO_CHECKPOINT = 256
+# Bloque de lap en el stream sin GPS (TrainingSession._LAP_DATA_BITS_LENGTH)
+BITS_LAP = 416
+# Densidad de unos por debajo de la cual una ventana de BITS_LAP es un bloque de lap
+DENSIDAD_LAP_MAX = 0.15
+
+# Prefijos de 2 bits de cada tipo de valor (ver HRType en la librería)
+_FULL_WITH_PREFIX = '01'
+_FULL_PREFIXLESS = '00'
+_POS_DELTA = '10'
+
+
+def _leer_valor(bits, cursor):
+    """
+    Lee un valor de HR sin congelamiento. Retorna (valor, es_completo, bits).
+
+    Igual que TrainingSession._process_hr_bits(): los valores completos
+    ocupan 11 bits y los deltas 6.
+    """
+    tipo = bits[cursor:cursor + 2]
+    if tipo == _FULL_WITH_PREFIX or tipo == _FULL_PREFIXLESS:
+        inicio = 3 if tipo == _FULL_WITH_PREFIX else 0
+        valor = bits[cursor + inicio:cursor + 11]
+        if len(valor) < 4:
+            valor = '{:<04s}'.format(valor)
+        return int(valor, 2), True, 11
+
+    valor = bits[cursor + 2:cursor + 6]
+    if len(valor) < 4:
+        valor = '{:<04s}'.format(valor)
+    if tipo == _POS_DELTA:
+        return int(valor, 2), False, 6
+    # NEG_DELTA: complemento a 2 de 4 bits
+    return -((int(valor, 2) ^ 0b1111) + 1), False, 6
+
+
+def _decodificar(bits, n, cursor, last_hr, zero_delta, hasta, intervalo, checkpoints, hrs,
+                 es_lap=None, laps=None):
+    """
+    Bucle principal: decodifica desde el estado dado hasta la muestra `hasta`.
+    Con `es_lap` (cursor → bool) salta los bloques de lap antes de cada
+    muestra y anota (muestra, bit) de cada uno en `laps`.
+    """
+    total = len(bits)
+
+    # Mismo criterio de fin que parse_samples(): quedan al menos 6 bits
+    while cursor < total and total - cursor > 5:
+        if hasta is not None and n >= hasta:
+            break
+        if es_lap is not None and es_lap(cursor):
+            if laps is not None:
+                laps.append((n, cursor))
+            cursor += BITS_LAP
+            zero_delta = 0
+            continue
+        if checkpoints is not None and n % intervalo == 0:
+            checkpoints.append((n, cursor, last_hr, zero_delta))
+
+        if zero_delta >= 2 and bits[cursor:cursor + 2] != _FULL_WITH_PREFIX:
+            # Valor congelado: se consume 1 bit y el HR no cambia
+            zero_delta += 1
+            cursor += 1
+        else:
+            valor, es_completo, largo = _leer_valor(bits, cursor)
+            cursor += largo
+            if es_completo:
+                zero_delta = 0
+                last_hr = valor
+            else:
+                zero_delta = zero_delta + 1 if valor == 0 else 0
+                last_hr = last_hr + valor
+
+        hrs.append(last_hr)
+        n += 1
+
+    return n, cursor, last_hr, zero_delta
+
+
+def _decodificar_desde_inicio(bits, hasta, intervalo, checkpoints, es_lap=None, laps=None):
+    # Con menos de 2 bits no hay tipo de valor (la librería lanza ParserError)
+    if len(bits) < 2 or hasta == 0:
+        return []
+
+    # Primera muestra: valor leído tal cual, sin contador de deltas
+    primero, _, largo = _leer_valor(bits, 0)
+    hrs = [primero]
+    _decodificar(bits, 1, largo, primero, 0, hasta, intervalo, checkpoints, hrs, es_lap, laps)
+    return hrs
+
+
+def _detector_laps(bits):
+    """
+    Función cursor → True si en ese bit empieza un bloque de lap: la ventana
+    de BITS_LAP bits tiene densidad < DENSIDAD_LAP_MAX y es la de menos unos
+    entre las que empiezan en los BITS_LAP bits siguientes. Con solo el umbral,
+    el bloque se detecta unas 20 muestras antes (en cuanto la ventana cubre
+    suficientes ceros) y el salto termina en medio del bloque.
+    """
+    densidades = PerfilDensidad(bits).densidad(BITS_LAP)
+
+    def es_lap(cursor):
+        return (cursor < densidades.size and densidades[cursor] < DENSIDAD_LAP_MAX
+                and densidades[cursor] <= densidades[cursor:cursor + BITS_LAP].min())
+    return es_lap
+
+
+def decodificar_hr(bits, intervalo=INTERVALO_CHECKPOINT):
+    """
+    Decodifica todo el stream de HR de una sesión sin GPS.
+
+    Retorna (hrs, checkpoints): la lista de valores de HR (uno por muestra,
+    sin filtrar) y el índice de checkpoints [(muestra, bit, last_hr, zero_delta)].
+    """
+    checkpoints = []
+    hrs = _decodificar_desde_inicio(bits, None, intervalo, checkpoints)
+    return hrs, checkpoints
+
+
+def decodificar_hr_con_laps(bits, intervalo=INTERVALO_CHECKPOINT):
+    """
+    Como decodificar_hr(), pero salta los bloques de lap en lugar de
+    decodificarlos como muestras.
+
+    Retorna (hrs, checkpoints, laps): laps es la lista de (muestra, bit) de
+    cada bloque, con la muestra de la serie donde empieza el lap siguiente y
+    el bit del stream donde empieza el bloque.
+    """
+    checkpoints, laps = [], []
+    hrs = _decodificar_desde_inicio(bits, None, intervalo, checkpoints, _detector_laps(bits), laps)
+    return hrs, checkpoints, laps
+
+
+def _detector_conocidos(laps):
+    """Función cursor → True en los bits donde empieza un lap ya detectado."""
+    bits_lap = {bit for _, bit in laps}
+    return lambda cursor: cursor in bits_lap
+
+
+def decodificar_rango(bits, checkpoints, desde, hasta, laps=()):
+    """
+    Decodifica solo las muestras [desde, hasta) arrancando desde el checkpoint
+    más cercano anterior a `desde`. Retorna la lista de HR de ese rango.
+
+    `laps` es la lista de (muestra, bit) de decodificar_hr_con_laps(): con ella
+    se saltan los mismos bloques y el rango coincide con esa serie.
+    """
+    es_lap = _detector_conocidos(laps) if laps else None
+    i = bisect.bisect_right([c[0] for c in checkpoints], desde) - 1
+    if i < 0:
+        return _decodificar_desde_inicio(bits, hasta, 1, None, es_lap)[desde:]
+
+    n, cursor, last_hr, zero_delta = checkpoints[i]
+    hrs = []
+    _decodificar(bits, n, cursor, last_hr, zero_delta, hasta, 1, None, hrs, es_lap)
+    return hrs[desde - n:]
+
+
+def decodificar_ventana(bits, checkpoints, t0, t1, sample_rate, laps=()):
+    """
+    HR de la ventana de tiempo [t0, t1] (segundos desde el inicio).
+
+    Retorna una lista de (segundos, hr) para cada muestra de la ventana.
+    """
+    desde = max(0, t0 // sample_rate)
+    hasta = t1 // sample_rate + 1
+    hrs = decodificar_rango(bits, checkpoints, desde, hasta, laps)
+    return [((desde + i) * sample_rate, hr) for i, hr in enumerate(hrs)]
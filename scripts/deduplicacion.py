@@ -0,0 +1,195 @@
+"""
+Índice de sesiones únicas por contenido, persistente entre exportaciones.
+
+Cada sincronización devuelve todas las sesiones que quedan en el reloj, así
+que dos volcados seguidos comparten casi todo, y combinar capturas de varios
+volcados parsea (y guarda) la misma sesión una vez por volcado. El `id` sale
+del parser y no sirve para saber si dos crudos son el mismo entrenamiento sin
+parsearlos.
+
+Aquí cada sesión cruda se identifica por el SHA-256 de su primer paquete (el
+header: fecha, duración, promedios) y de su zona de muestras reensamblada
+(ensamblado.SesionEnsamblada), sin los headers de paquete ni el relleno, que
+no son parte del entrenamiento. El índice vive en un directorio:
+
+    sesiones_unicas/indice.json             huella → id, fecha, veces vista
+    sesiones_unicas/crudas/<huella>.json    crudo (formato de captura)
+    sesiones_unicas/parseadas/<huella>.json resultado de parsear_sesion_completa
+
+Cada resultado se escribe en cuanto termina de parsearse, así que una
+exportación cortada se retoma sin volver a parsear lo ya hecho. Una sesión
+cuya huella ya tiene resultado parseado con el formato actual (VERSION_PARSEO)
+y las mismas opciones de parseo (la zona horaria) no se vuelve a parsear, y
+una huella repetida dentro de la misma corrida (varias capturas con la misma
+sesión) se descarta. Los crudos guardados se pueden releer con
+--capturas sesiones_unicas/crudas.
+"""
+
+import hashlib
+import json
+from collections import deque
+from datetime import date
+from pathlib import Path
+
+from ensamblado import SesionEnsamblada
+
+DIRECTORIO_UNICAS = 'sesiones_unicas'
+ARCHIVO_INDICE = 'indice.json'
+DIRECTORIO_CRUDAS = 'crudas'
+DIRECTORIO_PARSEADAS = 'parseadas'
+# Subir cuando cambie el formato de las sesiones exportadas: invalida los resultados guardados
+VERSION_PARSEO = 4
+
+
+def huella_sesion(raw_session):
+    """SHA-256 del primer paquete y de la zona de muestras reensamblada de una sesión cruda."""
+    h = hashlib.sha256()
+    h.update(bytes(raw_session[0]))
+    h.update(b'\n')
+    h.update(SesionEnsamblada(raw_session).muestras(con_gps=True))
+    return h.hexdigest()
+
+
+def _escribir_json(ruta, objeto):
+    temporal = ruta.with_name(ruta.name + '.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(objeto, f, ensure_ascii=False)
+    temporal.replace(ruta)
+
+
+class IndiceSesiones(object):
+    """
+    Sesiones únicas guardadas en `directorio`, indexadas por huella de
+    contenido. Las sesiones se registran de a una (cada archivo se escribe en
+    cuanto termina de parsearse); guardar() actualiza indice.json.
+
+    `opciones` (dict serializable, p. ej. la zona horaria) se guarda con cada
+    resultado: uno parseado con otras opciones no se reutiliza. Con
+    `reutilizar=False` se vuelven a parsear todas las sesiones.
+    """
+
+    def __init__(self, directorio, opciones=None, reutilizar=True):
+        self.directorio = Path(directorio)
+        self.opciones = dict(opciones or {})
+        self.reutilizar = reutilizar
+        self.crudas = self.directorio / DIRECTORIO_CRUDAS
+        self.parseadas = self.directorio / DIRECTORIO_PARSEADAS
+        self.crudas.mkdir(parents=True, exist_ok=True)
+        self.parseadas.mkdir(parents=True, exist_ok=True)
+
+        self.sesiones = {}
+        try:
+            with open(self.directorio / ARCHIVO_INDICE, encoding='utf-8') as f:
+                self.sesiones = json.load(f).get('sesiones', {})
+        except (OSError, ValueError):
+            pass
+        # Crudos guardados por una corrida que se cortó antes de guardar el índice
+        for ruta in self.crudas.glob('*.json'):
+            self.sesiones.setdefault(ruta.stem, {'id': None, 'start_time': None,
+                                                 'primera_vez': None, 'veces': 0})
+
+        # Estado de la corrida actual. _pendientes: (huella, nueva) en el orden
+        # de la fuente, hasta que procesar_sin_duplicados entrega cada sesión
+        self.vistas = set()
+        self.conocidas = []
+        self.duplicadas = 0
+        self._pendientes = deque()
+
+    def __contains__(self, huella):
+        return huella in self.sesiones
+
+    def __len__(self):
+        return len(self.sesiones)
+
+    def datos(self, huella):
+        """Resultado parseado guardado de una huella, o None si no hay (o es de otro formato u opciones)."""
+        try:
+            with open(self.parseadas / f'{huella}.json', encoding='utf-8') as f:
+                guardado = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if guardado.get('version') != VERSION_PARSEO or guardado.get('opciones', {}) != self.opciones:
+            return None
+        return guardado['datos']
+
+    def filtrar_nuevas(self, fuente):
+        """
+        Entrega solo los crudos de `fuente` que hay que parsear: ni repetidos
+        en esta corrida ni ya parseados con el formato y las opciones
+        actuales. Las huellas conocidas quedan en `conocidas` (en orden) y los
+        crudos nuevos se guardan una vez en crudas/.
+        """
+        for raw in fuente:
+            huella = huella_sesion(raw)
+            if huella in self.vistas:
+                self.duplicadas += 1
+                continue
+            self.vistas.add(huella)
+
+            entrada = self.sesiones.setdefault(huella, {'id': None, 'start_time': None,
+                                                        'primera_vez': date.today().isoformat(),
+                                                        'veces': 0})
+            entrada['veces'] += 1
+            if self.reutilizar and self.datos(huella) is not None:
+                self.conocidas.append(huella)
+                self._pendientes.append((huella, False))
+                continue
+
+            ruta_cruda = self.crudas / f'{huella}.json'
+            if not ruta_cruda.exists():
+                _escribir_json(ruta_cruda, [list(bytes(paquete)) for paquete in raw])
+            self._pendientes.append((huella, True))
+            yield raw
+
+    def no_vistas(self):
+        """Crudos guardados cuyas huellas no aparecieron en esta corrida (sesiones que ya no están en el reloj)."""
+        for huella in sorted(self.sesiones):
+            if huella in self.vistas:
+                continue
+            try:
+                with open(self.crudas / f'{huella}.json', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def conocidas_en_orden(self):
+        """Resultados guardados de las huellas conocidas que están primeras en la fila de pendientes."""
+        while self._pendientes and not self._pendientes[0][1]:
+            huella, _ = self._pendientes.popleft()
+            datos = self.datos(huella)
+            if datos is not None:
+                yield datos
+
+    def todas(self):
+        """Resultados guardados de todas las sesiones del índice (el historial completo, sin repetidas)."""
+        for huella in sorted(self.sesiones):
+            datos = self.datos(huella)
+            if datos is not None:
+                yield datos
+
+    def registrar(self, datos):
+        """Guarda el resultado parseado del crudo nuevo más antiguo entregado por filtrar_nuevas()."""
+        huella, _ = self._pendientes.popleft()
+        _escribir_json(self.parseadas / f'{huella}.json',
+                       {'version': VERSION_PARSEO, 'opciones': self.opciones, 'datos': datos})
+        entrada = self.sesiones[huella]
+        entrada['id'] = datos.get('id')
+        entrada['start_time'] = datos.get('start_time')
+        return datos
+
+    def guardar(self):
+        _escribir_json(self.directorio / ARCHIVO_INDICE,
+                       {'version': VERSION_PARSEO, 'opciones': self.opciones, 'sesiones': self.sesiones})
+
+
+def procesar_sin_duplicados(fuente, procesar, indice):
+    """
+    Aplica `procesar` (iterable de crudos → iterable de resultados, en el
+    mismo orden) solo a las sesiones nuevas de `fuente` y registra cada
+    resultado en el índice. Las sesiones ya conocidas se entregan desde sus
+    resultados guardados, intercaladas en el orden de la fuente.
+    """
+    for datos in procesar(indice.filtrar_nuevas(fuente)):
+        yield from indice.conocidas_en_orden()
+        yield indice.registrar(datos)
+    yield from indice.conocidas_en_orden()
@@ -0,0 +1,324 @@
+"""
+Demonio local que sincroniza una vez y mantiene las sesiones decodificadas.
+
+Cada script de diagnóstico vuelve a sincronizar el reloj y a parsear todo desde
+cero. El demonio hace la sincronización (o lee una captura con --capturas) una
+sola vez, guarda las sesiones crudas y cachea las decodificadas en un LRU en
+memoria. Exportador, diagnósticos y dashboard le piden los datos por un socket
+local: cinco análisis seguidos cuestan una sincronización y un parseo.
+
+Protocolo: conexión TCP a 127.0.0.1:PUERTO_DEMONIO; cada pedido es una línea
+JSON {"comando": ..., ...parámetros} y cada respuesta una línea JSON
+{"ok": true, "resultado": ...} o {"ok": false, "error": "..."}. Comandos:
+
+    ping                      estado del demonio
+    listar                    info básica (header) de cada sesión
+    sesion        id          sesión decodificada (formato del exportador)
+    sesiones                  todas las sesiones decodificadas, en orden
+    diagnosticar  [id]        métricas de diagnosticar_sesiones (una o todas)
+    ventana       id desde hasta
+                              HR crudo de [desde, hasta] s de una sesión sin GPS,
+                              decodificado desde el checkpoint más cercano
+    recargar                  volver a sincronizar / releer la captura
+    detener                   apagar el demonio
+
+Uso:
+    python scripts/demonio_sesiones.py                   # sincroniza con el reloj
+    python scripts/demonio_sesiones.py --capturas DIR    # replay de sesiones crudas
+"""
+
+import argparse
+import json
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+
+PUERTO_DEMONIO = 8765
+# Resultados decodificados (sesiones, diagnósticos e índices de HR) que se
+# mantienen en memoria; por defecto (None) entran los tres de cada sesión de la
+# fuente, para que un recorrido completo no desaloje sus propias entradas
+MAX_SESIONES_CACHEADAS = None
+
+
+class ErrorDemonio(Exception):
+    """El demonio no responde o devolvió un error."""
+
+
+def consultar(comando, parametros=None, puerto=PUERTO_DEMONIO, timeout=None):
+    """
+    Cliente: envía un pedido al demonio y retorna el resultado. `parametros`
+    es un dict con los parámetros del comando (p. ej. {'id': ...}). Lanza
+    ErrorDemonio si no hay demonio escuchando o si el pedido falla.
+    """
+    pedido = dict(parametros or {}, comando=comando)
+    try:
+        with socket.create_connection(('127.0.0.1', puerto), timeout=timeout) as s:
+            s.sendall((json.dumps(pedido) + '\n').encode('utf-8'))
+            with s.makefile('r', encoding='utf-8') as f:
+                linea = f.readline()
+    except OSError as e:
+        raise ErrorDemonio(f"No se pudo conectar al demonio en el puerto {puerto}: {e}")
+
+    if not linea:
+        raise ErrorDemonio("El demonio cerró la conexión sin responder")
+    respuesta = json.loads(linea)
+    if not respuesta.get('ok'):
+        raise ErrorDemonio(respuesta.get('error', 'error desconocido'))
+    return respuesta['resultado']
+
+
+class AlmacenSesiones(object):
+    """
+    Sesiones crudas de una fuente (reloj o captura) más un LRU de resultados
+    decodificados por (tipo, índice de sesión). Con max_cacheadas=None el LRU
+    tiene lugar para sesión, diagnóstico e índice de HR (checkpoints y laps de
+    decodificador_hr) de todas las sesiones de la fuente.
+    """
+
+    def __init__(self, abrir_fuente, descripcion, workers=None, max_cacheadas=MAX_SESIONES_CACHEADAS):
+        self._abrir_fuente = abrir_fuente
+        self.descripcion = descripcion
+        self.workers = workers
+        self.max_cacheadas = max_cacheadas
+        self.sincronizaciones = 0
+        self._crudas = []
+        self._por_id = {}
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    def cargar(self):
+        """Lee todas las sesiones crudas de la fuente y vacía la caché."""
+        from deteccion_gps import SesionAutodetectada, id_exportado
+        from zona_horaria import ids_de_sesiones
+
+        with self._lock:
+            crudas = list(self._abrir_fuente())
+            # Los ids salen del header de cada sesión, convertidos a UTC de una
+            # vez. Con GPS (byte 166) el exportador emite el id de la zona de
+            # las coordenadas, así que esas sesiones se indexan con ese
+            ids = ids_de_sesiones(crudas)
+            for i, raw in enumerate(crudas):
+                if ids[i] is not None and raw[0][166]:
+                    try:
+                        ids[i] = id_exportado(SesionAutodetectada(raw))
+                    except Exception:
+                        pass
+            por_id = {}
+            for i, id_sesion in enumerate(ids):
+                if id_sesion is not None:
+                    por_id.setdefault(id_sesion, i)
+            self._crudas, self._por_id = crudas, por_id
+            self._cache.clear()
+            self.sincronizaciones += 1
+            return len(crudas)
+
+    def _indice(self, id_sesion):
+        if id_sesion not in self._por_id:
+            raise KeyError(f"Sesión desconocida: {id_sesion}")
+        return self._por_id[id_sesion]
+
+    @property
+    def capacidad(self):
+        if self.max_cacheadas is not None:
+            return self.max_cacheadas
+        return max(1, 3 * len(self._crudas))
+
+    def _guardar_en_cache(self, clave, valor):
+        with self._lock:
+            self._cache[clave] = valor
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.capacidad:
+                self._cache.popitem(last=False)
+
+    def _cacheado(self, clave, calcular):
+        with self._lock:
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave]
+        valor = calcular()
+        self._guardar_en_cache(clave, valor)
+        return valor
+
+    def _todas(self, tipo, funcion):
+        """Resultados de `funcion` para todas las sesiones; las que faltan se
+        calculan en paralelo."""
+        from sincronizacion import procesar_en_pipeline
+
+        with self._lock:
+            crudas = list(self._crudas)
+            resultados = [self._cache.get((tipo, i)) for i in range(len(crudas))]
+        faltantes = [i for i, r in enumerate(resultados) if r is None]
+
+        if faltantes:
+            nuevos = procesar_en_pipeline((crudas[i] for i in faltantes), funcion, self.workers)
+            for i, valor in zip(faltantes, nuevos):
+                resultados[i] = valor
+                self._guardar_en_cache((tipo, i), valor)
+        return resultados
+
+    def estado(self):
+        with self._lock:
+            return {
+                'fuente':           self.descripcion,
+                'sesiones':         len(self._crudas),
+                'cacheadas':        len(self._cache),
+                'capacidad':        self.capacidad,
+                'sincronizaciones': self.sincronizaciones,
+            }
+
+    def listar(self):
+        from exportar_para_dashboard import extraer_info_basica
+
+        with self._lock:
+            crudas = list(self._crudas)
+        return [dict(extraer_info_basica(raw), indice=i) for i, raw in enumerate(crudas)]
+
+    def sesion(self, id_sesion):
+        from exportar_para_dashboard import parsear_sesion_completa
+
+        i = self._indice(id_sesion)
+        return self._cacheado(('sesion', i), lambda: parsear_sesion_completa(self._crudas[i]))
+
+    def sesiones(self):
+        from exportar_para_dashboard import parsear_sesion_completa
+
+        return self._todas('sesion', parsear_sesion_completa)
+
+    def diagnosticar(self, id_sesion=None):
+        from diagnosticar_sesiones import metricas_sesion
+
+        if id_sesion is not None:
+            i = self._indice(id_sesion)
+            fila = self._cacheado(('diagnostico', i), lambda: metricas_sesion(self._crudas[i]))
+            return [dict(fila, sesion=i + 1)]
+        filas = self._todas('diagnostico', metricas_sesion)
+        return [dict(fila, sesion=i) for i, fila in enumerate(filas, 1)]
+
+    def ventana(self, id_sesion, desde, hasta):
+        """
+        HR crudo (sin limpiar) de los segundos [desde, hasta] de una sesión sin
+        GPS. El stream de bits se vuelve a armar de la sesión cruda; los
+        checkpoints y laps se decodifican una vez y quedan en el LRU, así que
+        cada ventana cuesta O(ventana).
+        """
+        from decodificador_hr import decodificar_hr_con_laps, decodificar_ventana
+        from deteccion_gps import SesionAutodetectada
+
+        desde, hasta = int(desde), int(hasta)
+        if not 0 <= desde <= hasta:
+            raise ValueError(f"Ventana inválida: [{desde}, {hasta}]")
+        i = self._indice(id_sesion)
+        sess = SesionAutodetectada(self._crudas[i])
+        if sess.has_gps or not sess.has_hr:
+            raise ValueError("La ventana solo se decodifica en sesiones con HR y sin GPS")
+
+        bits = sess._samples_bits
+        checkpoints, laps = self._cacheado(('indice_hr', i), lambda: decodificar_hr_con_laps(bits)[1:])
+        sample_rate = sess.info.get('sample_rate', 5)
+        return {
+            'id':         id_sesion,
+            'interval_s': sample_rate,
+            'muestras':   decodificar_ventana(bits, checkpoints, desde, hasta, sample_rate, laps),
+        }
+
+
+class _ManejadorPedidos(socketserver.StreamRequestHandler):
+    """Atiende pedidos JSON de a una línea hasta que el cliente cierra."""
+
+    def handle(self):
+        for linea in self.rfile:
+            if not linea.strip():
+                continue
+            try:
+                pedido = json.loads(linea)
+                resultado = self.server.atender(pedido)
+                respuesta = {'ok': True, 'resultado': resultado}
+            except Exception as e:
+                respuesta = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(respuesta, ensure_ascii=False) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class ServidorSesiones(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, almacen, puerto=PUERTO_DEMONIO):
+        super().__init__(('127.0.0.1', puerto), _ManejadorPedidos)
+        self.almacen = almacen
+
+    def atender(self, pedido):
+        comando = pedido.get('comando')
+        almacen = self.almacen
+
+        if comando == 'ping':
+            return almacen.estado()
+        if comando == 'listar':
+            return almacen.listar()
+        if comando == 'sesion':
+            return almacen.sesion(pedido['id'])
+        if comando == 'sesiones':
+            return almacen.sesiones()
+        if comando == 'diagnosticar':
+            return almacen.diagnosticar(pedido.get('id'))
+        if comando == 'ventana':
+            return almacen.ventana(pedido['id'], pedido['desde'], pedido['hasta'])
+        if comando == 'recargar':
+            return {'sesiones': almacen.cargar()}
+        if comando == 'detener':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return 'deteniendo'
+        raise ValueError(f"Comando desconocido: {comando}")
+
+
+def _fuente_reloj():
+    """Sincroniza con el reloj y entrega las sesiones crudas de a una."""
+    from polar_rcx5_datalink.datalink import DataLink
+    from sincronizacion import LecturaSesiones
+
+    with DataLink() as dl:
+        dl.synchronize()
+        yield from LecturaSesiones(dl)
+
+
+def main(argv=None):
+    import zona_horaria
+    from sincronizacion import LecturaCapturas
+
+    parser = argparse.ArgumentParser(description='Demonio local con las sesiones del reloj decodificadas en memoria.')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument('--capturas', metavar='DIR',
+                        help='Usar sesiones crudas de un directorio en lugar del reloj')
+    parser.add_argument('--puerto', type=int, default=PUERTO_DEMONIO,
+                        help=f'Puerto local (por defecto {PUERTO_DEMONIO})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos para decodificar (por defecto, uno por CPU)')
+    parser.add_argument('--max-cacheadas', type=int, default=MAX_SESIONES_CACHEADAS,
+                        help='Resultados decodificados que se mantienen en memoria '
+                             '(por defecto, tres por sesión: sesión, diagnóstico e índice de HR)')
+    args = parser.parse_args(argv)
+    zona_horaria.instalar(args.timezone)
+
+    if args.capturas:
+        almacen = AlmacenSesiones(lambda: LecturaCapturas(args.capturas), f"capturas: {args.capturas}",
+                                  args.workers, args.max_cacheadas)
+    else:
+        input("Presiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
+        almacen = AlmacenSesiones(_fuente_reloj, 'reloj', args.workers, args.max_cacheadas)
+
+    print("\nCargando sesiones...")
+    total = almacen.cargar()
+    print(f"✓ {total} sesiones en memoria ({almacen.descripcion})")
+
+    with ServidorSesiones(almacen, args.puerto) as servidor:
+        print(f"✓ Demonio escuchando en 127.0.0.1:{args.puerto} (Ctrl+C para detener)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print("\n✅ Demonio detenido.")
+
+
+if __name__ == '__main__':
+    main()
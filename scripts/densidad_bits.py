@@ -0,0 +1,123 @@
+"""
+Perfil de densidad de bits del stream de muestras de una sesión.
+
+Los bloques de lap (416 bits casi todos en cero) se detectan por su baja
+densidad de unos. En lugar de recorrer el stream contando '1' en cada ventana,
+se calcula una sola vez la suma acumulada de los bits con NumPy; a partir de
+ella la densidad de cualquier ventana en cualquier offset es una resta.
+
+Los perfiles se cachean por sesión, de modo que se pueden probar distintos
+umbrales y tamaños de ventana sin volver a recorrer el stream.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Cantidad de perfiles de sesión que se mantienen en memoria
+MAX_PERFILES_CACHEADOS = 32
+
+_perfiles = OrderedDict()
+
+
+def bits_a_array(bits):
+    """Convierte un string de '0'/'1' en un array uint8 de 0/1."""
+    return np.frombuffer(bits.encode('ascii'), dtype=np.uint8) - ord('0')
+
+
+def _rachas(mascara):
+    """Retorna (inicios, largos) de las rachas de True de una máscara 1-D."""
+    m = np.concatenate(([0], mascara.astype(np.int8), [0]))
+    cambios = np.diff(m)
+    inicios = np.flatnonzero(cambios == 1)
+    return inicios, np.flatnonzero(cambios == -1) - inicios
+
+
+class PerfilDensidad(object):
+    """Densidad de unos por ventana para todos los offsets de un stream de bits."""
+
+    def __init__(self, bits):
+        if isinstance(bits, str):
+            bits = bits_a_array(bits)
+        self.total_bits = len(bits)
+        self._acumulado = np.concatenate(([0], np.cumsum(bits, dtype=np.int32)))
+        self._densidades = {}
+
+    def unos(self, inicio, fin):
+        """Cantidad de bits en 1 en [inicio, fin)."""
+        return int(self._acumulado[fin] - self._acumulado[inicio])
+
+    def densidad(self, ventana):
+        """
+        Densidad de unos de la ventana que empieza en cada offset.
+
+        Retorna un array de total_bits - ventana + 1 elementos (vacío si la
+        ventana es más larga que el stream). Se cachea por tamaño de ventana.
+        """
+        if ventana not in self._densidades:
+            if ventana > self.total_bits:
+                d = np.zeros(0)
+            else:
+                d = (self._acumulado[ventana:] - self._acumulado[:-ventana]) / ventana
+            self._densidades[ventana] = d
+        return self._densidades[ventana]
+
+    def multiescala(self, ventanas):
+        """Densidades para varias ventanas a la vez: {ventana: array}."""
+        return {v: self.densidad(v) for v in ventanas}
+
+    def zonas(self, ventana, densidad_min=None, densidad_max=None, paso=1):
+        """
+        Agrupa los offsets (cada `paso` bits) cuya ventana tiene densidad
+        < densidad_min o > densidad_max. Dos offsets anómalos a menos de una
+        ventana de distancia quedan en la misma zona.
+
+        Retorna una lista de dicts con inicio, fin (bits) y densidad media.
+        """
+        d = self.densidad(ventana)[:max(0, self.total_bits - ventana):paso]
+        anomalo = np.zeros(d.shape, dtype=bool)
+        if densidad_min is not None:
+            anomalo |= d < densidad_min
+        if densidad_max is not None:
+            anomalo |= d > densidad_max
+
+        posiciones = np.flatnonzero(anomalo) * paso
+        if posiciones.size == 0:
+            return []
+
+        cortes = np.flatnonzero(np.diff(posiciones) > ventana) + 1
+        inicios_grupo = np.concatenate(([0], cortes))
+        fines_grupo = np.concatenate((cortes, [posiciones.size])) - 1
+        medias = np.add.reduceat(d[anomalo], inicios_grupo) / (fines_grupo - inicios_grupo + 1)
+
+        return [
+            {
+                'inicio':   int(posiciones[i]),
+                'fin':      int(posiciones[f]) + ventana,
+                'densidad': float(m),
+            }
+            for i, f, m in zip(inicios_grupo, fines_grupo, medias)
+        ]
+
+    def candidatos_lap(self, ventana, densidad_max):
+        """
+        Offsets donde empieza un posible bloque de lap: inicio de cada racha de
+        ventanas con densidad < densidad_max. Retorna lista de (offset, largo de
+        la racha en bits).
+        """
+        inicios, largos = _rachas(self.densidad(ventana) < densidad_max)
+        return [(int(i), int(l)) for i, l in zip(inicios, largos)]
+
+
+def perfil_de_sesion(sess):
+    """Perfil de densidad de la sesión, cacheado por id de sesión."""
+    clave = (sess.id, len(sess._samples_bits), sess.has_gps)
+    perfil = _perfiles.get(clave)
+    if perfil is None:
+        perfil = PerfilDensidad(sess._samples_bits)
+        _perfiles[clave] = perfil
+        if len(_perfiles) > MAX_PERFILES_CACHEADOS:
+            _perfiles.popitem(last=False)
+    else:
+        _perfiles.move_to_end(clave)
+    return perfil
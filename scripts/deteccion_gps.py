@@ -0,0 +1,122 @@
+"""
+Detección de GPS real antes de construir el stream de bits.
+
+El byte 166 del header queda en True aunque el reloj no tenga GPS, así que los
+scripts forzaban el modo no-GPS y volvían a llamar a _get_samples_bits():
+el stream completo se construía dos veces por sesión y, en relojes que sí
+graban GPS, se perdían las coordenadas.
+
+Aquí se decodifica solo un prefijo corto del stream con las dos disposiciones
+(muestras desde el byte 349 con GPS, desde el 351 sin GPS) y se puntúa qué tan
+plausible es el HR resultante frente al hr_avg del header. SesionAutodetectada
+hace esa prueba dentro de su constructor, justo antes de armar el stream, de
+modo que el stream se construye una sola vez y en el modo correcto.
+"""
+
+import copy
+import warnings
+
+from polar_rcx5_datalink.parser import SampleFields
+
+from decodificador_hr import decodificar_hr
+from ensamblado import INICIO_MUESTRAS_GPS, INICIO_MUESTRAS_SIN_GPS, SesionContigua
+
+HR_MIN_VALID = 30
+HR_MAX_VALID = 250
+# Bytes del stream de muestras que se decodifican en cada prueba
+PREFIJO_BYTES = 256
+# Ventaja mínima del puntaje con GPS para creerle al header
+MARGEN_GPS = 0.1
+
+
+def bits_prefijo(ensamblada, inicio, n_bytes=PREFIJO_BYTES):
+    """Bits de los n_bytes del stream que empiezan en el byte `inicio`, sin armar el stream completo."""
+    return ensamblada.bits(inicio, inicio + n_bytes)
+
+
+def puntaje_hr(hrs, hr_avg):
+    """
+    Plausibilidad de una secuencia de HR decodificada (0 a 1): fracción de
+    valores en rango, multiplicada por la cercanía de su mediana al hr_avg del
+    header cuando este es válido.
+    """
+    if not hrs:
+        return 0.0
+    validos = sorted(hr for hr in hrs if hr is not None and HR_MIN_VALID <= hr <= HR_MAX_VALID)
+    fraccion = len(validos) / len(hrs)
+    if not validos or hr_avg is None or not HR_MIN_VALID <= hr_avg <= HR_MAX_VALID:
+        return fraccion
+    mediana = validos[len(validos) // 2]
+    return fraccion * max(0.0, 1 - abs(mediana - hr_avg) / hr_avg)
+
+
+def _hrs_con_gps(sess, bits):
+    """HR del prefijo decodificado con el parser GPS de la librería sobre una copia de la sesión."""
+    prueba = copy.copy(sess)
+    prueba.has_gps = True
+    prueba.samples = []
+    prueba.distance = prueba.max_speed = 0
+    prueba._cursor = 0
+    prueba._zero_delta_counter = {campo: 0 for campo in SampleFields}
+    prueba._prefixless_zero_sat = False
+    prueba._samples_bits = bits
+    with warnings.catch_warnings():
+        # Si en realidad no hay GPS, geopy avisa por las coordenadas absurdas
+        warnings.simplefilter('ignore')
+        try:
+            prueba.parse_samples()
+        except Exception:
+            pass
+    return [s.hr for s in prueba.samples]
+
+
+def tiene_gps(sess):
+    """
+    True si el stream de la sesión tiene la disposición con GPS. Solo prueba
+    cuando el header dice que hay GPS y hay HR para puntuar; si no, le cree al
+    header.
+    """
+    if not sess.info['has_gps'] or not sess.has_hr:
+        return bool(sess.info['has_gps'])
+    ensamblada = sess._ensamblar()
+    hr_avg = sess.info.get('hr_avg')
+    con_gps = puntaje_hr(_hrs_con_gps(sess, bits_prefijo(ensamblada, INICIO_MUESTRAS_GPS)), hr_avg)
+    sin_gps = puntaje_hr(decodificar_hr(bits_prefijo(ensamblada, INICIO_MUESTRAS_SIN_GPS))[0], hr_avg)
+    return con_gps > sin_gps + MARGEN_GPS
+
+
+def id_exportado(sess):
+    """
+    id con el que exporta la sesión parsear_sesion_completa(). Sin GPS es el
+    del header; con GPS, parse_samples() lo recalcula con la zona horaria de
+    las primeras coordenadas, así que se decodifica solo esa primera muestra
+    (sobre una copia, sin tocar la sesión).
+    """
+    if not sess.has_gps:
+        return sess.id
+    prueba = copy.copy(sess)
+    prueba._cursor = 0
+    prueba._zero_delta_counter = {campo: 0 for campo in SampleFields}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            prueba._parse_first_sample()
+        except Exception:
+            # El exportador tampoco llega a cambiarlo: queda el del header
+            pass
+    return prueba.id
+
+
+class SesionAutodetectada(SesionContigua):
+    """
+    TrainingSession que decide si hay GPS mirando el stream y no solo el
+    byte 166, antes de construir _samples_bits (una sola vez, desde el
+    buffer contiguo de ensamblado).
+    """
+
+    def _get_samples_bits(self):
+        # Se decide una vez (en el constructor); después manda has_gps
+        if not getattr(self, '_gps_decidido', False):
+            self.has_gps = tiene_gps(self)
+            self._gps_decidido = True
+        return super()._get_samples_bits()
@@ -4,11 +4,11 @@ Analiza paso a paso cómo se parsea la frecuencia cardíaca.
 """
 
 import sys
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
 
 from polar_rcx5_datalink.datalink import DataLink
 from polar_rcx5_datalink.parser import TrainingSession, HRType
 from polar_rcx5_datalink.exceptions import SyncError
+from sincronizacion import LecturaSesiones, iterar_sesiones
 
 
 def diagnosticar_parsing_hr(sess, max_muestras=20):
@@ -187,30 +187,28 @@ def main():
         print("\n[1/2] Sincronizando con el reloj...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Analizar sesiones con HR
-        print(f"\n[2/2] Buscando sesiones con HR...")
-        sesiones_con_hr = []
-        
-        for i, raw_session in enumerate(raw_sessions):
-            try:
-                sess = TrainingSession(raw_session)
+            lectura = LecturaSesiones(dl)
+            
+            # Buscar sesiones con HR, conservando solo el crudo de la última
+            print(f"\n[2/2] Buscando sesiones con HR...")
+            num_con_hr = 0
+            ultima = None
+            
+            for i, sess in enumerate(iterar_sesiones(lectura)):
                 if sess.has_hr:
-                    sesiones_con_hr.append((i, sess))
-            except:
-                pass
+                    num_con_hr += 1
+                    ultima = (i, sess.raw)
         
-        print(f"✓ Encontradas {len(sesiones_con_hr)} sesiones con HR")
+        print(f"✓ Sincronización completada: {lectura.total} sesiones encontradas")
+        print(f"✓ Encontradas {num_con_hr} sesiones con HR")
         
-        if len(sesiones_con_hr) == 0:
+        if ultima is None:
             print("\n⚠️ No hay sesiones con HR para analizar.")
             return
         
         # Diagnosticar la sesión más reciente con HR
-        idx, sess_reciente = sesiones_con_hr[-1]
+        idx, raw_reciente = ultima
+        sess_reciente = TrainingSession(raw_reciente)
         print(f"\nAnalizando sesión más reciente con HR (#{idx+1})...")
         
         diagnosticar_parsing_hr(sess_reciente, max_muestras=30)
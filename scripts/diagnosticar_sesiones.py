@@ -3,50 +3,39 @@ Script de diagnóstico para analizar sesiones y detectar problemas de parsing.
 Investiga por qué hay pocas muestras de HR y si hay datos de laps en sesiones sin GPS.
 """
 
+import argparse
+import csv
 import sys
 import json
+import time
 from datetime import datetime
 from pathlib import Path
 from collections import namedtuple
 
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
-
-import pytz
-import tzlocal
-import polar_rcx5_datalink.utils as utils
-from polar_rcx5_datalink.datalink import DataLink
-from polar_rcx5_datalink.parser import TrainingSession, HRType, SampleFields, Sample
+import distancia_gps
+from decodificador_hr import decodificar_hr
+from demonio_sesiones import ErrorDemonio, consultar
+from densidad_bits import perfil_de_sesion
+from deteccion_gps import SesionAutodetectada
+from sincronizacion import LecturaCapturas, LecturaSesiones, procesar_en_pipeline
+import zona_horaria
+from polar_rcx5_datalink.parser import HRType, SampleFields, Sample
 from polar_rcx5_datalink.exceptions import SyncError
 from polar_rcx5_datalink.utils import bcd_to_int
 
-# Parche de compatibilidad tzlocal >= 3.0
-def _datetime_to_utc_fixed(dt, timezone=None):
-    if timezone is None:
-        tz = pytz.timezone(str(tzlocal.get_localzone()))
-    else:
-        tz = pytz.timezone(timezone)
-    return tz.localize(dt, is_dst=None).astimezone(pytz.utc)
-
-utils.datetime_to_utc = _datetime_to_utc_fixed
+# tzlocal >= 3.0 rompe utils.datetime_to_utc de la librería; usamos la versión
+# compatible de zona_horaria, que además resuelve la zona una sola vez.
+zona_horaria.parchear()
 
-def _safe_calculate_distance(self, coord1, coord2):
-    try:
-        lat1, lon1 = coord1
-        lat2, lon2 = coord2
-        if (lat1 is None or lon1 is None or lat2 is None or lon2 is None
-                or abs(lat1) > 90 or abs(lon1) > 180
-                or abs(lat2) > 90 or abs(lon2) > 180):
-            return 0.0
-        import geopy.distance
-        return geopy.distance.distance(coord1, coord2).meters
-    except Exception:
-        return 0.0
-
-TrainingSession._calculate_distance = _safe_calculate_distance
+# La librería calcula la distancia con geopy muestra a muestra (lento, y lanza
+# ValueError con coordenadas fuera de rango). La diferimos y la calculamos para
+# toda la sesión con distancia_gps.aplicar_distancias(), que valida los rangos.
+distancia_gps.parchear()
 
 HR_MIN_VALID = 30
 HR_MAX_VALID = 250
 LAP_DATA_BITS = 416
+LAP_DENSITY_MAX = 0.15   # < 15% de bits en 1 → bloque de lap
 
 
 def _hr_valido(hr):
@@ -119,7 +108,7 @@ def analizar_stream_nogps(sess):
 
     # Parsear primera muestra (inicio del stream)
     if sess.has_hr:
-        hr, consumed, zero_delta_counter = parse_hr_bits(bits[cursor:], None, 0)
+        hr, consumed, zero_delta_counter = parse_hr_bits(bits[cursor:cursor + 11], None, 0)
         if hr is not None:
             cursor += consumed
             last_hr = hr
@@ -133,8 +122,9 @@ def analizar_stream_nogps(sess):
     lap_candidates = []
 
     while cursor < total_bits - 6:
+        # Un valor ocupa como mucho 11 bits: no copiar el resto del stream
         hr, consumed, zero_delta_counter = parse_hr_bits(
-            bits[cursor:], last_hr, zero_delta_counter
+            bits[cursor:cursor + 11], last_hr, zero_delta_counter
         )
 
         if hr is None or consumed == 0:
@@ -184,7 +174,7 @@ def parse_nogps_con_laps(sess):
     lap_number = 0
 
     def read_hr(pos, prev_hr, zd_ctr):
-        segment = bits[pos:]
+        segment = bits[pos:pos + 11]
         if len(segment) < 6:
             return None, 0, zd_ctr
 
@@ -267,7 +257,9 @@ def diagnosticar_sesion(i, raw_session):
     print(f"{'─'*70}")
 
     try:
-        sess = TrainingSession(raw_session)
+        # GPS según el stream, no solo el byte 166 (que queda en True aunque
+        # el reloj no tenga GPS)
+        sess = SesionAutodetectada(raw_session)
     except Exception as e:
         print(f"  ✗ No se pudo crear TrainingSession: {e}")
         return
@@ -289,23 +281,21 @@ def diagnosticar_sesion(i, raw_session):
     datos_disponibles_pct = min(100, round(sample_bits / max(1, expected * bits_ref) * 100))
 
     print(f"  Tiene HR:       {sess.has_hr}")
-    print(f"  Tiene GPS:      {sess.has_gps}")
+    print(f"  Tiene GPS:      {sess.has_gps}  (header: {bool(sess.info['has_gps'])})")
     print(f"  Bits de samples:{sample_bits}  (~{datos_disponibles_pct}% de los datos esperados)")
 
     if not sess.has_hr:
         print("  (Sin HR, nada que parsear)")
         return
 
-    # Forzar modo no-GPS (el byte 166 queda en True aunque el reloj no tenga GPS)
-    if sess.has_gps:
-        sess.has_gps = False
-        sess._samples_bits = sess._get_samples_bits()
-        sample_bits = len(sess._samples_bits)
-        print(f"  ⚠ GPS forzado a False — nuevo bits de samples: {sample_bits}")
+    if sess.info['has_gps'] and not sess.has_gps:
+        print(f"  ⚠ El header indica GPS pero el stream no lo tiene: se decodifica sin GPS")
 
     # --- Parser estándar ---
     try:
         sess.parse_samples()
+        if sess.has_gps:
+            distancia_gps.aplicar_distancias(sess)
         std_valid = sum(1 for s in sess.samples if _hr_valido(s.hr))
         std_total = len(sess.samples)
         cobertura = round(std_total / expected * 100) if expected > 0 else 0
@@ -352,6 +342,196 @@ def diagnosticar_sesion(i, raw_session):
             print(f"\n  *** El parser mejorado encontró {valid_ext - std_total} muestras más ***")
 
 
+# Columnas del reporte por lotes (mismo orden en JSONL y CSV)
+CAMPOS_REPORTE = [
+    'sesion', 'id', 'fecha', 'duracion_s', 'sample_rate', 'muestras_esperadas',
+    'tiene_hr', 'gps_header', 'gps_detectado', 'bits_muestras', 'bits_por_muestra_esperada',
+    'std_muestras', 'std_validas', 'std_invalidas', 'std_cobertura_pct',
+    'stream_validas', 'stream_invalidas', 'stream_candidatos_lap',
+    'mejorado_muestras', 'mejorado_validas', 'mejorado_cobertura_pct', 'laps_encontrados',
+    'laps_header', 'recupera_mas', 'error',
+]
+
+
+def _cobertura(muestras, esperadas):
+    return round(muestras / esperadas * 100, 1) if esperadas > 0 else 0.0
+
+
+def metricas_sesion(raw_session):
+    """
+    Mismos análisis que diagnosticar_sesion() pero sin imprimir nada: retorna
+    un dict con las columnas de CAMPOS_REPORTE (salvo 'sesion'). Pensado para
+    correr en un pool de procesos sobre todo el archivo de sesiones.
+    """
+    fila = dict.fromkeys(CAMPOS_REPORTE)
+    try:
+        sess = SesionAutodetectada(raw_session)
+    except Exception as e:
+        fila['error'] = f"TrainingSession: {e}"
+        return fila
+
+    sr = sess.info.get('sample_rate', 5)
+    expected = sess.duration // sr
+    fila.update({
+        'id':                 sess.id,
+        'fecha':              sess.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'duracion_s':         sess.duration,
+        'sample_rate':        sr,
+        'muestras_esperadas': expected,
+        'tiene_hr':           bool(sess.has_hr),
+        'gps_header':         bool(sess.info['has_gps']),
+        'gps_detectado':      bool(sess.has_gps),
+        'laps_header':        raw_session[0][161] if len(raw_session[0]) > 161 else None,
+    })
+    if not sess.has_hr:
+        return fila
+
+    if sess.has_gps:
+        # Con GPS real solo aplica el parser estándar de la librería
+        try:
+            sess.parse_samples()
+            std_validas = sum(1 for m in sess.samples if _hr_valido(m.hr))
+            fila.update({
+                'std_muestras':      len(sess.samples),
+                'std_validas':       std_validas,
+                'std_invalidas':     len(sess.samples) - std_validas,
+                'std_cobertura_pct': _cobertura(len(sess.samples), expected),
+            })
+        except Exception as e:
+            fila['error'] = f"{type(e).__name__}: {e}"
+        return fila
+
+    try:
+        # Parser estándar: decodificar_hr reproduce parse_samples() sin GPS
+        hrs, _ = decodificar_hr(sess._samples_bits)
+        std_validas = sum(1 for hr in hrs if _hr_valido(hr))
+        fila.update({
+            'std_muestras':      len(hrs),
+            'std_validas':       std_validas,
+            'std_invalidas':     len(hrs) - std_validas,
+            'std_cobertura_pct': _cobertura(len(hrs), expected),
+        })
+
+        stats = analizar_stream_nogps(sess)
+        fila.update({
+            'bits_muestras':             stats['total_bits'],
+            'bits_por_muestra_esperada': round(stats['bits_per_expected_sample'], 2),
+            'stream_validas':            stats['parsed_valid_hr'],
+            'stream_invalidas':          stats['parsed_invalid_hr'],
+            'stream_candidatos_lap':     len(stats['lap_candidates']),
+        })
+
+        samples_ext, laps_ext = parse_nogps_con_laps(sess)
+        valid_ext = sum(1 for s in samples_ext if _hr_valido(s.hr))
+        fila.update({
+            'mejorado_muestras':      len(samples_ext),
+            'mejorado_validas':       valid_ext,
+            'mejorado_cobertura_pct': _cobertura(len(samples_ext), expected),
+            'laps_encontrados':       len(laps_ext),
+            'recupera_mas':           valid_ext > std_validas,
+        })
+    except Exception as e:
+        fila['error'] = f"{type(e).__name__}: {e}"
+
+    return fila
+
+
+def escribir_reporte(filas, ruta):
+    """
+    Escribe las filas a medida que llegan: JSON Lines si la ruta termina en
+    .jsonl, CSV si termina en .csv. Retorna la lista de filas escritas.
+    """
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    escritas = []
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        if ruta.suffix.lower() == '.csv':
+            escritor = csv.DictWriter(f, fieldnames=CAMPOS_REPORTE)
+            escritor.writeheader()
+            escribir = escritor.writerow
+        else:
+            escribir = lambda fila: f.write(json.dumps(fila, ensure_ascii=False) + '\n')
+
+        for fila in filas:
+            escribir(fila)
+            escritas.append(fila)
+    return escritas
+
+
+def resumir_reporte(filas):
+    """Resumen del reporte: totales y sesiones donde el parser mejorado recupera más."""
+    con_hr = [f for f in filas if f['tiene_hr'] and not f['error']]
+    # El parser mejorado y la búsqueda de laps solo corren en sesiones sin GPS
+    sin_gps = [f for f in con_hr if not f['gps_detectado']]
+    errores = [f for f in filas if f['error']]
+    mejoran = [f for f in sin_gps if f['recupera_mas']]
+
+    print(f"\n{'='*70}")
+    print("RESUMEN DEL REPORTE")
+    print(f"{'='*70}")
+    print(f"  Sesiones:            {len(filas)}")
+    print(f"  Con HR analizadas:   {len(con_hr)}")
+    print(f"  Con error:           {len(errores)}")
+    print(f"  Con GPS:             {len(con_hr) - len(sin_gps)} (solo parser estándar)")
+    if con_hr:
+        std = sum(f['std_cobertura_pct'] for f in con_hr) / len(con_hr)
+        print(f"  Cobertura media:     estándar {std:.1f}%", end='')
+        if sin_gps:
+            ext = sum(f['mejorado_cobertura_pct'] for f in sin_gps) / len(sin_gps)
+            print(f"  |  mejorado {ext:.1f}% (sin GPS)", end='')
+        print()
+        print(f"  Laps encontrados:    {sum(f['laps_encontrados'] for f in sin_gps)}")
+
+    print(f"\n  El parser mejorado recupera más muestras válidas en {len(mejoran)} sesiones:")
+    for f in mejoran:
+        print(f"    #{f['sesion']:>3}  {f['id']}  {f['std_validas']} → {f['mejorado_validas']} "
+              f"(+{f['mejorado_validas'] - f['std_validas']})  laps: {f['laps_encontrados']}")
+    for f in errores:
+        print(f"  ✗ #{f['sesion']} {f['id'] or ''}: {f['error']}")
+
+
+def reporte_por_lotes(fuente, ruta, workers=None):
+    """
+    Corre metricas_sesion() sobre todas las sesiones de la fuente en un pool
+    de procesos y escribe el reporte estructurado en `ruta`.
+    """
+    inicio = time.perf_counter()
+
+    def numeradas():
+        for i, fila in enumerate(procesar_en_pipeline(fuente, metricas_sesion, workers), 1):
+            fila['sesion'] = i
+            yield fila
+
+    filas = escribir_reporte(numeradas(), ruta)
+    resumir_reporte(filas)
+    print(f"\n✓ Reporte guardado en {ruta} ({len(filas)} sesiones, "
+          f"{time.perf_counter() - inicio:.1f}s)")
+    return filas
+
+
+def mostrar_zonas(perfil, ventana, paso, densidad_min, densidad_max):
+    """Muestra las zonas del stream con densidad de unos fuera de [min, max]."""
+    print(f"\n[4] Zonas con densidad de bits anómala (<{densidad_min:.0%} o >{densidad_max:.0%} de unos, "
+          f"ventana {ventana} bits) — posibles marcadores de lap:")
+    grupos = perfil.zonas(ventana, densidad_min, densidad_max, paso)
+    if grupos:
+        print(f"    Grupos detectados: {len(grupos)}")
+        for g in grupos[:20]:
+            long = g['fin'] - g['inicio']
+            print(f"    bits {g['inicio']:6d}–{g['fin']:6d}  ({long:4d} bits)  densidad={g['densidad']:.0%}")
+    else:
+        print("    No se encontraron zonas anómalas.")
+
+
+def mostrar_candidatos_lap(perfil, ventana, densidad_max):
+    """Muestra dónde empiezan las rachas de ventanas con densidad < densidad_max."""
+    candidatos = perfil.candidatos_lap(ventana, densidad_max)
+    print(f"\n    Candidatos a bloque de lap (ventana {ventana} bits, densidad < {densidad_max:.0%}): "
+          f"{len(candidatos)}")
+    for offset, largo in candidatos[:20]:
+        print(f"    bit {offset:6d}  (racha de {largo} offsets)")
+
+
 def investigar_laps(raw_session, num_laps_conocidos):
     """
     Analiza en profundidad el binario de una sesión para identificar el formato
@@ -381,10 +561,11 @@ def investigar_laps(raw_session, num_laps_conocidos):
         print(f"    [{i:3d}] = {first_packet[i]:3d}  (0x{first_packet[i]:02X}){marca}")
 
     # --- 2. Analizar el stream de bits ---
-    sess = TrainingSession(raw_session)
+    sess = SesionAutodetectada(raw_session)
     if sess.has_gps:
-        sess.has_gps = False
-        sess._samples_bits = sess._get_samples_bits()
+        print(f"\n[3] La sesión tiene GPS real: los laps van dentro de las muestras GPS y el")
+        print(f"    parser de la librería ya los salta. Este análisis es para el stream sin GPS.")
+        return
 
     bits = sess._samples_bits
     total_bits = len(bits)
@@ -395,38 +576,11 @@ def investigar_laps(raw_session, num_laps_conocidos):
 
     # Buscar secuencias de bytes con bajo contenido de información (posibles separadores)
     # Un bloque de lap en no-GPS podría contener datos estructurados vs. HR delta
-    # Buscamos ventanas donde la densidad de bits 1 es atípica (>70% o <30%)
-    window = 48  # 6 bytes
-    anomalias = []
-    for pos in range(0, total_bits - window, 8):
-        chunk = bits[pos:pos+window]
-        ones = chunk.count('1')
-        ratio = ones / window
-        if ratio < 0.20 or ratio > 0.80:
-            anomalias.append((pos, ratio, chunk))
-
-    print(f"\n[4] Zonas con densidad de bits anómala (<20% o >80% de unos) — posibles marcadores de lap:")
-    if anomalias:
-        # Agrupar anomalías contiguas
-        grupos = []
-        grupo_actual = [anomalias[0]]
-        for a in anomalias[1:]:
-            if a[0] - grupo_actual[-1][0] <= window:
-                grupo_actual.append(a)
-            else:
-                grupos.append(grupo_actual)
-                grupo_actual = [a]
-        grupos.append(grupo_actual)
-
-        print(f"    Grupos detectados: {len(grupos)}")
-        for g in grupos[:20]:
-            inicio = g[0][0]
-            fin = g[-1][0] + window
-            long = fin - inicio
-            ratio_prom = sum(x[1] for x in g) / len(g)
-            print(f"    bits {inicio:6d}–{fin:6d}  ({long:4d} bits)  densidad={ratio_prom:.0%}")
-    else:
-        print("    No se encontraron zonas anómalas.")
+    # Buscamos ventanas donde la densidad de bits 1 es atípica (<20% o >80%).
+    # El perfil de densidad se calcula una sola vez y queda cacheado por sesión.
+    perfil = perfil_de_sesion(sess)
+    mostrar_zonas(perfil, ventana=48, paso=8, densidad_min=0.20, densidad_max=0.80)
+    mostrar_candidatos_lap(perfil, LAP_DATA_BITS, LAP_DENSITY_MAX)
 
     # --- 3. Mostrar los primeros bytes del stream en hex para inspección manual ---
     print(f"\n[5] Primeros 64 bytes del stream de samples (hex):")
@@ -446,8 +600,74 @@ def investigar_laps(raw_session, num_laps_conocidos):
         hex_end.append(f"{byte_val:02X}")
     print("    " + " ".join(hex_end[:32]))
 
+    # --- 4. Probar otros umbrales sin volver a recorrer el stream ---
+    while True:
+        resp = input("\nOtra consulta [ventana umbral_bajo umbral_alto], ENTER para terminar: ").strip()
+        if not resp:
+            break
+        try:
+            ventana, bajo, alto = resp.split()
+            ventana, bajo, alto = int(ventana), float(bajo), float(alto)
+        except ValueError:
+            print("    Formato: 416 0.15 0.85")
+            continue
+        if not 0 < ventana <= perfil.total_bits:
+            print(f"    La ventana tiene que estar entre 1 y {perfil.total_bits} bits")
+            continue
+        mostrar_zonas(perfil, ventana=ventana, paso=8, densidad_min=bajo, densidad_max=alto)
+        mostrar_candidatos_lap(perfil, ventana, bajo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diagnóstico de sesiones del Polar RCX5.')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument(
+        '--reporte', metavar='RUTA',
+        help='Modo por lotes: analiza todas las sesiones en paralelo y escribe '
+             'un reporte .jsonl o .csv (sin salida por sesión)',
+    )
+    parser.add_argument(
+        '--capturas', metavar='DIR',
+        help='Leer sesiones crudas de un directorio (un JSON por sesión) en lugar del reloj',
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='Procesos para el modo por lotes (por defecto, uno por CPU)',
+    )
+    parser.add_argument(
+        '--demonio', action='store_true',
+        help='Modo por lotes: pedir las métricas a demonio_sesiones.py en lugar de sincronizar',
+    )
+    args = parser.parse_args(argv)
+    zona_horaria.instalar(args.timezone)
+
+    if args.reporte:
+        try:
+            if args.demonio:
+                filas = escribir_reporte(consultar('diagnosticar'), args.reporte)
+                resumir_reporte(filas)
+                print(f"\n✓ Reporte guardado en {args.reporte} ({len(filas)} sesiones)")
+            elif args.capturas:
+                reporte_por_lotes(LecturaCapturas(args.capturas), args.reporte, args.workers)
+            else:
+                # El stack USB solo se carga al sincronizar (no con --demonio ni --capturas)
+                from polar_rcx5_datalink.datalink import DataLink
+
+                input("Presiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
+                with DataLink() as dl:
+                    dl.synchronize()
+                    reporte_por_lotes(LecturaSesiones(dl), args.reporte, args.workers)
+        except SyncError as e:
+            print(f"\n✗ Error de sincronización: {e}")
+            sys.exit(1)
+        except ErrorDemonio as e:
+            print(f"\n✗ Error del demonio: {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print("\nCancelado.")
+            sys.exit(0)
+        return
 
-def main():
     print("="*70)
     print("DIAGNÓSTICO DE SESIONES - Polar RCX5")
     print("="*70)
@@ -459,27 +679,35 @@ def main():
     input("\nPresiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
 
     try:
+        from polar_rcx5_datalink.datalink import DataLink
+
         print("\nSincronizando...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-
-        print(f"✓ {len(raw_sessions)} sesiones encontradas")
-
-        if modo == '2':
-            if not raw_sessions:
-                print("No hay sesiones.")
+            lectura = LecturaSesiones(dl)
+
+            if modo == '2':
+                # Solo se conserva la última sesión recibida
+                ultima = None
+                for raw in lectura:
+                    ultima = raw
+                print(f"✓ {lectura.total} sesiones encontradas")
+
+                if ultima is None:
+                    print("No hay sesiones.")
+                else:
+                    resp = input(f"\n¿Cuántos laps registraste en la última sesión? ").strip()
+                    try:
+                        n = int(resp)
+                    except ValueError:
+                        n = 1
+                    investigar_laps(ultima, n)
             else:
-                ultima = raw_sessions[-1]
-                resp = input(f"\n¿Cuántos laps registraste en la última sesión? ").strip()
-                try:
-                    n = int(resp)
-                except ValueError:
-                    n = 1
-                investigar_laps(ultima, n)
-        else:
-            for i, raw in enumerate(raw_sessions, 1):
-                diagnosticar_sesion(i, raw)
+                # Cada sesión se diagnostica apenas llega y se descarta
+                for i, raw in enumerate(lectura, 1):
+                    diagnosticar_sesion(i, raw)
+                    del raw
+                print(f"\n✓ {lectura.total} sesiones encontradas")
 
         print(f"\n{'='*70}")
         print("Diagnóstico completado.")
@@ -6,12 +6,11 @@ import sys
 import traceback
 from pathlib import Path
 
-# Agregar el path de la librería instalada
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
-
 from polar_rcx5_datalink.datalink import DataLink
-from polar_rcx5_datalink.parser import TrainingSession
 from polar_rcx5_datalink.exceptions import ParserError, SyncError
+from ensamblado import SesionContigua
+from sincronizacion import LecturaSesiones
+from zona_horaria import ids_de_sesiones
 
 
 def analizar_sesion(raw_session, session_id):
@@ -21,8 +20,9 @@ def analizar_sesion(raw_session, session_id):
     print(f"{'='*80}")
     
     try:
-        # Crear objeto TrainingSession
-        sess = TrainingSession(raw_session)
+        # Crear objeto TrainingSession (stream armado desde el buffer contiguo)
+        sess = SesionContigua(raw_session)
+        ensamblada = sess.ensamblada
         
         print(f"✓ Sesión creada exitosamente")
         print(f"  - Fecha inicio: {sess.start_time}")
@@ -38,9 +38,11 @@ def analizar_sesion(raw_session, session_id):
         # Analizar estructura de paquetes
         print(f"\n  Estructura de paquetes:")
         for i, packet in enumerate(sess.raw):
-            print(f"    Paquete {i+1}: {len(packet)} bytes")
+            print(f"    Paquete {i+1}: {len(packet)} bytes  (payload desde el byte {ensamblada.offsets[i]} del stream)")
             if i == 0:
                 print(f"      Primeros 20 bytes: {packet[:20]}")
+        muestras = ensamblada.muestras(sess.has_gps)
+        print(f"  Stream reensamblado: {len(ensamblada)} bytes  |  zona de muestras: {len(muestras)} bytes")
         
         # Intentar obtener bits de muestras
         print(f"\n  Intentando obtener bits de muestras...")
@@ -114,33 +116,30 @@ def main():
         print("\n[1/2] Sincronizando con el reloj...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Analizar cada sesión
-        print(f"\n[2/2] Analizando sesiones...")
-        sesiones_problematicas = []
-        sesiones_exitosas = []
-        
-        for raw_session in raw_sessions:
-            # Crear sesión temporal para obtener el ID
-            try:
-                sess_temp = TrainingSession(raw_session)
-                session_id = sess_temp.id
-            except:
-                session_id = "DESCONOCIDA"
+            lectura = LecturaSesiones(dl)
             
-            if analizar_sesion(raw_session, session_id):
-                sesiones_exitosas.append(session_id)
-            else:
-                sesiones_problematicas.append(session_id)
+            # Analizar cada sesión apenas llega; el crudo se descarta después
+            print(f"\n[2/2] Analizando sesiones...")
+            sesiones_problematicas = []
+            sesiones_exitosas = []
+            
+            for raw_session in lectura:
+                # Leer el ID directo del header, sin construir otra sesión
+                session_id = ids_de_sesiones([raw_session])[0] or "DESCONOCIDA"
+                
+                if analizar_sesion(raw_session, session_id):
+                    sesiones_exitosas.append(session_id)
+                else:
+                    sesiones_problematicas.append(session_id)
+                del raw_session
+        
+        print(f"\n✓ Sincronización completada: {lectura.total} sesiones encontradas")
         
         # Resumen
         print(f"\n{'='*80}")
         print("RESUMEN")
         print(f"{'='*80}")
-        print(f"Total de sesiones: {len(raw_sessions)}")
+        print(f"Total de sesiones: {lectura.total}")
         print(f"✓ Sesiones exitosas: {len(sesiones_exitosas)}")
         print(f"✗ Sesiones problemáticas: {len(sesiones_problematicas)}")
         
@@ -0,0 +1,170 @@
+"""
+Cálculo vectorizado de distancias GPS para una sesión completa.
+
+La librería calcula la distancia con geopy muestra a muestra dentro de
+parse_samples(), lo que domina el tiempo de parseo en sesiones con GPS.
+Aquí se calculan todas las distancias entre muestras consecutivas en una sola
+pasada de NumPy sobre los arrays de lat/lon de la sesión:
+
+- modo 'haversine': esfera de radio medio (rápido, error < 0.5%).
+- modo 'vincenty':  elipsoide WGS-84 (precisión de geopy, iterativo vectorizado).
+
+Los segmentos con algún extremo fuera de rango (|lat| > 90, |lon| > 180) o sin
+coordenadas valen 0, igual que el parche _safe_calculate_distance de los scripts.
+"""
+
+import numpy as np
+
+# Radio medio de la Tierra en metros (mismo valor que usa geopy.great_circle)
+RADIO_TIERRA = 6371008.8
+
+# Elipsoide WGS-84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+VINCENTY_MAX_ITER = 200
+VINCENTY_TOLERANCIA = 1e-12
+
+MODOS = ('haversine', 'vincenty')
+
+
+def _como_array(valores):
+    """Convierte una secuencia (con posibles None) en array float con NaN."""
+    return np.asarray(valores, dtype=float)
+
+
+def mascara_coordenadas(lat, lon):
+    """True para cada muestra con coordenadas presentes y dentro de rango."""
+    lat = _como_array(lat)
+    lon = _como_array(lon)
+    with np.errstate(invalid='ignore'):
+        return (np.isfinite(lat) & np.isfinite(lon)
+                & (np.abs(lat) <= 90) & (np.abs(lon) <= 180))
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _vincenty(lat1, lon1, lat2, lon2):
+    """Fórmula inversa de Vincenty vectorizada sobre WGS-84.
+
+    Los pares que no convergen (puntos casi antipodales) usan haversine.
+    """
+    f = WGS84_F
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    convergido = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_MAX_ITER):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam,
+                                 cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0,
+                                 cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Líneas ecuatoriales: cos2_alpha == 0
+            cos_2sm = np.where(cos2_alpha == 0, 0.0,
+                               cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+            convergido = np.abs(lam - lam_prev) < VINCENTY_TOLERANCIA
+            if convergido.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sm ** 2)
+            - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+        metros = WGS84_B * A * (sigma - delta_sigma)
+
+    if not convergido.all():
+        metros = np.where(convergido, metros, _haversine(lat1, lon1, lat2, lon2))
+    return metros
+
+
+def distancias_segmentos(lat, lon, modo='haversine'):
+    """
+    Distancia en metros entre cada par de muestras consecutivas.
+
+    Retorna un array de len(lat) - 1 elementos. Los segmentos con algún extremo
+    inválido valen 0.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de distancia desconocido: {modo!r} (usar {MODOS})")
+
+    lat = _como_array(lat)
+    lon = _como_array(lon)
+    if lat.size < 2:
+        return np.zeros(0)
+
+    validas = mascara_coordenadas(lat, lon)
+    seg_validos = validas[:-1] & validas[1:]
+
+    # Reemplazamos los inválidos por 0 para no propagar NaN en el cálculo
+    lat = np.where(validas, lat, 0.0)
+    lon = np.where(validas, lon, 0.0)
+    calcular = _haversine if modo == 'haversine' else _vincenty
+    metros = calcular(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+    return np.where(seg_validos & np.isfinite(metros), metros, 0.0)
+
+
+def distancia_acumulada(lat, lon, modo='haversine'):
+    """Distancia acumulada en metros para cada muestra (la primera vale 0)."""
+    segmentos = distancias_segmentos(lat, lon, modo)
+    return np.concatenate(([0.0], np.cumsum(segmentos)))
+
+
+def _distancia_diferida(self, coord1, coord2):
+    """Reemplazo de TrainingSession._calculate_distance durante parse_samples().
+
+    La distancia real se calcula después, para toda la sesión, con
+    aplicar_distancias().
+    """
+    return 0.0
+
+
+def parchear():
+    """Evita el cálculo con geopy muestra a muestra dentro de la librería."""
+    from polar_rcx5_datalink.parser import TrainingSession
+    TrainingSession._calculate_distance = _distancia_diferida
+
+
+def aplicar_distancias(sess, modo='haversine'):
+    """
+    Completa distance/speed de las muestras y sess.distance / sess.max_speed
+    de una sesión ya parseada con GPS. Retorna el array de distancia acumulada.
+    """
+    if len(sess.samples) == 0:
+        return np.zeros(0)
+
+    lat = [s.lat for s in sess.samples]
+    lon = [s.lon for s in sess.samples]
+    segmentos = distancias_segmentos(lat, lon, modo)
+    sample_rate = sess.info.get('sample_rate', 5)
+    velocidades = segmentos / sample_rate
+
+    sess.distance = float(segmentos.sum())
+    sess.max_speed = float(velocidades.max()) if velocidades.size else 0
+    sess.samples = [sess.samples[0]] + [
+        s._replace(distance=float(d), speed=float(v))
+        for s, d, v in zip(sess.samples[1:], segmentos, velocidades)
+    ]
+
+    return np.concatenate(([0.0], np.cumsum(segmentos)))
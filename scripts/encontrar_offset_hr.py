@@ -3,12 +3,167 @@ Script para encontrar el offset correcto del HR inicial cuando hay GPS.
 Prueba diferentes valores hasta encontrar uno que dé un HR razonable.
 """
 
+import argparse
+import math
+import os
 import sys
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytz
 
-from polar_rcx5_datalink.datalink import DataLink
 from polar_rcx5_datalink.parser import TrainingSession, HRType
-from polar_rcx5_datalink.exceptions import SyncError
+from polar_rcx5_datalink.exceptions import ParserError, SyncError
+import distancia_gps
+from sincronizacion import LecturaSesiones
+import zona_horaria
+
+zona_horaria.parchear()
+distancia_gps.parchear()
+
+# Offset que usa la librería en _parse_first_sample() cuando hay GPS
+OFFSET_LIBRERIA = 22
+# Muestras decodificadas por sesión y offset para puntuar
+MUESTRAS_PREFIJO = 40
+# Bits por muestra GPS (holgado) para recortar el stream al prefijo
+BITS_POR_MUESTRA_GPS = 160
+# Tolerancia (bpm) al comparar contra hr_min/hr_max del header
+TOLERANCIA_RANGO = 5
+# Escala (bpm) del decaimiento exponencial de la diferencia con hr_avg
+ESCALA_ERROR_AVG = 15
+# Lo que lanza el constructor de TrainingSession con un header corrupto: índices
+# fuera del paquete, BCD o fecha inválidos, o una hora local inexistente
+ERRORES_HEADER = (IndexError, ValueError, TypeError, KeyError, pytz.exceptions.InvalidTimeError)
+
+
+class _SesionCalibracion(TrainingSession):
+    """TrainingSession que decodifica solo un prefijo empezando en otro offset.
+
+    _parse_first_sample() siempre posiciona el cursor en 22 cuando hay GPS;
+    desplazamos el stream para que ese cursor caiga en el offset a probar.
+    """
+
+    def preparar(self, bits, offset, muestras):
+        if offset >= OFFSET_LIBRERIA:
+            bits = bits[offset - OFFSET_LIBRERIA:]
+        else:
+            bits = '0' * (OFFSET_LIBRERIA - offset) + bits
+        self._samples_bits = bits[:OFFSET_LIBRERIA + muestras * BITS_POR_MUESTRA_GPS]
+        self._cursor = 0
+        self._zero_delta_counter = {field: 0 for field in self._zero_delta_counter}
+        self._prefixless_zero_sat = False
+        self.samples = []
+
+
+def puntuar_hr(hrs, hr_avg, hr_min, hr_max, muestras):
+    """
+    Puntaje (0..1) de qué tan plausible es una secuencia de HR decodificada
+    comparada con las estadísticas del header.
+    """
+    validos = [h for h in hrs[:muestras] if h is not None and 30 <= h <= 250]
+    if not validos or not hr_avg:
+        return 0.0
+
+    frac_validos = len(validos) / muestras
+    bajo = (hr_min or 30) - TOLERANCIA_RANGO
+    alto = (hr_max or 250) + TOLERANCIA_RANGO
+    frac_en_rango = sum(1 for h in validos if bajo <= h <= alto) / len(validos)
+    error_avg = abs(sum(validos) / len(validos) - hr_avg)
+
+    return frac_validos * frac_en_rango * math.exp(-error_avg / ESCALA_ERROR_AVG)
+
+
+def evaluar_sesion(raw_session, offsets, muestras=MUESTRAS_PREFIJO):
+    """
+    Puntúa cada offset candidato en una sesión (se ejecuta en un worker).
+
+    Retorna (id de sesión, lista de puntajes en el orden de `offsets`), o
+    (None, None) si el header de la sesión no se puede parsear.
+    """
+    try:
+        sess = _SesionCalibracion(raw_session)
+        id_sesion = sess.id
+    except ERRORES_HEADER:
+        return None, None
+    bits = sess._samples_bits
+    info = sess.info
+    puntajes = []
+
+    for offset in offsets:
+        sess.preparar(bits, offset, muestras)
+        try:
+            sess.parse_samples()
+        except ParserError:
+            # El prefijo recortado termina a mitad de muestra: nos quedamos
+            # con las muestras ya decodificadas
+            pass
+        hrs = [s.hr for s in sess.samples]
+        puntajes.append(puntuar_hr(hrs, info.get('hr_avg'), info.get('hr_min'),
+                                   info.get('hr_max'), muestras))
+
+    return id_sesion, puntajes
+
+
+def calibrar_offsets(raw_sessions, offsets=range(0, 100), muestras=MUESTRAS_PREFIJO, workers=None):
+    """
+    Evalúa todos los offsets candidatos contra todas las sesiones con HR y GPS,
+    repartiendo las sesiones en un pool de procesos.
+
+    Retorna (tabla, omitidas): la tabla es una lista de dicts ordenada de
+    mejor a peor offset con puntaje medio, sesiones donde fue el mejor y
+    confianza (0..1); omitidas es la cantidad de sesiones que no se pudieron
+    parsear.
+    """
+    offsets = list(offsets)
+    if not raw_sessions:
+        return [], 0
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        resultados = list(pool.map(
+            evaluar_sesion, raw_sessions,
+            [offsets] * len(raw_sessions), [muestras] * len(raw_sessions),
+        ))
+
+    puntajes = [p for _, p in resultados if p is not None]
+    omitidas = len(resultados) - len(puntajes)
+    if not puntajes:
+        return [], omitidas
+
+    matriz = np.array(puntajes)                             # sesiones x offsets
+    medias = matriz.mean(axis=0)
+    con_senal = matriz.max(axis=1) > 0
+    mejores = np.bincount(matriz[con_senal].argmax(axis=1), minlength=len(offsets))
+    n_sesiones = max(1, int(con_senal.sum()))
+
+    orden = np.argsort(-medias, kind='stable')
+    segunda = medias[orden[1]] if len(orden) > 1 else 0.0
+
+    tabla = []
+    for rank, i in enumerate(orden, 1):
+        votos = mejores[i] / n_sesiones
+        margen = (medias[i] - segunda) / medias[i] if rank == 1 and medias[i] > 0 else 0.0
+        tabla.append({
+            'rank':           rank,
+            'offset':         offsets[i],
+            'puntaje':        round(float(medias[i]), 4),
+            'sesiones_mejor': int(mejores[i]),
+            # Confianza: fracción de sesiones que lo eligen, reforzada por la
+            # distancia al segundo mejor (solo aplica al primero)
+            'confianza':      round(float(votos if rank > 1 else (votos + margen) / 2), 3),
+        })
+
+    return tabla, omitidas
+
+
+def mostrar_tabla(tabla, n_sesiones, top=10):
+    print(f"\n" + "="*80)
+    print(f"RANKING DE OFFSETS ({n_sesiones} sesiones con HR y GPS)")
+    print("="*80)
+    print(f"{'#':>3}  {'Offset':>6}  {'Puntaje':>8}  {'Mejor en':>9}  {'Confianza':>9}")
+    for fila in tabla[:top]:
+        print(f"{fila['rank']:>3}  {fila['offset']:>6}  {fila['puntaje']:>8.4f}  "
+              f"{fila['sesiones_mejor']:>9}  {fila['confianza']:>9.0%}")
 
 
 def probar_offsets(sess, offsets_a_probar=range(0, 100, 1)):
@@ -87,12 +242,28 @@ def probar_offsets(sess, offsets_a_probar=range(0, 100, 1)):
     return mejor['offset']
 
 
-def main():
+def main(argv=None):
+    # El stack USB solo se carga al sincronizar (no en los workers del pool)
+    from polar_rcx5_datalink.datalink import DataLink
+
+    parser = argparse.ArgumentParser(description='Calibra el offset del HR inicial en sesiones con GPS.')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos en paralelo (por defecto, uno por CPU)')
+    parser.add_argument('--muestras', type=int, default=MUESTRAS_PREFIJO,
+                        help='Muestras a decodificar por sesión y offset')
+    parser.add_argument('--offset-max', type=int, default=100,
+                        help='Se prueban los offsets 0..N-1')
+    parser.add_argument('--detalle', action='store_true',
+                        help='Mostrar además la prueba detallada de la sesión más reciente')
+    args = parser.parse_args(argv)
+    zona_horaria.instalar(args.timezone)
+
     print("="*80)
     print("ENCONTRAR OFFSET CORRECTO DE HR - Polar RCX5")
     print("="*80)
-    print("\nEste script prueba diferentes offsets iniciales para encontrar")
-    print("desde dónde se debe empezar a leer el HR cuando hay GPS.\n")
+    print("\nEste script prueba diferentes offsets iniciales en todas las sesiones")
+    print("con HR y GPS para encontrar desde dónde se debe empezar a leer el HR.\n")
     
     input("Presiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
     
@@ -101,21 +272,17 @@ def main():
         print("\n[1/2] Sincronizando con el reloj...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Buscar sesiones con HR y GPS
-        print(f"\n[2/2] Buscando sesiones con HR y GPS...")
-        sesiones_con_hr_gps = []
+            lectura = LecturaSesiones(dl)
+            
+            # Quedarse solo con las sesiones con HR y GPS (bytes 165/166 del
+            # header, sin parsear); el resto se descarta a medida que llega
+            sesiones_con_hr_gps = [
+                raw for raw in lectura
+                if len(raw) > 0 and len(raw[0]) > 166 and raw[0][165] and raw[0][166]
+            ]
         
-        for i, raw_session in enumerate(raw_sessions):
-            try:
-                sess = TrainingSession(raw_session)
-                if sess.has_hr and sess.has_gps:
-                    sesiones_con_hr_gps.append((i, sess))
-            except:
-                pass
+        print(f"✓ Sincronización completada: {lectura.total} sesiones encontradas")
+        print(f"\n[2/2] Calibrando offsets en sesiones con HR y GPS...")
         
         print(f"✓ Encontradas {len(sesiones_con_hr_gps)} sesiones con HR y GPS")
         
@@ -123,18 +290,28 @@ def main():
             print("\n⚠️ No hay sesiones con HR y GPS para analizar.")
             return
         
-        # Analizar la sesión más reciente
-        idx, sess_reciente = sesiones_con_hr_gps[-1]
-        print(f"\nAnalizando sesión más reciente con HR y GPS (#{idx+1})...")
-        print(f"Fecha: {sess_reciente.start_time}")
-        
-        mejor_offset = probar_offsets(sess_reciente, range(0, 100))
-        
-        if mejor_offset is not None:
+        tabla, omitidas = calibrar_offsets(sesiones_con_hr_gps, range(0, args.offset_max),
+                                           args.muestras, args.workers)
+        if omitidas:
+            print(f"⚠️ {omitidas} sesiones omitidas: su header no se pudo parsear")
+        mostrar_tabla(tabla, len(sesiones_con_hr_gps) - omitidas)
+
+        if args.detalle:
+            sess_reciente = TrainingSession(sesiones_con_hr_gps[-1])
+            print(f"\nDetalle de la sesión más reciente ({sess_reciente.start_time}):")
+            probar_offsets(sess_reciente, range(0, args.offset_max))
+
+        mejor = tabla[0] if tabla and tabla[0]['puntaje'] > 0 else None
+        if mejor is None:
+            print("\n⚠️ Ningún offset produjo valores de HR plausibles.")
+        else:
+            mejor_offset = mejor['offset']
             print(f"\n" + "="*80)
             print("SOLUCIÓN")
             print("="*80)
-            print(f"\nEl offset correcto parece ser: {mejor_offset}")
+            print(f"\nEl offset correcto parece ser: {mejor_offset} "
+                  f"(confianza {mejor['confianza']:.0%}, mejor en "
+                  f"{mejor['sesiones_mejor']}/{len(sesiones_con_hr_gps)} sesiones)")
             print(f"\nEn lugar de usar offset 22 (valor actual), deberías usar {mejor_offset}.")
             print(f"\nPara corregir el parser, modifica la línea en _parse_first_sample():")
             print(f"  Antes: self._cursor = 22")
@@ -0,0 +1,103 @@
+"""
+Reensamblado de los paquetes de una sesión en un único buffer contiguo.
+
+TrainingSession.tobin() une los paquetes formateando cada byte como un string
+de 8 caracteres ('0'/'1') y concatenando. Aquí los payloads se copian una sola
+vez a un bytearray preasignado (sin el header de 7 bytes de cada paquete ni
+los 59 bytes finales de relleno) y los consumidores reciben memoryviews del
+header y de la zona de muestras, sin copias. Cuando un decodificador necesita
+el stream de bits, se genera de una vez para todo el rango con int.from_bytes
+en lugar de byte por byte.
+
+El contenido es exactamente el de tobin(), incluida su forma de recortar los
+ceros finales del último paquete.
+"""
+
+from polar_rcx5_datalink.parser import TrainingSession
+
+LARGO_HEADER_PAQUETE = TrainingSession._PACKET_HEADER_LENGTH  # 7
+RELLENO_FINAL_PAQUETE = 59
+# Byte donde empiezan las muestras según la disposición del stream
+INICIO_MUESTRAS_GPS = 349
+INICIO_MUESTRAS_SIN_GPS = 351
+
+
+def _vista(paquete):
+    """memoryview del paquete; las listas de enteros (JSON) se convierten una vez a bytes."""
+    try:
+        return memoryview(paquete).cast('B')
+    except TypeError:
+        return memoryview(bytes(paquete))
+
+
+def _rango_payload(paquete, indice, ultimo):
+    """(inicio, fin) de los bytes del paquete que van al stream, como en tobin()."""
+    inicio = 0 if indice == 0 else LARGO_HEADER_PAQUETE
+    if not ultimo:
+        # Un paquete intermedio más corto que el relleno no aporta bytes
+        return inicio, max(inicio, len(paquete) - RELLENO_FINAL_PAQUETE)
+    # utils.pop_zeroes: quita los ceros finales... y, si el último byte no es
+    # cero, el paquete entero (items[:-0]). Se replica para dar el mismo stream.
+    fin = len(paquete)
+    while fin > inicio and paquete[fin - 1] == 0:
+        fin -= 1
+    return inicio, (inicio if fin == len(paquete) else fin)
+
+
+class SesionEnsamblada(object):
+    """Payload de todos los paquetes de una sesión en un bytearray."""
+
+    def __init__(self, raw_session):
+        vistas = [_vista(p) for p in raw_session]
+        rangos = [_rango_payload(v, i, i == len(vistas) - 1) for i, v in enumerate(vistas)]
+
+        self.buffer = bytearray(sum(max(0, fin - inicio) for inicio, fin in rangos))
+        destino = memoryview(self.buffer)
+        # Offset de cada paquete dentro del buffer (útil para diagnósticos)
+        self.offsets = []
+        pos = 0
+        for vista, (inicio, fin) in zip(vistas, rangos):
+            self.offsets.append(pos)
+            largo = max(0, fin - inicio)
+            destino[pos:pos + largo] = vista[inicio:fin]
+            pos += largo
+        self._vista = destino
+
+    def __len__(self):
+        return len(self.buffer)
+
+    @property
+    def header(self):
+        """Bytes anteriores a las muestras (incluye el header del primer paquete)."""
+        return self._vista[:INICIO_MUESTRAS_GPS]
+
+    def muestras(self, con_gps):
+        """memoryview de la zona de muestras según la disposición."""
+        return self._vista[INICIO_MUESTRAS_GPS if con_gps else INICIO_MUESTRAS_SIN_GPS:]
+
+    def bits(self, inicio=0, fin=None):
+        """Stream de bits ('0'/'1') de los bytes [inicio, fin), generado de una vez."""
+        tramo = self._vista[inicio:fin]
+        if not len(tramo):
+            return ''
+        return format(int.from_bytes(tramo, 'big'), f'0{len(tramo) * 8}b')
+
+
+class SesionContigua(TrainingSession):
+    """
+    TrainingSession que arma su stream desde un SesionEnsamblada en lugar de
+    formatear byte por byte. `ensamblada` queda disponible para leer el header
+    o las muestras como bytes.
+    """
+
+    def _ensamblar(self):
+        if getattr(self, 'ensamblada', None) is None:
+            self.ensamblada = SesionEnsamblada(self.raw)
+        return self.ensamblada
+
+    def tobin(self):
+        return self._ensamblar().bits()
+
+    def _get_samples_bits(self):
+        inicio = INICIO_MUESTRAS_GPS if self.has_gps else INICIO_MUESTRAS_SIN_GPS
+        return self._ensamblar().bits(inicio)
@@ -0,0 +1,99 @@
+"""
+Estadísticas por lap calculadas con reducciones segmentadas de NumPy.
+
+Los cortes de lap (time_seconds de detectar_laps_nogps) se pasan a índices de
+muestra de la serie de HR limpia (limpieza_hr). Con esos índices, una sola
+llamada a np.add.reduceat / np.maximum.reduceat / np.minimum.reduceat calcula
+los valores de todos los laps a la vez, sin recorrer cada lap en Python, así
+que una sesión de intervalos con 50+ laps cuesta lo mismo que una con 2.
+
+Cada fila de la tabla describe un tramo: del inicio al primer lap, entre laps
+consecutivos y del último lap al final de la sesión. La deriva es la diferencia
+entre el HR promedio de la segunda y de la primera mitad del tramo (bpm).
+"""
+
+import numpy as np
+
+
+def _reducir(valores, inicios):
+    """(suma, máximo, mínimo) de cada segmento que empieza en `inicios` (crecientes y < len)."""
+    return (np.add.reduceat(valores[0], inicios),
+            np.maximum.reduceat(valores[1], inicios),
+            np.minimum.reduceat(valores[2], inicios))
+
+
+def estadisticas_por_lap(hr, laps, sample_rate=5, duracion=None):
+    """
+    Tabla de estadísticas por tramo.
+
+    hr: serie uniforme (array float, NaN donde no hay dato), una muestra cada
+    sample_rate segundos. laps: lista de dicts con 'time_seconds'. duracion:
+    duración de la sesión en segundos para cerrar el último tramo (por defecto,
+    el final de la serie).
+
+    Retorna una lista de dicts con lap_number, start_seconds, end_seconds,
+    duration_seconds, hr_avg, hr_max, hr_min, hr_drift y num_samples (muestras
+    con HR). Los valores de HR son None si el tramo no tiene muestras.
+    """
+    hr = np.asarray(hr, dtype=float)
+    n = hr.size
+    if not laps or n == 0:
+        return []
+
+    cortes = np.array([lap['time_seconds'] for lap in laps], dtype=np.int64) // sample_rate
+    cortes = np.maximum.accumulate(np.clip(cortes, 0, n))
+    inicios = np.concatenate(([0], cortes))
+    fines = np.concatenate((cortes, [n]))
+    # Punto medio de cada tramo para la deriva: primera mitad [inicio, medio), segunda [medio, fin)
+    medios = inicios + (fines - inicios) // 2
+
+    validas = ~np.isnan(hr)
+    valores = (np.where(validas, hr, 0.0), np.where(validas, hr, -np.inf), np.where(validas, hr, np.inf))
+    conteo_acum = np.concatenate(([0], np.cumsum(validas)))
+    suma_acum = np.concatenate(([0.0], np.cumsum(valores[0])))
+
+    # Sumas y conteos por diferencia de acumulados (admite tramos vacíos)
+    num = conteo_acum[fines] - conteo_acum[inicios]
+    suma = suma_acum[fines] - suma_acum[inicios]
+    num_1 = conteo_acum[medios] - conteo_acum[inicios]
+    num_2 = conteo_acum[fines] - conteo_acum[medios]
+    suma_1 = suma_acum[medios] - suma_acum[inicios]
+    suma_2 = suma_acum[fines] - suma_acum[medios]
+
+    # Máximo y mínimo: reduceat sobre los tramos no vacíos (índices estrictamente crecientes)
+    maximo = np.full(inicios.size, -np.inf)
+    minimo = np.full(inicios.size, np.inf)
+    no_vacios = fines > inicios
+    if no_vacios.any():
+        _, maximo[no_vacios], minimo[no_vacios] = _reducir(valores, inicios[no_vacios])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        promedio = suma / num
+        deriva = suma_2 / num_2 - suma_1 / num_1
+
+    inicio_s = inicios * sample_rate
+    fin_s = fines * sample_rate
+    if duracion is not None:
+        fin_s[-1] = max(int(duracion), int(inicio_s[-1]))
+
+    def _valor(x, decimales=None):
+        if not np.isfinite(x):
+            return None
+        return round(float(x), decimales) if decimales is not None else int(x)
+
+    return [
+        {
+            'lap_number':       i + 1,
+            'start_seconds':    int(a),
+            'end_seconds':      int(b),
+            'duration_seconds': int(b - a),
+            'hr_avg':           _valor(p, 1),
+            'hr_max':           _valor(mx),
+            'hr_min':           _valor(mn),
+            'hr_drift':         _valor(d, 1),
+            'num_samples':      int(c),
+        }
+        for i, (a, b, p, mx, mn, d, c) in enumerate(zip(
+            inicio_s.tolist(), fin_s.tolist(), promedio.tolist(), maximo.tolist(),
+            minimo.tolist(), deriva.tolist(), num.tolist()))
+    ]
@@ -0,0 +1,174 @@
+"""
+Envío en vivo de cambios de la exportación al dashboard (Server-Sent Events).
+
+VigilanteExportacion revisa periódicamente entrenamientos.json; cuando cambia
+lo relee, compara cada sesión con la versión anterior por su huella y arma un
+delta con:
+
+- 'sesiones': resúmenes de las sesiones nuevas o modificadas (sin las muestras
+  de HR, que el dashboard pide aparte con /api/sesion-export?id=... al abrir
+  el gráfico),
+- 'eliminadas': claves de las sesiones que ya no están,
+- 'rollups': totales recalculados para las tarjetas de estadísticas,
+- 'carga': serie diaria de carga de entrenamiento (ver carga_entrenamiento).
+
+El delta se publica a todos los clientes suscriptos a /api/eventos, así que el
+dashboard se actualiza apenas termina una exportación sin volver a bajar el
+JSON completo.
+"""
+
+import hashlib
+import json
+import queue
+import threading
+import time
+
+# Cada cuántos segundos se revisa si cambió el archivo
+INTERVALO_VIGILANCIA = 1.0
+# Comentario SSE para mantener viva la conexión (segundos)
+LATIDO_SSE = 15
+# Campos que no viajan en el resumen de una sesión
+CAMPOS_PESADOS = ('hr_samples', 'hr_series')
+
+
+def clave_sesion(sesion):
+    return sesion.get('id') or sesion.get('start_time')
+
+
+def resumen_sesion(sesion):
+    """Sesión sin los campos pesados; marca si tiene muestras para pedir aparte."""
+    resumen = {k: v for k, v in sesion.items() if k not in CAMPOS_PESADOS}
+    resumen['muestras_pendientes'] = bool(sesion.get('hr_samples'))
+    return resumen
+
+
+def _huella(sesion):
+    return hashlib.sha1(json.dumps(sesion, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def calcular_rollups(sesiones, export_date=None):
+    """Totales que muestran las tarjetas del dashboard."""
+    con_hr = [s for s in sesiones if s.get('hr_avg') is not None]
+    minimos = [s['hr_min'] for s in con_hr if s.get('hr_min')]
+    return {
+        'export_date':            export_date,
+        'total_sessions':         len(sesiones),
+        'total_duration_seconds': sum(s.get('duration_seconds') or 0 for s in sesiones),
+        'sessions_with_hr':       len(con_hr),
+        'hr_avg':                 round(sum(s['hr_avg'] for s in con_hr) / len(con_hr), 1) if con_hr else None,
+        'hr_max':                 max((s.get('hr_max') or 0 for s in con_hr), default=None),
+        'hr_min':                 min(minimos, default=None),
+    }
+
+
+class VigilanteExportacion(threading.Thread):
+    """Hilo que vigila el JSON exportado y publica los deltas a los suscriptos."""
+
+    def __init__(self, ruta, intervalo=INTERVALO_VIGILANCIA):
+        super().__init__(daemon=True)
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.version = 0
+        self._firma = None
+        self._sesiones = {}
+        self._huellas = {}
+        self._clientes = set()
+        self._lock = threading.Lock()
+
+    def _firma_archivo(self):
+        try:
+            st = self.ruta.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def actualizar(self):
+        """
+        Relee el archivo si cambió. Retorna el delta (o None si no hubo
+        cambios o el archivo todavía se está escribiendo).
+        """
+        firma = self._firma_archivo()
+        if firma is None or firma == self._firma:
+            return None
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            # Escritura a medio terminar: se reintenta en la próxima vuelta
+            return None
+
+        sesiones = {clave_sesion(s): s for s in datos.get('sessions', [])}
+        huellas = {k: _huella(s) for k, s in sesiones.items()}
+
+        with self._lock:
+            cambiadas = [k for k, h in huellas.items() if self._huellas.get(k) != h]
+            eliminadas = [k for k in self._huellas if k not in huellas]
+            self._firma = firma
+            self._sesiones, self._huellas = sesiones, huellas
+            if not cambiadas and not eliminadas and self.version:
+                return None
+            self.version += 1
+            return {
+                'version':    self.version,
+                'sesiones':   [resumen_sesion(sesiones[k]) for k in cambiadas],
+                'eliminadas': eliminadas,
+                'rollups':    calcular_rollups(list(sesiones.values()), datos.get('export_date')),
+                'carga':      datos.get('training_load'),
+            }
+
+    def sesion(self, clave):
+        """Sesión completa (con muestras) de la última versión leída."""
+        with self._lock:
+            return self._sesiones.get(clave)
+
+    def suscribir(self):
+        cola = queue.Queue()
+        with self._lock:
+            self._clientes.add(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._clientes.discard(cola)
+
+    def publicar(self, delta):
+        with self._lock:
+            clientes = list(self._clientes)
+        for cola in clientes:
+            cola.put(delta)
+
+    def run(self):
+        while True:
+            delta = self.actualizar()
+            if delta is not None:
+                self.publicar(delta)
+            time.sleep(self.intervalo)
+
+
+def transmitir_eventos(handler, vigilante):
+    """
+    Atiende una conexión SSE: publica cada delta como evento 'delta' (con su
+    versión como id) y un latido cada LATIDO_SSE segundos.
+    """
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+    handler.send_header('Cache-Control', 'no-cache')
+    handler.end_headers()
+
+    cola = vigilante.suscribir()
+    try:
+        handler.wfile.write(f"event: version\ndata: {vigilante.version}\n\n".encode('utf-8'))
+        handler.wfile.flush()
+        while True:
+            try:
+                delta = cola.get(timeout=LATIDO_SSE)
+                mensaje = (f"id: {delta['version']}\nevent: delta\n"
+                           f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+            except queue.Empty:
+                mensaje = ": latido\n\n"
+            handler.wfile.write(mensaje.encode('utf-8'))
+            handler.wfile.flush()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        vigilante.desuscribir(cola)
@@ -0,0 +1,141 @@
+"""
+Exportación particionada para servir el dashboard desde un hosting estático/CDN.
+
+En lugar de un único entrenamientos.json, escribe:
+
+    estatico/index.json                 resúmenes de sesiones, totales y carga
+    estatico/sesiones/<hash>.json       muestras de HR de una sesión
+    estatico/sesiones/<hash>.json.gz    (y .br si está instalado brotli)
+
+El nombre de cada archivo de sesión es el hash de su contenido: si la sesión no
+cambia, el archivo tampoco, y puede cachearse para siempre (Cache-Control
+immutable). Solo index.json se revalida. El dashboard baja el índice al abrir y
+pide las muestras de una sesión recién al abrir su gráfico.
+
+Los archivos de sesión que ya no figuran en el índice se borran. Una
+exportación sin --particionado borra el índice (invalidar_particionado): si no,
+el dashboard seguiría prefiriendo el de una exportación anterior.
+"""
+
+import gzip
+import hashlib
+import json
+from pathlib import Path
+
+from eventos_dashboard import CAMPOS_PESADOS, calcular_rollups, clave_sesion, resumen_sesion
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIRECTORIO_ESTATICO = 'estatico'
+DIRECTORIO_SESIONES = 'sesiones'
+# Cache-Control de cada tipo de archivo (los usa abrir_dashboard; los mismos
+# valores están en next.config.js y vercel.json)
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_INDICE = 'no-cache'
+LARGO_HASH = 20
+
+
+def _serializar(objeto):
+    return json.dumps(objeto, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _escribir_si_cambia(ruta, datos):
+    """Escribe `datos` salvo que el archivo ya tenga exactamente ese contenido."""
+    try:
+        if ruta.stat().st_size == len(datos) and ruta.read_bytes() == datos:
+            return False
+    except OSError:
+        pass
+    temporal = ruta.with_name(ruta.name + '.tmp')
+    temporal.write_bytes(datos)
+    temporal.replace(ruta)
+    return True
+
+
+def _borrar_con_comprimidos(ruta):
+    """Borra un archivo y sus hermanos .gz/.br. Retorna True si existía."""
+    existia = ruta.exists()
+    for sufijo in ('', '.gz', '.br'):
+        ruta.with_name(ruta.name + sufijo).unlink(missing_ok=True)
+    return existia
+
+
+def _escribir_comprimidos(ruta, datos):
+    """Hermanos .gz (determinista, sin fecha) y .br de un archivo recién escrito."""
+    _escribir_si_cambia(ruta.with_name(ruta.name + '.gz'), gzip.compress(datos, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _escribir_si_cambia(ruta.with_name(ruta.name + '.br'), brotli.compress(datos))
+
+
+def escribir_sesion(directorio_sesiones, sesion):
+    """
+    Escribe las muestras de una sesión con nombre por hash de contenido (si el
+    archivo ya existe no se toca). Retorna el nombre del archivo, o None si la
+    sesión no tiene muestras.
+    """
+    pesado = {k: sesion[k] for k in CAMPOS_PESADOS if sesion.get(k)}
+    if not pesado:
+        return None
+    datos = _serializar(dict(pesado, id=clave_sesion(sesion)))
+    nombre = hashlib.sha256(datos).hexdigest()[:LARGO_HASH] + '.json'
+    ruta = directorio_sesiones / nombre
+    if not ruta.exists():
+        _escribir_si_cambia(ruta, datos)
+        _escribir_comprimidos(ruta, datos)
+    return nombre
+
+
+def escribir_particionado(resultado, directorio):
+    """
+    Escribe la exportación `resultado` (mismo dict que entrenamientos.json) en
+    formato particionado dentro de `directorio`. Retorna un dict con la ruta
+    del índice y cuántos archivos de sesión se escribieron, reutilizaron y
+    borraron.
+    """
+    directorio = Path(directorio)
+    directorio_sesiones = directorio / DIRECTORIO_SESIONES
+    directorio_sesiones.mkdir(parents=True, exist_ok=True)
+    existentes = {p.name for p in directorio_sesiones.glob('*.json')}
+
+    resumenes = []
+    usados = set()
+    for sesion in resultado['sessions']:
+        resumen = resumen_sesion(sesion)
+        nombre = escribir_sesion(directorio_sesiones, sesion)
+        if nombre:
+            resumen['muestras_url'] = f"{DIRECTORIO_SESIONES}/{nombre}"
+            usados.add(nombre)
+        resumenes.append(resumen)
+
+    indice = {k: v for k, v in resultado.items() if k != 'sessions'}
+    indice['rollups'] = calcular_rollups(resultado['sessions'], resultado.get('export_date'))
+    indice['sessions'] = resumenes
+    ruta_indice = directorio / 'index.json'
+    datos = _serializar(indice)
+    _escribir_si_cambia(ruta_indice, datos)
+    _escribir_comprimidos(ruta_indice, datos)
+
+    # Sesiones que ya no están en el índice (cambiaron o se filtraron)
+    obsoletos = existentes - usados
+    for nombre in obsoletos:
+        _borrar_con_comprimidos(directorio_sesiones / nombre)
+
+    return {
+        'indice':      ruta_indice,
+        'nuevos':      len(usados - existentes),
+        'reutilizados': len(usados & existentes),
+        'borrados':    len(obsoletos),
+    }
+
+
+def invalidar_particionado(directorio):
+    """
+    Borra el índice de una exportación particionada anterior, para que el
+    dashboard use el entrenamientos.json recién escrito. Los archivos de
+    sesión quedan y los limpia la próxima exportación particionada. Retorna
+    True si había un índice.
+    """
+    return _borrar_con_comprimidos(Path(directorio) / 'index.json')
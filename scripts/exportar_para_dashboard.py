@@ -1,65 +1,47 @@
 """
 Script para exportar sesiones de entrenamiento en formato JSON estructurado
-para usar en un dashboard. Solo incluye duración y frecuencia cardíaca.
-NO incluye GPS ni distancias (el reloj no tiene estas funcionalidades).
+para usar en un dashboard: duración, frecuencia cardíaca y laps. Las sesiones
+cuyo stream trae GPS (deteccion_gps) incluyen además la calidad del GPS y la
+distancia (gps_quality, distance_meters); en esas no se detectan laps.
 """
 
+import argparse
+import itertools
 import json
 import sys
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
 
-# Agregar el path de la librería instalada
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
-
-from polar_rcx5_datalink.datalink import DataLink
-from polar_rcx5_datalink.parser import TrainingSession
 from polar_rcx5_datalink.exceptions import ParserError, SyncError
 from polar_rcx5_datalink.utils import bcd_to_int
-import polar_rcx5_datalink.utils as utils
-import pytz
-import tzlocal
-
-# tzlocal >= 3.0 retorna ZoneInfo en lugar de un timezone de pytz,
-# pero la librería llama .localize() que solo existe en pytz.
-# Reemplazamos datetime_to_utc por una versión compatible.
-def _datetime_to_utc_fixed(dt, timezone=None):
-    if timezone is None:
-        tz = pytz.timezone(str(tzlocal.get_localzone()))
-    else:
-        tz = pytz.timezone(timezone)
-    return tz.localize(dt, is_dst=None).astimezone(pytz.utc)
-
-utils.datetime_to_utc = _datetime_to_utc_fixed
-
-# geopy lanza ValueError cuando lat/lon están fuera de rango (-90..90 / -180..180).
-# En sesiones donde el GPS falló o los datos están corruptos esto mata el parsing
-# completo, perdiendo todos los samples de HR. Parcheamos para ignorar el error.
-def _safe_calculate_distance(self, coord1, coord2):
-    try:
-        lat1, lon1 = coord1
-        lat2, lon2 = coord2
-        if (lat1 is None or lon1 is None or lat2 is None or lon2 is None
-                or abs(lat1) > 90 or abs(lon1) > 180
-                or abs(lat2) > 90 or abs(lon2) > 180):
-            return 0.0
-        import geopy.distance
-        return geopy.distance.distance(coord1, coord2).meters
-    except Exception:
-        return 0.0
-
-TrainingSession._calculate_distance = _safe_calculate_distance
+import calidad_gps
+from carga_entrenamiento import ARCHIVO_ESTADO, FC_MAXIMA, FC_REPOSO, CargaEntrenamiento
+from demonio_sesiones import ErrorDemonio, consultar
+from decodificador_hr import decodificar_hr_con_laps
+from deduplicacion import DIRECTORIO_UNICAS, IndiceSesiones, procesar_sin_duplicados
+from deteccion_gps import SesionAutodetectada
+from exportacion_estatica import DIRECTORIO_ESTATICO, escribir_particionado, invalidar_particionado
+from estadisticas_laps import estadisticas_por_lap
+from segmentacion_esfuerzo import resumen_esfuerzo, segmentar_esfuerzo
+from similitud_sesiones import ARCHIVO_SIMILITUD, construir_indice, guardar_indice
+from sincronizacion import LecturaCapturas, LecturaSesiones, liberar_sesion, procesar_en_pipeline
+import distancia_gps
+import limpieza_hr
+import zona_horaria
+
+# tzlocal >= 3.0 rompe utils.datetime_to_utc de la librería; usamos la versión
+# compatible de zona_horaria, que además resuelve la zona una sola vez.
+zona_horaria.parchear()
+
+# La librería calcula la distancia con geopy muestra a muestra (lento, y lanza
+# ValueError con coordenadas fuera de rango). La diferimos y la calculamos para
+# toda la sesión con distancia_gps.aplicar_distancias(), que valida los rangos.
+distancia_gps.parchear()
 
 # Rango fisiológico válido de frecuencia cardíaca (bpm)
 HR_MIN_VALID = 30
 HR_MAX_VALID = 250
 
-# Detección de laps sin GPS:
-# Cuando el reloj registra un lap, inserta un bloque de 416 bits (casi todos ceros)
-# en el stream entre muestras de HR. Detectamos esos bloques por su baja densidad.
-LAP_DATA_BITS    = TrainingSession._LAP_DATA_BITS_LENGTH  # 416
-LAP_DENSITY_MAX  = 0.15   # < 15% de bits en 1 → bloque de lap
-
 
 def _hr_valido(hr):
     """Devuelve True si el valor de HR está en rango fisiológico válido."""
@@ -68,81 +50,30 @@ def _hr_valido(hr):
     return HR_MIN_VALID <= hr <= HR_MAX_VALID
 
 
-def detectar_laps_nogps(sess):
+def detectar_laps_nogps(sess, cortes=None):
     """
-    Escanea el stream de bits de una sesión sin GPS buscando bloques de lap.
+    Laps de una sesión sin GPS a partir de los bloques de lap del stream.
 
     El reloj inserta bloques de 416 bits (casi puros ceros) en el stream entre
-    muestras de HR cuando se registra un lap. Los detectamos por densidad < 15%.
-
-    Parsea HR muestra a muestra para tener un conteo preciso al momento de cada
-    lap, lo que permite calcular el tiempo de cada vuelta.
+    muestras de HR cuando se registra un lap. decodificar_hr_con_laps los
+    detecta por densidad < 15% y los salta al decodificar, así que la muestra
+    donde empieza cada lap es su posición en la misma serie de HR que usan las
+    estadísticas. `cortes`: los (muestra, bit) de esa decodificación, si ya se
+    hizo.
 
     Retorna lista de laps con timing, y el conteo del header (byte 161).
     """
-    bits        = sess._samples_bits
+    if cortes is None:
+        _, _, cortes = decodificar_hr_con_laps(sess._samples_bits)
     sample_rate = sess.info.get('sample_rate', 5)
-    cursor      = 0
-    n_samples   = 0
-    last_hr     = None
-    zero_delta  = 0
     laps        = []
-
-    def leer_hr(pos):
-        nonlocal last_hr, zero_delta
-        if pos + 6 > len(bits):
-            return None, 0
-        p = bits[pos:pos+2]
-        if p == '01':
-            if pos + 11 > len(bits): return None, 0
-            hr = int(bits[pos+3:pos+11], 2)
-            zero_delta = 0; last_hr = hr; return hr, 11
-        elif p == '00':
-            if pos + 11 > len(bits): return None, 0
-            hr = int(bits[pos:pos+11], 2)
-            zero_delta = 0; last_hr = hr; return hr, 11
-        elif p == '10':
-            if pos + 6 > len(bits): return None, 0
-            delta = int(bits[pos+2:pos+6], 2)
-            hr = (last_hr or 0) + delta
-            zero_delta = zero_delta + 1 if delta == 0 else 0
-            last_hr = hr; return hr, 6
-        elif p == '11':
-            if pos + 6 > len(bits): return None, 0
-            delta = -((int(bits[pos+2:pos+6], 2) ^ 0b1111) + 1)
-            hr = (last_hr or 0) + delta
-            zero_delta = zero_delta + 1 if delta == 0 else 0
-            last_hr = hr; return hr, 6
-        return None, 0
-
-    # Primera muestra
-    hr, consumed = leer_hr(cursor)
-    if consumed:
-        cursor += consumed
-        n_samples = 1
-
-    while cursor < len(bits) - 6 and len(bits[cursor:cursor+7]) > 5:
-        # Antes de parsear la siguiente muestra, verificar si hay bloque de lap
-        if cursor + LAP_DATA_BITS <= len(bits):
-            chunk   = bits[cursor:cursor + LAP_DATA_BITS]
-            density = chunk.count('1') / LAP_DATA_BITS
-            if density < LAP_DENSITY_MAX:
-                t = n_samples * sample_rate
-                laps.append({
-                    'lap_number':       len(laps) + 1,
-                    'time_seconds':     t,
-                    'time_formatted':   f"{t//3600:02d}:{(t%3600)//60:02d}:{t%60:02d}",
-                })
-                cursor     += LAP_DATA_BITS
-                zero_delta  = 0
-                last_hr     = None
-                continue
-
-        hr, consumed = leer_hr(cursor)
-        if not consumed:
-            break
-        cursor    += consumed
-        n_samples += 1
+    for muestra, _ in cortes:
+        t = muestra * sample_rate
+        laps.append({
+            'lap_number':       len(laps) + 1,
+            'time_seconds':     t,
+            'time_formatted':   f"{t//3600:02d}:{(t%3600)//60:02d}:{t%60:02d}",
+        })
 
     # Conteo de laps del header (byte 161, identificado por análisis binario)
     try:
@@ -202,31 +133,41 @@ def extraer_info_basica(raw_session):
 def parsear_sesion_completa(raw_session):
     """Extrae solo información de duración y frecuencia cardíaca, incluyendo muestras de HR."""
     try:
-        sess = TrainingSession(raw_session)
-
         # El byte 166 del protocolo queda en True aunque el reloj no tenga GPS.
         # El parser GPS intenta leer coordenadas/velocidad/satélites donde solo
-        # hay datos de HR, produciendo crashes o samples truncados. Forzamos
-        # modo no-GPS y recalculamos el inicio del stream de bits (351 vs 349).
-        if sess.has_gps:
-            sess.has_gps = False
-            sess._samples_bits = sess._get_samples_bits()
+        # hay datos de HR, produciendo crashes o samples truncados. La sesión
+        # decide el modo probando un prefijo del stream con ambas disposiciones
+        # (349 vs 351) y arma el stream de bits una sola vez.
+        sess = SesionAutodetectada(raw_session)
 
-        # Intentar parsear muestras de HR (solo si tiene HR, sin necesidad de GPS)
+        # Parsear muestras: de HR si tiene HR, y con GPS aunque no tenga HR
+        # (para la distancia)
         muestras_hr = []
         muestras_parseadas = False
+        gps_parseado = False
+        limpieza = None
+        cortes_lap = None
         
-        if sess.has_hr:
+        if sess.has_hr or sess.has_gps:
             try:
-                sess.parse_samples()
-                muestras_parseadas = True
+                if sess.has_gps:
+                    sess.parse_samples()
+                    distancia_gps.aplicar_distancias(sess)
+                    gps_parseado = len(sess.samples) > 0
+                    hrs = [sample.hr for sample in sess.samples] if sess.has_hr else []
+                else:
+                    # Como parse_samples() sin GPS, sin objetos Sample y sin
+                    # decodificar los bloques de lap como muestras: la serie
+                    # y los cortes de lap salen de la misma pasada
+                    hrs, _, cortes_lap = decodificar_hr_con_laps(sess._samples_bits)
+                muestras_parseadas = len(hrs) > 0
                 
                 # Extraer muestras de HR con sus timestamps
                 sample_rate = sess.info.get('sample_rate', 5)  # Default 5 segundos
                 start_time = sess.start_time
                 
-                for i, sample in enumerate(sess.samples):
-                    if sample.hr is not None and _hr_valido(sample.hr):
+                for i, hr in enumerate(hrs):
+                    if hr is not None and _hr_valido(hr):
                         # Calcular timestamp de esta muestra
                         seconds_from_start = i * sample_rate
                         timestamp = start_time.timestamp() + seconds_from_start
@@ -235,8 +176,12 @@ def parsear_sesion_completa(raw_session):
                             'timestamp': timestamp,
                             'time_seconds': seconds_from_start,
                             'time_formatted': f"{seconds_from_start // 60:02d}:{seconds_from_start % 60:02d}",
-                            'hr': sample.hr
+                            'hr': hr
                         })
+
+                # Serie limpia con cadencia uniforme: base común para gráficos y estadísticas
+                if muestras_parseadas:
+                    limpieza = limpieza_hr.limpiar_hr(hrs, sample_rate)
             except Exception as e:
                 # Si falla el parsing de muestras, continuar con solo estadísticas
                 muestras_parseadas = False
@@ -275,14 +220,41 @@ def parsear_sesion_completa(raw_session):
             datos['hr_samples'] = []
             datos['num_hr_samples'] = 0
 
-        # Detección de laps por bloques de baja densidad en el stream
-        laps_detectados, laps_header = detectar_laps_nogps(sess)
+        if limpieza is not None:
+            datos['hr_series'] = limpieza_hr.serie_serializable(limpieza, datos['sample_rate_seconds'])
+            datos['hr_cleaning'] = limpieza_hr.resumen(limpieza)
+
+        # Distancia: solo si la sesión trae GPS y su calidad es aceptable
+        if gps_parseado:
+            calidad = calidad_gps.calidad_sesion(sess)
+            datos['gps_quality'] = calidad_gps.resumen(calidad)
+            datos['distance_meters'] = round(sess.distance, 1) if calidad['confiable'] else None
+
+        # Detección de laps por bloques de baja densidad en el stream (solo
+        # sin GPS: con GPS el parser de la librería ya salta esos bloques)
+        if sess.has_gps:
+            laps_detectados, laps_header = [], sess.raw[0][161]
+        else:
+            laps_detectados, laps_header = detectar_laps_nogps(sess, cortes_lap)
         datos['laps']       = laps_detectados
         datos['num_laps']   = len(laps_detectados)
         datos['has_laps']   = len(laps_detectados) > 0
         # laps_header: conteo del byte 161 del header para validación cruzada
         if laps_header is not None:
             datos['num_laps_header'] = laps_header
+        # Estadísticas de cada tramo entre laps, sobre la serie de HR limpia
+        if laps_detectados and limpieza is not None:
+            datos['lap_stats'] = estadisticas_por_lap(limpieza['hr'], laps_detectados,
+                                                      datos['sample_rate_seconds'], sess.duration)
+        # Tramos de trabajo/descanso detectados en la propia serie (haya laps o no)
+        if limpieza is not None:
+            segmentos = segmentar_esfuerzo(limpieza['hr'], datos['sample_rate_seconds'], sess.duration)
+            if segmentos:
+                datos['effort_segments'] = segmentos
+                datos['effort_summary'] = resumen_esfuerzo(segmentos)
+
+        # Soltar crudo, bits y muestras antes de devolver el resultado
+        liberar_sesion(sess)
         
         return datos
         
@@ -337,7 +309,32 @@ def sesion_dentro_del_filtro(datos, limite):
         return True
 
 
-def main():
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description='Exporta sesiones del Polar RCX5 para el dashboard.')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos para parsear sesiones (por defecto, uno por CPU)')
+    parser.add_argument('--demonio', action='store_true',
+                        help='Pedir las sesiones ya decodificadas a demonio_sesiones.py en lugar de sincronizar')
+    parser.add_argument('--capturas', metavar='DIR', nargs='+',
+                        help='Leer sesiones crudas de uno o más directorios en lugar del reloj')
+    parser.add_argument('--acumular', action='store_true',
+                        help=f'Incluir también las sesiones de {DIRECTORIO_UNICAS}/ que ya no están en el reloj')
+    parser.add_argument('--reiniciar', action='store_true',
+                        help=f'Volver a parsear todas las sesiones aunque {DIRECTORIO_UNICAS}/ tenga su resultado')
+    parser.add_argument('--particionado', action='store_true',
+                        help=f'Escribir además {DIRECTORIO_ESTATICO}/ (índice + un archivo por sesión) para hosting estático')
+    parser.add_argument('--fc-reposo', type=int, default=FC_REPOSO,
+                        help=f'FC de reposo para el TRIMP (por defecto {FC_REPOSO})')
+    parser.add_argument('--fc-max', type=int, default=FC_MAXIMA,
+                        help=f'FC máxima para el TRIMP (por defecto {FC_MAXIMA})')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    zona = zona_horaria.instalar(args.timezone)
+
     print("="*80)
     print("EXPORTADOR PARA DASHBOARD - Polar RCX5")
     print("="*80)
@@ -351,38 +348,99 @@ def main():
     else:
         print("\n  → Exportando TODAS las sesiones")
 
-    input("\nPresiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
+    if not args.demonio and not args.capturas:
+        input("\nPresiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
     
     output_dir = Path(r'C:\Users\Pablo\Desktop\entrenamientos_dashboard')
     output_dir.mkdir(exist_ok=True)
     
+    indice = None
     try:
-        # Sincronizar con el reloj
-        print("\n[1/3] Sincronizando con el reloj...")
-        with DataLink() as dl:
-            dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Procesar cada sesión
-        print(f"\n[2/3] Procesando sesiones...")
         todas_las_sesiones = []
         sesiones_omitidas = 0
-        
-        for i, raw_session in enumerate(raw_sessions, 1):
-            print(f"  Procesando sesión {i}/{len(raw_sessions)}...", end=' ')
-            
-            datos = parsear_sesion_completa(raw_session)
-
-            if not sesion_dentro_del_filtro(datos, limite_fecha):
-                sesiones_omitidas += 1
-                fecha = datos.get('start_time', '?')[:10]
-                print(f"omitida (fuera del período: {fecha})")
-                continue
-
-            todas_las_sesiones.append(datos)
-            print("✓")
+
+        def filtrar(resultados, total):
+            # `total` es una función: con el reloj la cantidad de sesiones se
+            # conoce recién cuando el generador empieza a recibirlas
+            nonlocal sesiones_omitidas
+            for i, datos in enumerate(resultados, 1):
+                print(f"  Procesando sesión {i}/{total()}...", end=' ')
+
+                if not sesion_dentro_del_filtro(datos, limite_fecha):
+                    sesiones_omitidas += 1
+                    fecha = datos.get('start_time', '?')[:10]
+                    print(f"omitida (fuera del período: {fecha})")
+                    continue
+
+                todas_las_sesiones.append(datos)
+                print("✓")
+
+        if args.demonio:
+            # Las sesiones ya están sincronizadas y decodificadas en el demonio
+            print("\n[1/3] Pidiendo sesiones al demonio...")
+            sesiones = consultar('sesiones')
+            print(f"\n[2/3] Filtrando sesiones...")
+            filtrar(sesiones, lambda: len(sesiones))
+            total_encontradas = len(sesiones)
+            historial = sesiones
+        else:
+            # Sincronizar con el reloj (o leer capturas) y procesar en paralelo:
+            # cada sesión se parsea apenas termina de transferirse, mientras
+            # llegan las siguientes.
+
+            # Sesiones únicas por contenido: las ya parseadas (en exportaciones
+            # anteriores, o en esta misma si se cortó) o repetidas entre
+            # capturas no se vuelven a parsear
+            indice = IndiceSesiones(output_dir / DIRECTORIO_UNICAS, opciones={'timezone': zona},
+                                    reutilizar=not args.reiniciar)
+            if len(indice):
+                print(f"\n  → Índice de sesiones únicas: {len(indice)} sesiones guardadas")
+
+            def procesar(fuente):
+                return procesar_en_pipeline(fuente, parsear_sesion_completa, args.workers)
+
+            def leer(lectura):
+                fuente = itertools.chain(lectura, indice.no_vistas()) if args.acumular else lectura
+                filtrar(procesar_sin_duplicados(fuente, procesar, indice), lambda: lectura.total)
+
+            if args.capturas:
+                print(f"\n[1/3] Leyendo capturas de {', '.join(args.capturas)}...")
+                print(f"\n[2/3] Procesando sesiones...")
+                lectura = LecturaCapturas(*args.capturas)
+                leer(lectura)
+            else:
+                # El stack USB solo se carga aquí (no en los workers ni en quien
+                # importa parsear_sesion_completa)
+                from polar_rcx5_datalink.datalink import DataLink
+
+                print("\n[1/3] Sincronizando con el reloj...")
+                print(f"\n[2/3] Procesando sesiones a medida que llegan...")
+                with DataLink() as dl:
+                    dl.synchronize()
+                    lectura = LecturaSesiones(dl)
+                    leer(lectura)
+            total_encontradas = lectura.total
+            historial = indice.todas()
+            print(f"✓ Sesiones únicas: {len(indice.conocidas)} ya parseadas en exportaciones anteriores, "
+                  f"{indice.duplicadas} repetidas descartadas, {len(indice)} en el índice")
+
+        print(f"✓ Sincronización completada: {total_encontradas} sesiones encontradas")
+
+        # Carga de entrenamiento: solo se calcula el TRIMP de las sesiones nuevas
+        # o cuya serie de HR cambió
+        archivo_carga = output_dir / ARCHIVO_ESTADO
+        carga = CargaEntrenamiento.cargar(archivo_carga, args.fc_reposo, args.fc_max)
+        nuevas = carga.incorporar(todas_las_sesiones, hasta=date.today().isoformat())
+        for datos in todas_las_sesiones:
+            datos['trimp'] = carga.trimp_de(datos.get('id') or datos.get('start_time'))
+        carga.guardar(archivo_carga)
+        print(f"✓ Carga de entrenamiento: {nuevas} sesiones nuevas o recalculadas, {len(carga.sesiones)} en el historial")
+
+        # Índice de vectores para buscar sesiones parecidas (rcx5.py similar),
+        # sobre todo el historial y no solo el período exportado
+        similitud = construir_indice(historial, args.fc_max)
+        guardar_indice(similitud, output_dir / ARCHIVO_SIMILITUD)
+        print(f"✓ Índice de similitud: {len(similitud['claves'])} sesiones")
         
         # Guardar en archivo JSON
         print(f"\n[3/3] Guardando datos...")
@@ -393,6 +451,7 @@ def main():
             'filter_months': filtro_meses,
             'filter_from': limite_fecha.isoformat() if limite_fecha else None,
             'total_sessions': len(todas_las_sesiones),
+            'training_load': carga.resumen(),
             'sessions': todas_las_sesiones
         }
         
@@ -400,6 +459,13 @@ def main():
             json.dump(resultado, f, indent=2, ensure_ascii=False)
         
         print(f"✓ Datos guardados en: {output_file}")
+        if args.particionado:
+            estatico = escribir_particionado(resultado, output_dir / DIRECTORIO_ESTATICO)
+            print(f"✓ Exportación particionada en: {estatico['indice'].parent} "
+                  f"({estatico['nuevos']} sesiones nuevas, {estatico['reutilizados']} sin cambios, "
+                  f"{estatico['borrados']} borradas)")
+        elif invalidar_particionado(output_dir / DIRECTORIO_ESTATICO):
+            print(f"✓ Índice particionado anterior borrado: el dashboard usa {output_file.name}")
         
         # Resumen
         print(f"\n{'='*80}")
@@ -433,6 +499,9 @@ def main():
     except SyncError as e:
         print(f"\n✗ Error de sincronización: {e}")
         sys.exit(1)
+    except ErrorDemonio as e:
+        print(f"\n✗ Error del demonio: {e}")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\n\nOperación cancelada por el usuario")
         sys.exit(0)
@@ -441,6 +510,9 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if indice is not None:
+            indice.guardar()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,288 @@
+"""
+Exportación a TCX (y GPX para sesiones con GPS) escrita en streaming.
+
+El TCXConverter de la librería arma el árbol XML completo en memoria (un
+Element por campo de cada muestra) y solo funciona con GPS. Aquí cada sesión se
+decodifica igual que en el exportador del dashboard (GPS detectado en el
+stream y filtro _hr_valido) y los Trackpoint se escriben directamente al archivo en
+bloques, sin construir ningún árbol: la memoria por sesión queda acotada por
+las muestras decodificadas.
+
+Un archivo por sesión, con el mismo nombre que usa la librería
+(YYYYmmddTHHMMSS.tcx / .gpx). Las sesiones se escriben en paralelo.
+
+Uso:
+    python scripts/exportar_tcx.py --salida tcx/
+    python scripts/exportar_tcx.py --capturas sesiones_crudas/ --salida tcx/ --gpx
+"""
+
+import argparse
+import functools
+import sys
+import time
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from polar_rcx5_datalink.parser import TrainingSession
+from polar_rcx5_datalink.exceptions import SyncError
+from decodificador_hr import decodificar_hr_con_laps
+from deteccion_gps import SesionAutodetectada
+from sincronizacion import LecturaCapturas, LecturaSesiones, liberar_sesion, procesar_en_pipeline
+import distancia_gps
+import zona_horaria
+
+zona_horaria.parchear()
+distancia_gps.parchear()
+
+HR_MIN_VALID = 30
+HR_MAX_VALID = 250
+
+# Trackpoints que se acumulan antes de escribirlos al archivo
+TRACKPOINTS_POR_BLOQUE = 512
+
+_FORMATO_ISO8601 = '%Y-%m-%dT%H:%M:%SZ'
+
+_CABECERA_TCX = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<TrainingCenterDatabase'
+    ' xsi:schemaLocation="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2'
+    ' http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd"'
+    ' xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2"'
+    ' xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    '<Activities>\n'
+)
+
+_CABECERA_GPX = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="entrenamientos"'
+    ' xmlns="http://www.topografix.com/GPX/1/1"'
+    ' xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+)
+
+
+def _hr_valido(hr):
+    return hr is not None and HR_MIN_VALID <= hr <= HR_MAX_VALID
+
+
+def _coordenadas_validas(muestras_gps):
+    """Máscara por muestra: True si lat/lon están presentes y dentro de rango."""
+    return distancia_gps.mascara_coordenadas([s.lat for s in muestras_gps],
+                                             [s.lon for s in muestras_gps])
+
+
+def _hora(epoch):
+    return time.strftime(_FORMATO_ISO8601, time.gmtime(epoch))
+
+
+def decodificar_sesion(raw_session, con_gps=False):
+    """
+    Decodifica una sesión para exportarla. Sin `con_gps` detecta el GPS en el
+    stream igual que el exportador del dashboard; con `con_gps` le cree al
+    byte 166 del header. Retorna (sess, hrs, muestras_gps): muestras_gps es la lista de
+    samples de la librería si la sesión se decodificó con GPS, o None.
+    """
+    if con_gps:
+        sess = TrainingSession(raw_session)
+    else:
+        sess = SesionAutodetectada(raw_session)
+
+    if not sess.has_hr and not sess.has_gps:
+        return sess, [], None
+
+    if sess.has_gps:
+        sess.parse_samples()
+        distancia_gps.aplicar_distancias(sess)
+        return sess, [s.hr for s in sess.samples], sess.samples
+
+    hrs, _, _ = decodificar_hr_con_laps(sess._samples_bits)
+    return sess, hrs, None
+
+
+def _trackpoints_tcx(inicio, sample_rate, hrs, muestras_gps):
+    """
+    Genera el XML de cada Trackpoint. Sin GPS se omiten las muestras con HR
+    inválido; con GPS se omite el Position de las coordenadas inválidas.
+    """
+    distancia = 0.0
+    posicion_valida = _coordenadas_validas(muestras_gps) if muestras_gps is not None else None
+    for i, hr in enumerate(hrs):
+        valido = _hr_valido(hr)
+        if muestras_gps is None and not valido:
+            continue
+
+        partes = [f'<Trackpoint><Time>{_hora(inicio + i * sample_rate)}</Time>']
+        if muestras_gps is not None:
+            s = muestras_gps[i]
+            distancia += s.distance
+            if posicion_valida[i]:
+                partes.append(
+                    f'<Position><LatitudeDegrees>{s.lat:.7f}</LatitudeDegrees>'
+                    f'<LongitudeDegrees>{s.lon:.7f}</LongitudeDegrees></Position>'
+                )
+            partes.append(f'<DistanceMeters>{distancia:.1f}</DistanceMeters>')
+        if valido:
+            partes.append(f'<HeartRateBpm><Value>{hr}</Value></HeartRateBpm>')
+        partes.append('</Trackpoint>\n')
+        yield ''.join(partes)
+
+
+def _trackpoints_gpx(inicio, sample_rate, hrs, muestras_gps):
+    """Genera cada trkpt del GPX; las muestras con coordenadas inválidas se omiten."""
+    posicion_valida = _coordenadas_validas(muestras_gps)
+    for i, s in enumerate(muestras_gps):
+        if not posicion_valida[i]:
+            continue
+        hr = hrs[i]
+        extension = (
+            f'<extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>{hr}</gpxtpx:hr>'
+            f'</gpxtpx:TrackPointExtension></extensions>'
+            if _hr_valido(hr) else ''
+        )
+        yield (f'<trkpt lat="{s.lat:.7f}" lon="{s.lon:.7f}">'
+               f'<time>{_hora(inicio + i * sample_rate)}</time>{extension}</trkpt>\n')
+
+
+def _escribir_en_bloques(f, lineas):
+    """Escribe las líneas de a TRACKPOINTS_POR_BLOQUE. Retorna cuántas escribió."""
+    bloque = []
+    total = 0
+    for linea in lineas:
+        bloque.append(linea)
+        if len(bloque) >= TRACKPOINTS_POR_BLOQUE:
+            f.write(''.join(bloque))
+            total += len(bloque)
+            bloque = []
+    f.write(''.join(bloque))
+    return total + len(bloque)
+
+
+def escribir_tcx(ruta, sess, hrs, muestras_gps=None, deporte='Other'):
+    """Escribe la sesión como TCX en `ruta`. Retorna la cantidad de Trackpoints."""
+    inicio_utc = sess.start_utctime
+    inicio = inicio_utc.timestamp()
+    id_actividad = inicio_utc.strftime(_FORMATO_ISO8601)
+    validos = [hr for hr in hrs if _hr_valido(hr)]
+
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(_CABECERA_TCX)
+        f.write(f'<Activity Sport={quoteattr(deporte)}>\n')
+        f.write(f'<Id>{id_actividad}</Id>\n<Lap StartTime="{id_actividad}">\n')
+        f.write(f'<TotalTimeSeconds>{sess.duration}</TotalTimeSeconds>\n')
+        # DistanceMeters y Calories son obligatorios en el esquema TCX
+        distancia = sess.distance if muestras_gps is not None else 0.0
+        f.write(f'<DistanceMeters>{distancia:.2f}</DistanceMeters>\n<Calories>0</Calories>\n')
+        if validos:
+            f.write(f'<AverageHeartRateBpm><Value>{round(sum(validos) / len(validos))}</Value></AverageHeartRateBpm>\n'
+                    f'<MaximumHeartRateBpm><Value>{max(validos)}</Value></MaximumHeartRateBpm>\n')
+        f.write('<Intensity>Active</Intensity>\n<TriggerMethod>Manual</TriggerMethod>\n<Track>\n')
+        n = _escribir_en_bloques(f, _trackpoints_tcx(inicio, sess.info.get('sample_rate', 5), hrs, muestras_gps))
+        f.write('</Track>\n</Lap>\n</Activity>\n</Activities>\n</TrainingCenterDatabase>\n')
+    return n
+
+
+def escribir_gpx(ruta, sess, hrs, muestras_gps):
+    """Escribe el recorrido de una sesión con GPS como GPX. Retorna la cantidad de puntos."""
+    inicio_utc = sess.start_utctime
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(_CABECERA_GPX)
+        f.write(f'<metadata><time>{inicio_utc.strftime(_FORMATO_ISO8601)}</time></metadata>\n')
+        f.write(f'<trk><name>{sess.id}</name><trkseg>\n')
+        n = _escribir_en_bloques(
+            f, _trackpoints_gpx(inicio_utc.timestamp(), sess.info.get('sample_rate', 5), hrs, muestras_gps))
+        f.write('</trkseg></trk>\n</gpx>\n')
+    return n
+
+
+def exportar_sesion(raw_session, salida, con_gps=False, gpx=False, deporte='Other'):
+    """
+    Decodifica y escribe una sesión. Pensada para correr en un worker: retorna
+    un dict con los archivos escritos (o el error) en lugar de imprimir.
+    """
+    try:
+        sess, hrs, muestras_gps = decodificar_sesion(raw_session, con_gps)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+    base = Path(salida) / sess.start_time.strftime('%Y%m%dT%H%M%S')
+    resultado = {'id': sess.id, 'archivos': [], 'trackpoints': 0}
+    try:
+        if not hrs:
+            resultado['omitida'] = 'sin muestras'
+            return resultado
+
+        resultado['trackpoints'] = escribir_tcx(base.with_suffix('.tcx'), sess, hrs, muestras_gps, deporte)
+        resultado['archivos'].append(base.with_suffix('.tcx').name)
+        if gpx and muestras_gps is not None:
+            escribir_gpx(base.with_suffix('.gpx'), sess, hrs, muestras_gps)
+            resultado['archivos'].append(base.with_suffix('.gpx').name)
+    except Exception as e:
+        resultado['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        liberar_sesion(sess)
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exporta las sesiones a TCX (y GPX) en streaming.')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument('--salida', type=Path, default=Path('tcx'),
+                        help='Directorio donde escribir los archivos')
+    parser.add_argument('--capturas', metavar='DIR',
+                        help='Leer sesiones crudas de un directorio en lugar del reloj')
+    parser.add_argument('--con-gps', action='store_true',
+                        help='Confiar en el byte de GPS del header (por defecto se detecta en el stream)')
+    parser.add_argument('--gpx', action='store_true',
+                        help='Escribir además un .gpx por cada sesión con GPS')
+    parser.add_argument('--deporte', default='Other', help='Valor de Sport en el TCX')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos en paralelo (por defecto, uno por CPU)')
+    args = parser.parse_args(argv)
+    zona_horaria.instalar(args.timezone)
+    args.salida.mkdir(parents=True, exist_ok=True)
+
+    funcion = functools.partial(exportar_sesion, salida=str(args.salida), con_gps=args.con_gps,
+                                gpx=args.gpx, deporte=args.deporte)
+    inicio = time.perf_counter()
+    escritas = omitidas = errores = trackpoints = 0
+
+    def exportar(fuente):
+        nonlocal escritas, omitidas, errores, trackpoints
+        for i, r in enumerate(procesar_en_pipeline(fuente, funcion, args.workers), 1):
+            if 'error' in r:
+                errores += 1
+                print(f"  ✗ Sesión {i}: {r['error']}")
+            elif r.get('omitida'):
+                omitidas += 1
+            else:
+                escritas += 1
+                trackpoints += r['trackpoints']
+                print(f"  ✓ {', '.join(r['archivos'])} ({r['trackpoints']} trackpoints)")
+
+    try:
+        if args.capturas:
+            exportar(LecturaCapturas(args.capturas))
+        else:
+            from polar_rcx5_datalink.datalink import DataLink
+
+            input("Presiona ENTER cuando hayas seleccionado 'Connect > Start synchronizing' en tu reloj...")
+            with DataLink() as dl:
+                dl.synchronize()
+                exportar(LecturaSesiones(dl))
+    except SyncError as e:
+        print(f"\n✗ Error de sincronización: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\nOperación cancelada por el usuario")
+        sys.exit(0)
+
+    print(f"\n✓ {escritas} sesiones exportadas a {args.salida} ({trackpoints} trackpoints, "
+          f"{time.perf_counter() - inicio:.1f}s)")
+    if omitidas:
+        print(f"  {omitidas} sesiones sin muestras omitidas")
+    if errores:
+        print(f"  ✗ {errores} sesiones con error")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Lectura incremental del JSON exportado (entrenamientos.json).
+
+json.load() necesita el archivo entero en memoria, y las exportaciones con
+muestras de HR de años de sesiones pesan cientos de MB. Este lector recorre el
+objeto de nivel superior en bloques y emite eventos:
+
+    ('valor', (clave, valor))   un campo de nivel superior que no es 'sessions'
+    ('inicio_sesiones', None)   empieza el array de sesiones
+    ('sesion', dict)            una sesión completa
+    ('fin_sesiones', None)      termina el array
+
+Cada valor se decodifica con json.JSONDecoder.raw_decode apenas está completo
+en el buffer, y lo ya consumido se descarta: la memoria máxima es la de una
+sesión más un bloque de lectura. Quien consume los eventos puede cortar en
+cualquier momento (por ejemplo, al encontrar la sesión buscada) sin leer el
+resto del archivo.
+"""
+
+import json
+
+TAMANO_BLOQUE = 1 << 16
+CLAVE_SESIONES = 'sessions'
+_ESPACIOS = ' \t\n\r'
+_CONTINUA_NUMERO = '0123456789.eE+-'
+
+
+class _Buffer(object):
+    """Texto leído del archivo a partir de la posición actual."""
+
+    def __init__(self, f, tamano_bloque=TAMANO_BLOQUE):
+        self.f = f
+        self.tamano_bloque = tamano_bloque
+        self.texto = ''
+        self.pos = 0
+        self.fin_archivo = False
+        self._decoder = json.JSONDecoder()
+
+    def _leer_mas(self, cantidad=None):
+        bloque = self.f.read(cantidad or self.tamano_bloque)
+        if not bloque:
+            self.fin_archivo = True
+            return
+        # Descartar lo consumido antes de agregar
+        self.texto = self.texto[self.pos:] + bloque
+        self.pos = 0
+
+    def caracter(self):
+        """Siguiente carácter que no es espacio (sin consumirlo), '' al final."""
+        while True:
+            while self.pos < len(self.texto) and self.texto[self.pos] in _ESPACIOS:
+                self.pos += 1
+            if self.pos < len(self.texto) or self.fin_archivo:
+                return self.texto[self.pos:self.pos + 1]
+            self._leer_mas()
+
+    def esperar(self, caracteres):
+        c = self.caracter()
+        if c == '' or c not in caracteres:
+            raise ValueError(f"JSON inesperado: se esperaba {caracteres!r} y hay {c!r} "
+                             f"(posición {self.f.tell() - len(self.texto) + self.pos})")
+        self.pos += 1
+        return c
+
+    def valor(self):
+        """Decodifica el siguiente valor JSON completo, leyendo lo que haga falta."""
+        self.caracter()
+        cantidad = self.tamano_bloque
+        while True:
+            try:
+                valor, fin = self._decoder.raw_decode(self.texto, self.pos)
+                # Un número cortado por el bloque ('1.' de '1.25') decodifica
+                # igual: solo vale si lo que sigue ya no puede ser parte de él
+                if self.fin_archivo or (fin < len(self.texto) and self.texto[fin] not in _CONTINUA_NUMERO):
+                    self.pos = fin
+                    return valor
+            except json.JSONDecodeError:
+                if self.fin_archivo:
+                    raise
+            # Valor incompleto: leer más, en bloques cada vez más grandes para
+            # no re-decodificar muchas veces una sesión enorme
+            self._leer_mas(cantidad)
+            cantidad *= 2
+
+
+def eventos(f, clave_sesiones=CLAVE_SESIONES, tamano_bloque=TAMANO_BLOQUE):
+    """Eventos del objeto de nivel superior de un archivo de texto abierto."""
+    buf = _Buffer(f, tamano_bloque)
+    buf.esperar('{')
+    if buf.caracter() == '}':
+        return
+    while True:
+        clave = buf.valor()
+        buf.esperar(':')
+        if clave == clave_sesiones and buf.caracter() == '[':
+            buf.esperar('[')
+            yield 'inicio_sesiones', None
+            if buf.caracter() == ']':
+                buf.esperar(']')
+            else:
+                while True:
+                    yield 'sesion', buf.valor()
+                    if buf.esperar(',]') == ']':
+                        break
+            yield 'fin_sesiones', None
+        else:
+            yield 'valor', (clave, buf.valor())
+        if buf.esperar(',}') == '}':
+            return
+
+
+def iterar_sesiones_json(ruta, clave_sesiones=CLAVE_SESIONES):
+    """Sesiones del archivo exportado, de a una."""
+    with open(ruta, encoding='utf-8') as f:
+        for tipo, dato in eventos(f, clave_sesiones):
+            if tipo == 'sesion':
+                yield dato
+
+
+def buscar_sesion(ruta, predicado, clave_sesiones=CLAVE_SESIONES):
+    """Primera sesión que cumple `predicado` (o None); deja de leer al encontrarla."""
+    for sesion in iterar_sesiones_json(ruta, clave_sesiones):
+        if predicado(sesion):
+            return sesion
+    return None
+
+
+def metadatos(ruta, clave_sesiones=CLAVE_SESIONES):
+    """Campos de nivel superior (sin las sesiones) y la cantidad de sesiones."""
+    datos = {}
+    cantidad = 0
+    with open(ruta, encoding='utf-8') as f:
+        for tipo, dato in eventos(f, clave_sesiones):
+            if tipo == 'valor':
+                datos[dato[0]] = dato[1]
+            elif tipo == 'sesion':
+                cantidad += 1
+    return datos, cantidad
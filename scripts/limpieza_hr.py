@@ -0,0 +1,162 @@
+"""
+Limpieza vectorizada de la serie de HR de una sesión.
+
+_hr_valido() solo descarta valores fuera de 30-250 bpm: los picos dentro de ese
+rango pasan y los descartes dejan huecos irregulares. Aquí, sobre arrays de
+NumPy y en una pasada:
+
+1. se descartan los valores fuera de rango,
+2. se descartan los picos que se alejan más de DESVIO_MAX_BPM de la mediana
+   móvil de las muestras vecinas,
+3. se descartan las muestras a las que se llega con una pendiente imposible
+   (más de PENDIENTE_MAX_BPM_S bpm por segundo) desde la última muestra
+   aceptada,
+4. los huecos de hasta GAP_MAX_S segundos se interpolan linealmente y los más
+   largos quedan enmascarados (NaN).
+
+El resultado es una serie con cadencia uniforme (una muestra cada sample_rate
+segundos) y una máscara de calidad por muestra.
+"""
+
+import warnings
+
+import numpy as np
+
+from calidad_gps import rachas
+
+HR_MIN_VALID = 30
+HR_MAX_VALID = 250
+# Muestras de la mediana móvil (impar)
+VENTANA_MEDIANA = 7
+# Distancia máxima a la mediana móvil antes de considerar la muestra un pico (bpm)
+DESVIO_MAX_BPM = 25
+# Variación máxima plausible de la FC entre muestras (bpm por segundo)
+PENDIENTE_MAX_BPM_S = 5.0
+# Huecos más largos que esto no se interpolan (segundos)
+GAP_MAX_S = 30
+
+# Valores de la máscara de calidad
+FALTANTE = 0
+MEDIDA = 1
+INTERPOLADA = 2
+
+
+def mediana_movil(x, ventana=VENTANA_MEDIANA):
+    """Mediana centrada de `ventana` muestras ignorando NaN (NaN si no hay ninguna)."""
+    if x.size == 0:
+        return x.copy()
+    mitad = ventana // 2
+    relleno = np.concatenate((np.full(mitad, np.nan), x, np.full(mitad, np.nan)))
+    ventanas = np.lib.stride_tricks.sliding_window_view(relleno, ventana)
+    with warnings.catch_warnings():
+        # Ventanas todas NaN: nanmedian avisa y devuelve NaN, que es lo que queremos
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(ventanas, axis=1)
+
+
+def descartes_por_pendiente(x, buenas, sample_rate=5, pendiente_max=PENDIENTE_MAX_BPM_S):
+    """
+    Máscara de las muestras `buenas` a las que se llega con una pendiente
+    imposible desde la última muestra aceptada (aunque haya un hueco entre
+    ellas). Un pico descartado no sirve de referencia, así que la muestra
+    válida que le sigue no se descarta con él.
+
+    Mientras la primera referencia no tenga una sucesora compatible no está
+    confirmada: si la siguiente muestra no es compatible con ella pero sí con
+    la que viene después, se descarta la referencia (un primer valor atípico).
+
+    Máscara iterativa: en cada vuelta se calcula con np.diff la pendiente entre
+    muestras aceptadas consecutivas a partir del último descarte y se descarta
+    la primera incompatible; las anteriores ya quedan confirmadas. Cada vuelta
+    es una operación de NumPy y hay tantas como descartes.
+    """
+    aceptadas = np.flatnonzero(buenas)
+    pendiente = np.zeros(x.size, dtype=bool)
+    limite = pendiente_max * sample_rate
+
+    def compatibles(indices):
+        return np.abs(np.diff(x[indices])) <= limite * np.diff(indices)
+
+    desde = 0
+    while aceptadas.size - desde > 1:
+        incompatibles = np.flatnonzero(~compatibles(aceptadas[desde:]))
+        if incompatibles.size == 0:
+            break
+        k = desde + incompatibles[0]
+        # Con k == 0 la referencia es la primera muestra, todavía sin confirmar
+        if k == 0 and aceptadas.size > 2 and compatibles(aceptadas[1:3])[0]:
+            descartada = 0
+        else:
+            descartada = k + 1
+        pendiente[aceptadas[descartada]] = True
+        aceptadas = np.delete(aceptadas, descartada)
+        desde = k
+    return pendiente
+
+
+def limpiar_hr(hrs, sample_rate=5, ventana=VENTANA_MEDIANA, desvio_max=DESVIO_MAX_BPM,
+               pendiente_max=PENDIENTE_MAX_BPM_S, gap_max_s=GAP_MAX_S):
+    """
+    Limpia una serie de HR decodificada (una muestra cada sample_rate segundos,
+    None o valores fuera de rango permitidos).
+
+    Retorna un dict con 'hr' (array float, NaN donde no hay dato), 'mascara'
+    (uint8: FALTANTE, MEDIDA o INTERPOLADA), los conteos de cada descarte y
+    'calidad' (fracción de la serie con una medición aceptada).
+    """
+    x = np.array([np.nan if hr is None else hr for hr in hrs], dtype=float)
+    n = x.size
+
+    presentes = ~np.isnan(x)
+    en_rango = (x >= HR_MIN_VALID) & (x <= HR_MAX_VALID)
+    x[~en_rango] = np.nan
+
+    # Picos respecto de la mediana de los vecinos válidos
+    mediana = mediana_movil(x, ventana)
+    picos = en_rango & (np.abs(x - mediana) > desvio_max)
+    buenas = en_rango & ~picos
+
+    pendiente = descartes_por_pendiente(x, buenas, sample_rate, pendiente_max)
+    buenas &= ~pendiente
+
+    # Huecos: interpolar los cortos, dejar en NaN los largos y los de los bordes
+    limpia = np.where(buenas, x, np.nan)
+    mascara = np.where(buenas, MEDIDA, FALTANTE).astype(np.uint8)
+    inicios, largos = rachas(~buenas)
+    indices = np.flatnonzero(buenas)
+    cortos = (inicios > 0) & (inicios + largos < n) & (largos * sample_rate <= gap_max_s)
+    if indices.size > 1 and cortos.any():
+        posiciones = np.concatenate([np.arange(i, i + l) for i, l in zip(inicios[cortos], largos[cortos])])
+        limpia[posiciones] = np.interp(posiciones, indices, x[indices])
+        mascara[posiciones] = INTERPOLADA
+
+    return {
+        'hr':                limpia,
+        'mascara':           mascara,
+        'num_muestras':      int(n),
+        'fuera_de_rango':    int((presentes & ~en_rango).sum()),
+        'picos':             int(picos.sum()),
+        'pendiente':         int(pendiente.sum()),
+        'interpoladas':      int((mascara == INTERPOLADA).sum()),
+        'huecos_largos':     int((~cortos & (largos * sample_rate > gap_max_s)).sum()),
+        'faltantes':         int((mascara == FALTANTE).sum()),
+        'calidad':           round(float(buenas.sum()) / n, 3) if n else 0.0,
+    }
+
+
+def resumen(limpieza):
+    """Versión serializable (sin los arrays) para incluir en el JSON exportado."""
+    return {k: v for k, v in limpieza.items() if k not in ('hr', 'mascara')}
+
+
+def serie_serializable(limpieza, sample_rate):
+    """
+    Serie uniforme para el JSON exportado: HR redondeado (null donde falta) y
+    máscara de calidad, una posición cada sample_rate segundos.
+    """
+    hr = limpieza['hr']
+    return {
+        'interval_s': sample_rate,
+        'hr':         [None if np.isnan(v) else int(round(v)) for v in hr.tolist()],
+        'quality':    limpieza['mascara'].tolist(),
+    }
@@ -8,9 +8,6 @@ import sys
 from datetime import datetime
 from pathlib import Path
 
-# Agregar el path de la librería instalada
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
-
 from polar_rcx5_datalink.datalink import DataLink
 from polar_rcx5_datalink.parser import TrainingSession
 from polar_rcx5_datalink.exceptions import ParserError, SyncError
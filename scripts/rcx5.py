@@ -0,0 +1,74 @@
+"""
+Punto de entrada único para los scripts del proyecto.
+
+    python scripts/rcx5.py export        [opciones de exportar_para_dashboard.py]
+    python scripts/rcx5.py diagnose      [opciones de diagnosticar_sesiones.py]
+    python scripts/rcx5.py inspect-json  [opciones de revisar_sesion_json.py]
+    python scripts/rcx5.py intervals     [opciones de segmentacion_esfuerzo.py]
+    python scripts/rcx5.py similar       [opciones de similitud_sesiones.py]
+    python scripts/rcx5.py find-offset   [opciones de encontrar_offset_hr.py]
+    python scripts/rcx5.py export-tcx    [opciones de exportar_tcx.py]
+    python scripts/rcx5.py serve         [opciones de abrir_dashboard.py]
+    python scripts/rcx5.py daemon        [opciones de demonio_sesiones.py]
+
+Este módulo no importa nada pesado: cada subcomando importa su script recién
+cuando se ejecuta, así que `inspect-json` y `serve` arrancan sin cargar la
+librería del reloj (pyusb, pytz, tzlocal, timezonefinder, geopy) ni NumPy.
+Con `--tiempo-inicio` se informa cuánto tardó en importarse el subcomando.
+"""
+
+import importlib
+import sys
+import time
+
+_INICIO = time.perf_counter()
+
+# subcomando → (módulo, descripción)
+SUBCOMANDOS = {
+    'export':       ('exportar_para_dashboard', 'Exportar sesiones del reloj a JSON para el dashboard'),
+    'diagnose':     ('diagnosticar_sesiones', 'Diagnóstico de parsing y laps (interactivo o --reporte)'),
+    'inspect-json': ('revisar_sesion_json', 'Analizar una sesión del JSON exportado'),
+    'intervals':    ('segmentacion_esfuerzo', 'Tramos de trabajo/descanso de todas las sesiones del JSON'),
+    'similar':      ('similitud_sesiones', 'Sesiones más parecidas a una sesión exportada'),
+    'find-offset':  ('encontrar_offset_hr', 'Calibrar el offset del HR inicial en sesiones con GPS'),
+    'export-tcx':   ('exportar_tcx', 'Exportar sesiones a TCX/GPX en streaming, un archivo por sesión'),
+    'serve':        ('abrir_dashboard', 'Servir el dashboard en un servidor HTTP local'),
+    'daemon':       ('demonio_sesiones', 'Sincronizar una vez y servir las sesiones decodificadas por socket'),
+}
+
+
+def mostrar_ayuda():
+    print("Uso: python scripts/rcx5.py [--tiempo-inicio] <subcomando> [opciones]\n")
+    print("Subcomandos:")
+    for nombre, (_, descripcion) in SUBCOMANDOS.items():
+        print(f"  {nombre:<14} {descripcion}")
+    print("\nUsa 'python scripts/rcx5.py <subcomando> --help' para ver sus opciones.")
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+
+    medir = '--tiempo-inicio' in argv
+    if medir:
+        argv.remove('--tiempo-inicio')
+
+    if not argv or argv[0] in ('-h', '--help'):
+        mostrar_ayuda()
+        return 0
+
+    subcomando, resto = argv[0], argv[1:]
+    if subcomando not in SUBCOMANDOS:
+        print(f"Subcomando desconocido: {subcomando}\n")
+        mostrar_ayuda()
+        return 2
+
+    modulo = importlib.import_module(SUBCOMANDOS[subcomando][0])
+    if medir:
+        ms = (time.perf_counter() - _INICIO) * 1000
+        print(f"[rcx5] {subcomando}: listo en {ms:.0f} ms", file=sys.stderr)
+
+    return modulo.main(resto)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
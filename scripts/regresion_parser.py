@@ -0,0 +1,356 @@
+"""
+Prueba de regresión diferencial de los decodificadores de HR y laps.
+
+Corre el decodificador actual (el del exportador) y uno de referencia sobre un
+corpus de sesiones crudas guardadas (un JSON por sesión, formato de
+`polar export raw`), en paralelo, y compara sesión por sesión:
+
+- el array de HR (segundo y valor de cada muestra válida),
+- la lista de laps,
+- las estadísticas (HR promedio/máximo/mínimo, cantidad de muestras y laps).
+
+La salida de referencia se guarda en una caché "golden" indexada por el hash
+del archivo crudo, así que las sesiones que no cambiaron no se vuelven a
+decodificar con la referencia. Cualquier reescritura por rendimiento de los
+decodificadores tiene que dar 0 divergencias.
+
+Uso:
+    python scripts/regresion_parser.py sesiones_crudas/
+    python scripts/regresion_parser.py sesiones_crudas/ --reporte regresion.jsonl --workers 8
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from polar_rcx5_datalink.parser import Sample, SampleFields, TrainingSession
+import distancia_gps
+import zona_horaria
+
+zona_horaria.parchear()
+distancia_gps.parchear()
+
+HR_MIN_VALID = 30
+HR_MAX_VALID = 250
+LAP_DATA_BITS = 416
+LAP_DENSITY_MAX = 0.15
+
+# Decodificadores por defecto (modulo:funcion, raw_session → salida normalizada)
+DECODIFICADOR_ACTUAL = 'regresion_parser:salida_actual'
+DECODIFICADOR_REFERENCIA = 'regresion_parser:salida_referencia'
+# Subir cuando cambie salida_referencia: invalida las cachés golden
+VERSION_REFERENCIA = 4
+
+# Subdirectorio del corpus donde se guardan las salidas de referencia
+DIRECTORIO_GOLDEN = '.golden'
+
+CLAVES_STATS = ('duration_seconds', 'hr_avg', 'hr_max', 'hr_min', 'num_hr_samples', 'num_laps')
+
+
+def _hr_valido(hr):
+    return hr is not None and HR_MIN_VALID <= hr <= HR_MAX_VALID
+
+
+def _cantidad_validas(hrs):
+    return sum(1 for hr in hrs if _hr_valido(hr))
+
+
+def _normalizar(salida):
+    """Pasa la salida por JSON para comparar igual una salida nueva y una cacheada."""
+    return json.loads(json.dumps(salida))
+
+
+def salida_actual(raw_session):
+    """Salida del exportador (parsear_sesion_completa) en formato comparable."""
+    from exportar_para_dashboard import parsear_sesion_completa
+
+    datos = parsear_sesion_completa(raw_session)
+    return {
+        'hr':    [[s['time_seconds'], s['hr']] for s in datos.get('hr_samples', [])],
+        'laps':  [[l['lap_number'], l['time_seconds']] for l in datos.get('laps', [])],
+        'stats': {k: datos.get(k) for k in CLAVES_STATS},
+    }
+
+
+def _muestras_sin_gps_referencia(sess):
+    """
+    HR y laps de referencia de una sesión sin GPS: los primitivos de la
+    librería (_process_hr_bits/_parse_hr) muestra a muestra, y antes de cada
+    muestra un detector de laps que cuenta los unos de las ventanas de
+    LAP_DATA_BITS con str.count y salta el bloque. No usa decodificador_hr ni PerfilDensidad,
+    así que sirve de referencia para ambos. Retorna (hrs, laps).
+    """
+    bits        = sess._samples_bits
+    sample_rate = sess.info.get('sample_rate', 5)
+    laps        = []
+
+    hr, _, largo = sess._process_hr_bits(bits[:11])
+    sess._cursor = largo
+    sess.samples = [Sample(hr)]
+    while sess._cursor < len(bits) and len(sess._next_bits(7)) > 5:
+        cursor = sess._cursor
+        if cursor + LAP_DATA_BITS <= len(bits):
+            unos = bits[cursor:cursor + LAP_DATA_BITS].count('1')
+            # El bloque empieza donde la ventana tiene menos unos, no en
+            # cuanto baja del umbral
+            siguientes = range(cursor + 1, min(cursor + LAP_DATA_BITS, len(bits) - LAP_DATA_BITS + 1))
+            if (unos / LAP_DATA_BITS < LAP_DENSITY_MAX
+                    and all(unos <= bits[i:i + LAP_DATA_BITS].count('1') for i in siguientes)):
+                laps.append([len(laps) + 1, len(sess.samples) * sample_rate])
+                sess._cursor += LAP_DATA_BITS
+                sess._reset_zero_delta_counter(SampleFields.HR)
+                continue
+        sess.samples.append(Sample(sess._parse_hr()))
+
+    return [s.hr for s in sess.samples], laps
+
+
+def _muestras_con_gps_referencia(raw_session):
+    """HR de parse_samples() de la librería en modo GPS (las muestras que alcance a leer si falla)."""
+    sess = TrainingSession(raw_session)
+    with warnings.catch_warnings():
+        # Si en realidad no hay GPS, geopy avisa por las coordenadas absurdas
+        warnings.simplefilter('ignore')
+        try:
+            sess.parse_samples()
+        except Exception:
+            pass
+    return sess, [s.hr for s in sess.samples]
+
+
+def _salida_de_sesion(sess, hrs, laps):
+    """Salida comparable a partir de la sesión (header) y de sus muestras y laps decodificados."""
+    sample_rate = sess.info.get('sample_rate', 5)
+    hr = [[i * sample_rate, v] for i, v in enumerate(hrs) if _hr_valido(v)] if sess.has_hr else []
+    info = sess.info
+    return {
+        'hr':    hr,
+        'laps':  laps,
+        'stats': {
+            'duration_seconds': sess.duration,
+            'hr_avg':           info.get('hr_avg') if sess.has_hr and _hr_valido(info.get('hr_avg')) else None,
+            'hr_max':           info.get('hr_max') if sess.has_hr and _hr_valido(info.get('hr_max')) else None,
+            'hr_min':           info.get('hr_min') if sess.has_hr and _hr_valido(info.get('hr_min')) else None,
+            'num_hr_samples':   len(hr),
+            'num_laps':         len(laps),
+        },
+    }
+
+
+def salida_referencia(raw_session):
+    """
+    Salida de referencia, sin usar deteccion_gps ni ensamblado para elegir el
+    modo: si el header dice que hay GPS y hay HR, se decodifica la sesión
+    entera con la librería en los dos modos y gana el que da más muestras de
+    HR en rango (sin GPS gana el empate). Sin GPS, las muestras y los laps
+    salen de _muestras_sin_gps_referencia; con GPS el parser de la librería
+    salta los bloques de lap y el exportador no los detecta, así que no hay
+    laps.
+    """
+    sess = TrainingSession(raw_session)
+    if sess.has_gps and not sess.has_hr:
+        return _salida_de_sesion(sess, [], [])
+
+    con_gps = None
+    if sess.has_gps:
+        con_gps, hrs_con_gps = _muestras_con_gps_referencia(raw_session)
+        sess.has_gps = False
+        sess._samples_bits = sess._get_samples_bits()
+    try:
+        hrs, laps = _muestras_sin_gps_referencia(sess)
+    except Exception:
+        hrs, laps = [], []
+
+    if con_gps is not None and _cantidad_validas(hrs_con_gps) > _cantidad_validas(hrs):
+        return _salida_de_sesion(con_gps, hrs_con_gps, [])
+    return _salida_de_sesion(sess, hrs, laps)
+
+
+def _resolver(especificacion):
+    """'modulo:funcion' → función."""
+    modulo, _, funcion = especificacion.partition(':')
+    return getattr(importlib.import_module(modulo), funcion)
+
+
+def _ejecutar(especificacion, raw_session):
+    """Corre un decodificador y mide el tiempo. Retorna (salida, segundos)."""
+    inicio = time.perf_counter()
+    try:
+        salida = _normalizar(_resolver(especificacion)(raw_session))
+    except Exception as e:
+        salida = {'error': f"{type(e).__name__}: {e}"}
+    return salida, time.perf_counter() - inicio
+
+
+def comparar(referencia, actual):
+    """
+    Diferencias entre dos salidas normalizadas. Retorna un dict vacío si son
+    idénticas.
+    """
+    if 'error' in referencia or 'error' in actual:
+        if referencia.get('error') == actual.get('error'):
+            return {}
+        return {'error_referencia': referencia.get('error'), 'error_actual': actual.get('error')}
+
+    diferencias = {}
+    hr_ref, hr_act = referencia['hr'], actual['hr']
+    if hr_ref != hr_act:
+        primera = next(
+            (i for i, (a, b) in enumerate(zip(hr_ref, hr_act)) if a != b),
+            min(len(hr_ref), len(hr_act)),
+        )
+        diferencias['hr'] = {
+            'muestras_referencia': len(hr_ref),
+            'muestras_actual':     len(hr_act),
+            'primera_divergencia': primera,
+            'referencia':          hr_ref[primera] if primera < len(hr_ref) else None,
+            'actual':              hr_act[primera] if primera < len(hr_act) else None,
+        }
+
+    if referencia['laps'] != actual['laps']:
+        diferencias['laps'] = {'referencia': referencia['laps'], 'actual': actual['laps']}
+
+    stats = {
+        k: [referencia['stats'].get(k), actual['stats'].get(k)]
+        for k in CLAVES_STATS
+        if referencia['stats'].get(k) != actual['stats'].get(k)
+    }
+    if stats:
+        diferencias['stats'] = stats
+
+    return diferencias
+
+
+def verificar_archivo(archivo, actual, referencia, directorio_golden):
+    """
+    Compara ambos decodificadores sobre una sesión del corpus. La salida de
+    referencia se toma de la caché golden si el archivo no cambió.
+    """
+    contenido = Path(archivo).read_bytes()
+    raw_session = json.loads(contenido)
+    huella = hashlib.sha256(contenido).hexdigest()
+    golden = Path(directorio_golden) / f"{huella}.json"
+
+    fila = {'archivo': Path(archivo).name, 'hash': huella[:16]}
+
+    if golden.exists():
+        cache = json.loads(golden.read_text(encoding='utf-8'))
+        salida_ref, t_ref = cache['salida'], cache['segundos']
+        fila['golden'] = True
+    else:
+        salida_ref, t_ref = _ejecutar(referencia, raw_session)
+        temporal = golden.with_suffix('.tmp')
+        temporal.write_text(json.dumps({'salida': salida_ref, 'segundos': t_ref}), encoding='utf-8')
+        temporal.replace(golden)
+        fila['golden'] = False
+
+    salida_act, t_act = _ejecutar(actual, raw_session)
+    diferencias = comparar(salida_ref, salida_act)
+
+    fila.update({
+        'identica':            not diferencias,
+        'segundos_referencia': round(t_ref, 4),
+        'segundos_actual':     round(t_act, 4),
+        'aceleracion':         round(t_ref / t_act, 2) if t_act > 0 else None,
+        'diferencias':         diferencias,
+    })
+    return fila
+
+
+def correr_regresion(corpus, actual=DECODIFICADOR_ACTUAL, referencia=DECODIFICADOR_REFERENCIA,
+                     workers=None, directorio_golden=None):
+    """
+    Corre la comparación sobre todos los *.json del corpus en un pool de
+    procesos. Retorna la lista de filas (una por sesión, en orden de archivo).
+    """
+    archivos = sorted(str(p) for p in Path(corpus).glob('*.json'))
+
+    # Una caché por decodificador de referencia: cambiarlo invalida los golden
+    slug = f"{referencia.replace(':', '.')}.v{VERSION_REFERENCIA}"
+    directorio_golden = Path(directorio_golden or Path(corpus) / DIRECTORIO_GOLDEN) / slug
+    directorio_golden.mkdir(parents=True, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    n = len(archivos)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(
+            verificar_archivo, archivos,
+            [actual] * n, [referencia] * n, [str(directorio_golden)] * n,
+            chunksize=max(1, n // (workers * 4)),
+        ))
+
+
+def mostrar_resumen(filas, segundos):
+    divergentes = [f for f in filas if not f['identica']]
+    t_ref = sum(f['segundos_referencia'] for f in filas)
+    t_act = sum(f['segundos_actual'] for f in filas)
+    cacheadas = sum(1 for f in filas if f['golden'])
+
+    print(f"\n{'='*80}")
+    print("REGRESIÓN DEL PARSER")
+    print(f"{'='*80}")
+    print(f"  Sesiones:            {len(filas)}  (referencia desde golden: {cacheadas})")
+    print(f"  Idénticas:           {len(filas) - len(divergentes)}")
+    print(f"  Divergentes:         {len(divergentes)}")
+    if t_act > 0:
+        print(f"  Tiempo decodificando: referencia {t_ref:.2f}s  |  actual {t_act:.2f}s  "
+              f"({t_ref / t_act:.2f}x)")
+    print(f"  Tiempo total:        {segundos:.1f}s")
+
+    for f in divergentes:
+        print(f"\n  ✗ {f['archivo']}")
+        dif = f['diferencias']
+        if 'hr' in dif:
+            h = dif['hr']
+            print(f"    HR: {h['muestras_referencia']} vs {h['muestras_actual']} muestras, "
+                  f"primera diferencia en #{h['primera_divergencia']}: {h['referencia']} → {h['actual']}")
+        if 'laps' in dif:
+            print(f"    Laps: {dif['laps']['referencia']} → {dif['laps']['actual']}")
+        if 'stats' in dif:
+            for k, (a, b) in dif['stats'].items():
+                print(f"    {k}: {a} → {b}")
+        if 'error_referencia' in dif or 'error_actual' in dif:
+            print(f"    Error: {dif.get('error_referencia')} → {dif.get('error_actual')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compara el decodificador actual con uno de referencia sobre un corpus de sesiones crudas.')
+    parser.add_argument('corpus', help='Directorio con sesiones crudas (un JSON por sesión)')
+    zona_horaria.agregar_argumento(parser)
+    parser.add_argument('--actual', default=DECODIFICADOR_ACTUAL,
+                        help='Decodificador a probar, como modulo:funcion')
+    parser.add_argument('--referencia', default=DECODIFICADOR_REFERENCIA,
+                        help='Decodificador de referencia, como modulo:funcion')
+    parser.add_argument('--golden', metavar='DIR', default=None,
+                        help=f'Directorio de la caché golden (por defecto, CORPUS/{DIRECTORIO_GOLDEN})')
+    parser.add_argument('--reporte', metavar='RUTA', default=None,
+                        help='Escribir una fila JSON por sesión (JSON Lines)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos en paralelo (por defecto, uno por CPU)')
+    args = parser.parse_args(argv)
+    zona_horaria.instalar(args.timezone)
+
+    inicio = time.perf_counter()
+    filas = correr_regresion(args.corpus, args.actual, args.referencia, args.workers, args.golden)
+    mostrar_resumen(filas, time.perf_counter() - inicio)
+
+    if args.reporte:
+        with open(args.reporte, 'w', encoding='utf-8') as f:
+            for fila in filas:
+                f.write(json.dumps(fila, ensure_ascii=False) + '\n')
+        print(f"\n✓ Reporte guardado en {args.reporte}")
+
+    # Código de salida distinto de 0 si hay divergencias
+    sys.exit(1 if any(not f['identica'] for f in filas) else 0)
+
+
+if __name__ == '__main__':
+    main()
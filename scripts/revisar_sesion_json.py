@@ -2,10 +2,12 @@
 Script para revisar una sesión específica desde el archivo JSON exportado
 """
 
-import json
+import argparse
 from pathlib import Path
 from datetime import datetime
 
+from lector_json import iterar_sesiones_json
+
 
 def analizar_sesion_desde_json(sesion):
     """Analiza una sesión desde los datos JSON."""
@@ -156,13 +158,27 @@ def analizar_sesion_desde_json(sesion):
             print("⚠️ PROMEDIO DESVIADO: Diferencia >20 bpm con header")
 
 
-def main():
+# Exportación por defecto y sesión a buscar (YYYY-MM-DD)
+ARCHIVO_JSON = Path(r'C:\Users\Pablo\Desktop\entrenamientos_dashboard\entrenamientos.json')
+FECHA_BUSCADA = '2026-02-13'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analiza una sesión del JSON exportado para el dashboard.')
+    parser.add_argument('--archivo', type=Path, default=ARCHIVO_JSON,
+                        help='JSON exportado por exportar_para_dashboard.py')
+    parser.add_argument('--fecha', default=FECHA_BUSCADA,
+                        help='Fecha de la sesión a analizar (YYYY-MM-DD)')
+    args = parser.parse_args(argv)
+    fecha_buscada = args.fecha
+    fecha_titulo = datetime.strptime(fecha_buscada, '%Y-%m-%d').strftime('%d/%m/%Y')
+
     print("="*80)
-    print("ANÁLISIS DE SESIÓN DESDE JSON - 13/2/2026")
+    print(f"ANÁLISIS DE SESIÓN DESDE JSON - {fecha_titulo}")
     print("="*80)
     
     # Buscar archivo JSON
-    json_file = Path(r'C:\Users\Pablo\Desktop\entrenamientos_dashboard\entrenamientos.json')
+    json_file = args.archivo
     
     if not json_file.exists():
         print(f"\n❌ No se encontró el archivo: {json_file}")
@@ -171,35 +187,30 @@ def main():
         return
     
     try:
-        # Leer JSON
+        # Recorrer las sesiones de a una: no se carga el archivo entero
         print(f"\nLeyendo archivo: {json_file}")
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        sessions = data.get('sessions', [])
-        print(f"✓ Archivo cargado: {len(sessions)} sesiones encontradas")
-        
-        # Buscar sesión del 13/2/2026
-        print(f"\nBuscando sesión del 13/2/2026...")
+        print(f"\nBuscando sesión del {fecha_titulo}...")
         sesion_encontrada = None
+        # Solo fecha y HR promedio de las ya vistas, para listarlas si no aparece
+        vistas = []
         
-        for sesion in sessions:
+        for sesion in iterar_sesiones_json(json_file):
             start_time = sesion.get('start_time', '')
-            if '2026-02-13' in start_time:
+            if fecha_buscada in start_time:
                 fecha = datetime.fromisoformat(start_time).strftime('%d/%m/%Y %H:%M:%S')
-                print(f"✓ Sesión encontrada: {fecha}")
+                print(f"✓ Sesión encontrada: {fecha} (sesión {len(vistas) + 1} del archivo)")
                 sesion_encontrada = sesion
                 analizar_sesion_desde_json(sesion)
                 break
+            vistas.append((start_time, sesion.get('hr_avg', 'N/A')))
         
         if not sesion_encontrada:
-            print(f"\n⚠️ No se encontró ninguna sesión del 13/2/2026")
+            print(f"✓ Archivo leído: {len(vistas)} sesiones encontradas")
+            print(f"\n⚠️ No se encontró ninguna sesión del {fecha_titulo}")
             print(f"\nSesiones disponibles (todas):")
-            for sesion in sessions:
+            for start_time, hr_avg in vistas:
                 try:
-                    start_time = sesion.get('start_time', '')
                     fecha = datetime.fromisoformat(start_time).strftime('%d/%m/%Y %H:%M:%S')
-                    hr_avg = sesion.get('hr_avg', 'N/A')
                     print(f"  - {fecha} | HR: {hr_avg} bpm")
                 except:
                     print(f"  - (sesión con error)")
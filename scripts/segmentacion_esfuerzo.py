@@ -0,0 +1,215 @@
+"""
+Segmentación automática de esfuerzos (trabajo/descanso) sobre la serie de HR.
+
+Los laps solo existen si se apretó el botón, y detectar_laps_nogps solo
+encuentra esos bloques explícitos. Aquí los cortes se buscan en la propia
+serie de HR limpia (limpieza_hr) con segmentación binaria:
+
+1. Con las sumas acumuladas de la serie, la ganancia de cortar un tramo
+   [a, b) en cada posición k se calcula de una vez para todas las k
+   (reducción del error cuadrático: n1·n2/n · (media1 − media2)²).
+2. Si la mejor ganancia supera la penalización (proporcional a la varianza del
+   ruido y a log n) y las medias difieren al menos DIFERENCIA_MIN_BPM, se
+   corta ahí y se repite en cada mitad. Tramos de menos de DURACION_MIN_S no
+   se cortan.
+
+Cada nivel de la recursión recorre la serie una vez, así que el costo es
+O(n log n) y una sesión de horas se segmenta en milisegundos. Los tramos se
+clasifican en 'work' o 'rest' según su HR promedio (o 'steady' si la sesión
+no tiene cambios de esfuerzo marcados), y sus estadísticas salen de
+estadisticas_laps. El exportador guarda el resultado en el JSON
+('effort_segments', 'effort_summary'); el subcomando `intervals` lo lee de
+ahí para analizar todo el archivo sin volver a segmentar.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from estadisticas_laps import estadisticas_por_lap
+from lector_json import iterar_sesiones_json
+from revisar_sesion_json import ARCHIVO_JSON
+
+# Duración mínima de un tramo (segundos)
+DURACION_MIN_S = 60
+# Diferencia mínima de HR promedio entre tramos contiguos para cortar (bpm)
+DIFERENCIA_MIN_BPM = 8
+# Multiplicador de la penalización σ²·log(n) de cada corte
+PENALIZACION = 3.0
+# Si los promedios de los tramos no se separan al menos esto, la sesión es continua (bpm)
+RANGO_INTERVALOS_BPM = 15
+
+
+def _rellenar(hr):
+    """Serie sin NaN (interpolación lineal, bordes con el valor más cercano) para buscar cortes."""
+    validas = ~np.isnan(hr)
+    if validas.all():
+        return hr
+    indices = np.flatnonzero(validas)
+    return np.interp(np.arange(hr.size), indices, hr[indices])
+
+
+def _varianza_ruido(x):
+    """Varianza del ruido muestra a muestra estimada con la MAD de las diferencias (robusta a los cortes)."""
+    if x.size < 3:
+        return 1.0
+    dif = np.diff(x)
+    sigma = np.median(np.abs(dif - np.median(dif))) / 0.6745 / np.sqrt(2)
+    return max(float(sigma) ** 2, 1.0)
+
+
+def puntos_de_cambio(x, largo_min, penalizacion, diferencia_min=DIFERENCIA_MIN_BPM):
+    """
+    Índices de corte (ordenados) de la serie `x` por segmentación binaria sobre
+    sumas acumuladas. Cada tramo resultante tiene al menos `largo_min` muestras.
+    """
+    n = x.size
+    acumulada = np.concatenate(([0.0], np.cumsum(x)))
+    cortes = []
+    pendientes = [(0, n)]
+    while pendientes:
+        a, b = pendientes.pop()
+        if b - a < 2 * largo_min:
+            continue
+        k = np.arange(a + largo_min, b - largo_min + 1)
+        n1 = k - a
+        n2 = b - k
+        media1 = (acumulada[k] - acumulada[a]) / n1
+        media2 = (acumulada[b] - acumulada[k]) / n2
+        ganancia = n1 * n2 / (b - a) * (media1 - media2) ** 2
+        i = int(np.argmax(ganancia))
+        if ganancia[i] <= penalizacion or abs(media1[i] - media2[i]) < diferencia_min:
+            continue
+        corte = int(k[i])
+        cortes.append(corte)
+        pendientes.append((a, corte))
+        pendientes.append((corte, b))
+    return sorted(cortes)
+
+
+def _clasificar(promedios):
+    """Tipo de cada tramo según su HR promedio (None si el tramo no tiene datos)."""
+    conocidos = [p for p in promedios if p is not None]
+    if len(conocidos) < 2 or max(conocidos) - min(conocidos) < RANGO_INTERVALOS_BPM:
+        return ['steady' if p is not None else 'no_data' for p in promedios]
+    umbral = (max(conocidos) + min(conocidos)) / 2
+    return ['no_data' if p is None else ('work' if p >= umbral else 'rest') for p in promedios]
+
+
+def segmentar_esfuerzo(hr, sample_rate=5, duracion=None, duracion_min_s=DURACION_MIN_S,
+                       diferencia_min=DIFERENCIA_MIN_BPM, penalizacion=PENALIZACION):
+    """
+    Tramos de esfuerzo de una serie de HR uniforme (array float, NaN donde no
+    hay dato, una muestra cada sample_rate segundos).
+
+    Retorna una lista de dicts con segment_number, kind ('work', 'rest',
+    'steady' o 'no_data') y las estadísticas de estadisticas_por_lap
+    (start_seconds, end_seconds, duration_seconds, hr_avg, hr_max, hr_min,
+    hr_drift, num_samples). Lista vacía si la serie no tiene HR.
+    """
+    hr = np.asarray(hr, dtype=float)
+    if hr.size == 0 or np.isnan(hr).all():
+        return []
+    x = _rellenar(hr)
+    largo_min = max(1, int(round(duracion_min_s / sample_rate)))
+    pen = penalizacion * _varianza_ruido(x) * np.log(x.size)
+    cortes = puntos_de_cambio(x, largo_min, pen, diferencia_min)
+
+    # estadisticas_por_lap calcula todos los tramos de una vez a partir de los
+    # cortes; el corte en 0 deja un primer tramo vacío que se descarta
+    tramos = estadisticas_por_lap(hr, [{'time_seconds': c * sample_rate} for c in [0] + cortes],
+                                  sample_rate, duracion)[1:]
+
+    tipos = _clasificar([t['hr_avg'] for t in tramos])
+    segmentos = []
+    for numero, (tramo, tipo) in enumerate(zip(tramos, tipos), 1):
+        del tramo['lap_number']
+        segmento = {'segment_number': numero, 'kind': tipo}
+        segmento.update(tramo)
+        segmentos.append(segmento)
+    return segmentos
+
+
+def resumen_esfuerzo(segmentos):
+    """Totales de trabajo/descanso de una sesión segmentada."""
+    def _totales(tipo):
+        tramos = [s for s in segmentos if s['kind'] == tipo]
+        segundos = sum(s['duration_seconds'] for s in tramos)
+        con_hr = [s for s in tramos if s['hr_avg'] is not None and s['num_samples']]
+        muestras = sum(s['num_samples'] for s in con_hr)
+        hr_avg = round(sum(s['hr_avg'] * s['num_samples'] for s in con_hr) / muestras, 1) if muestras else None
+        return len(tramos), segundos, hr_avg
+
+    num_trabajo, seg_trabajo, hr_trabajo = _totales('work')
+    num_descanso, seg_descanso, hr_descanso = _totales('rest')
+    return {
+        'num_segments':  len(segmentos),
+        'num_work':      num_trabajo,
+        'work_seconds':  seg_trabajo,
+        'work_hr_avg':   hr_trabajo,
+        'num_rest':      num_descanso,
+        'rest_seconds':  seg_descanso,
+        'rest_hr_avg':   hr_descanso,
+        'is_interval':   num_trabajo >= 2 and num_descanso >= 1,
+    }
+
+
+def segmentos_de_sesion(sesion, recalcular=False):
+    """
+    Tramos de una sesión del JSON exportado: los guardados por el exportador,
+    o calculados desde 'hr_series' si no están (exportaciones viejas) o si se
+    pide recalcular.
+    """
+    if not recalcular and 'effort_segments' in sesion:
+        return sesion['effort_segments']
+    serie = sesion.get('hr_series')
+    if not serie:
+        return []
+    hr = np.array([np.nan if v is None else v for v in serie['hr']], dtype=float)
+    return segmentar_esfuerzo(hr, serie['interval_s'], sesion.get('duration_seconds'))
+
+
+def _formatear_duracion(segundos):
+    return f"{segundos // 60}:{segundos % 60:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Análisis de intervalos de todas las sesiones del JSON exportado.')
+    parser.add_argument('--archivo', type=Path, default=ARCHIVO_JSON,
+                        help='JSON exportado por exportar_para_dashboard.py')
+    parser.add_argument('--recalcular', action='store_true',
+                        help='Volver a segmentar desde hr_series en lugar de usar lo guardado')
+    parser.add_argument('--solo-intervalos', action='store_true',
+                        help='Listar solo las sesiones con estructura de intervalos')
+    args = parser.parse_args(argv)
+
+    if not args.archivo.exists():
+        print(f"❌ No se encontró el archivo: {args.archivo}")
+        return 1
+
+    inicio = time.perf_counter()
+    total = intervalos = 0
+    for sesion in iterar_sesiones_json(args.archivo):
+        total += 1
+        segmentos = segmentos_de_sesion(sesion, args.recalcular)
+        if not segmentos:
+            continue
+        resumen = resumen_esfuerzo(segmentos)
+        intervalos += resumen['is_interval']
+        if args.solo_intervalos and not resumen['is_interval']:
+            continue
+        tipos = ''.join({'work': 'T', 'rest': 'd', 'steady': '=', 'no_data': '?'}[s['kind']] for s in segmentos)
+        hr_trabajo = resumen['work_hr_avg'] if resumen['work_hr_avg'] is not None else '-'
+        print(f"{sesion.get('start_time', '?')[:16]:16s}  {resumen['num_work']:2d}×trabajo "
+              f"{_formatear_duracion(resumen['work_seconds']):>7s}  HR {hr_trabajo!s:>5s}  {tipos}")
+
+    ms = (time.perf_counter() - inicio) * 1000
+    print(f"\n{total} sesiones, {intervalos} con intervalos ({ms:.0f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
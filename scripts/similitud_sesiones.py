@@ -0,0 +1,209 @@
+"""
+Búsqueda de sesiones parecidas sobre un índice de vectores precalculados.
+
+Para cada sesión exportada se arma un vector de largo fijo:
+
+- perfil de HR: la serie limpia (hr_series) remuestreada a PUNTOS_PERFIL
+  puntos sobre el tiempo normalizado de la sesión,
+- fracción del tiempo en cada zona de FC (porcentajes de FC_MAXIMA),
+- duración, cantidad de laps y de tramos de trabajo (effort_summary).
+
+Las columnas se estandarizan con la media y el desvío del archivo y cada grupo
+se pondera (PESOS) para que el perfil, con muchas columnas, no tape al resto.
+El exportador indexa todo el historial de sesiones únicas (deduplicacion), no
+solo el período exportado, y guarda la matriz ya normalizada en similitud.npz;
+una consulta es una resta y una suma por filas sobre esa matriz (NumPy), así
+que los k vecinos de una sesión salen en milisegundos sin tocar las muestras
+crudas.
+
+    python scripts/rcx5.py similar --fecha 2026-02-13 -k 5
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from carga_entrenamiento import FC_MAXIMA
+from eventos_dashboard import clave_sesion
+from revisar_sesion_json import ARCHIVO_JSON
+
+ARCHIVO_SIMILITUD = 'similitud.npz'
+# Subir cuando cambie la composición del vector
+VERSION_SIMILITUD = 1
+PUNTOS_PERFIL = 24
+# Límites inferiores de las zonas de FC (fracción de FC_MAXIMA)
+ZONAS = (0.5, 0.6, 0.7, 0.8, 0.9)
+# Peso total de cada grupo de columnas en la distancia
+PESOS = {'perfil': 2.0, 'zonas': 1.0, 'duracion': 1.0, 'laps': 0.5, 'trabajo': 0.5}
+VECINOS = 5
+
+
+def _grupos():
+    """Grupo de cada columna del vector, en orden."""
+    return (['perfil'] * PUNTOS_PERFIL + ['zonas'] * len(ZONAS) +
+            ['duracion', 'laps', 'trabajo'])
+
+
+def vector_sesion(sesion, fc_max=FC_MAXIMA):
+    """
+    Vector de características (sin normalizar) de una sesión del JSON
+    exportado, o None si no tiene serie de HR utilizable.
+    """
+    serie = sesion.get('hr_series')
+    if not serie:
+        return None
+    hr = np.array([np.nan if v is None else v for v in serie['hr']], dtype=float)
+    validas = np.flatnonzero(~np.isnan(hr))
+    if validas.size < 2:
+        return None
+
+    # Perfil: interpolación sobre el tiempo normalizado (los huecos quedan puenteados)
+    t = validas / (hr.size - 1)
+    perfil = np.interp(np.linspace(0, 1, PUNTOS_PERFIL), t, hr[validas])
+
+    limites = np.append(np.array(ZONAS) * fc_max, np.inf)
+    conteo, _ = np.histogram(hr[validas], bins=limites)
+    zonas = conteo / validas.size
+
+    resumen = sesion.get('effort_summary') or {}
+    extra = [
+        sesion.get('duration_seconds', 0) / 60,
+        sesion.get('num_laps', 0),
+        resumen.get('num_work', 0),
+    ]
+    return np.concatenate((perfil, zonas, extra))
+
+
+def construir_indice(sesiones, fc_max=FC_MAXIMA):
+    """
+    Índice de similitud de una lista de sesiones exportadas: dict de arrays
+    (vectores normalizados y ponderados, claves, fechas, duraciones, HR
+    promedio, media y escala de cada columna). Las sesiones sin serie de HR
+    no se indexan.
+    """
+    filas, claves, fechas, duraciones, hr_avg = [], [], [], [], []
+    for sesion in sesiones:
+        vector = vector_sesion(sesion, fc_max)
+        if vector is None:
+            continue
+        filas.append(vector)
+        claves.append(str(clave_sesion(sesion)))
+        fechas.append(sesion.get('start_time') or '')
+        duraciones.append(sesion.get('duration_seconds') or 0)
+        hr_avg.append(np.nan if sesion.get('hr_avg') is None else sesion['hr_avg'])
+
+    crudos = np.array(filas, dtype=float).reshape(len(filas), len(_grupos()))
+    media = crudos.mean(axis=0) if filas else np.zeros(crudos.shape[1])
+    desvio = crudos.std(axis=0) if filas else np.ones(crudos.shape[1])
+    desvio[desvio == 0] = 1.0
+    grupos = _grupos()
+    escala = np.array([PESOS[g] / np.sqrt(grupos.count(g)) for g in grupos]) / desvio
+
+    return {
+        'version':    np.array(VERSION_SIMILITUD),
+        'vectores':   ((crudos - media) * escala).astype(np.float32),
+        'claves':     np.array(claves, dtype=str),
+        'fechas':     np.array(fechas, dtype=str),
+        'duraciones': np.array(duraciones, dtype=np.int64),
+        'hr_avg':     np.array(hr_avg, dtype=float),
+        'media':      media,
+        'escala':     escala,
+    }
+
+
+def guardar_indice(indice, ruta):
+    temporal = Path(ruta).with_name(Path(ruta).name + '.tmp.npz')
+    np.savez(temporal, **indice)
+    temporal.replace(ruta)
+
+
+def cargar_indice(ruta):
+    """Índice guardado por guardar_indice(), o None si no existe o es de otra versión."""
+    try:
+        with np.load(ruta, allow_pickle=False) as archivo:
+            indice = {k: archivo[k] for k in archivo.files}
+    except (OSError, ValueError):
+        return None
+    if int(indice.get('version', -1)) != VERSION_SIMILITUD:
+        return None
+    return indice
+
+
+def normalizar(indice, vector):
+    """Lleva un vector de vector_sesion() al espacio del índice (para sesiones no indexadas)."""
+    return ((vector - indice['media']) * indice['escala']).astype(np.float32)
+
+
+def buscar_posicion(indice, clave=None, fecha=None):
+    """Fila de la sesión con esa clave (id) o cuya fecha empieza con `fecha`, o None."""
+    if clave:
+        coincidencias = np.flatnonzero(indice['claves'] == clave)
+    elif fecha:
+        coincidencias = np.flatnonzero(np.char.startswith(indice['fechas'], fecha))
+    else:
+        return None
+    return int(coincidencias[0]) if coincidencias.size else None
+
+
+def vecinos(indice, consulta, k=VECINOS):
+    """
+    Las k sesiones más cercanas. `consulta` es una fila del índice (int) o un
+    vector ya normalizado; una fila no se devuelve a sí misma. Retorna una
+    lista de dicts con id, start_time, duration_seconds, hr_avg y distance.
+    """
+    vectores = indice['vectores']
+    if isinstance(consulta, (int, np.integer)):
+        propia, consulta = int(consulta), vectores[consulta]
+    else:
+        propia = None
+    distancias = np.sqrt(((vectores - consulta) ** 2).sum(axis=1))
+    if propia is not None:
+        distancias[propia] = np.inf
+
+    k = min(k, int(np.isfinite(distancias).sum()))
+    if k <= 0:
+        return []
+    cercanas = np.argpartition(distancias, k - 1)[:k]
+    cercanas = cercanas[np.argsort(distancias[cercanas])]
+    return [
+        {
+            'id':               str(indice['claves'][i]),
+            'start_time':       str(indice['fechas'][i]),
+            'duration_seconds': int(indice['duraciones'][i]),
+            'hr_avg':           None if np.isnan(indice['hr_avg'][i]) else float(indice['hr_avg'][i]),
+            'distance':         round(float(distancias[i]), 3),
+        }
+        for i in cercanas
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sesiones parecidas a una sesión exportada.')
+    parser.add_argument('--indice', type=Path, default=ARCHIVO_JSON.parent / ARCHIVO_SIMILITUD,
+                        help=f'{ARCHIVO_SIMILITUD} escrito por exportar_para_dashboard.py')
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--fecha', help='Fecha (y hora) de inicio de la sesión: YYYY-MM-DD[THH:MM]')
+    grupo.add_argument('--id', help='id de la sesión en el JSON exportado')
+    parser.add_argument('-k', type=int, default=VECINOS, help=f'Cantidad de vecinos (por defecto {VECINOS})')
+    args = parser.parse_args(argv)
+
+    indice = cargar_indice(args.indice)
+    if indice is None:
+        print(f"❌ No hay índice de similitud en {args.indice} (se crea al exportar)")
+        return 1
+    posicion = buscar_posicion(indice, clave=args.id, fecha=args.fecha)
+    if posicion is None:
+        print(f"❌ No se encontró la sesión {args.id or args.fecha} entre las {len(indice['claves'])} indexadas")
+        return 1
+
+    print(f"Sesión: {indice['fechas'][posicion]} ({indice['duraciones'][posicion] // 60} min)\n")
+    for i, v in enumerate(vecinos(indice, posicion, args.k), 1):
+        hr = f"{v['hr_avg']:.0f} bpm" if v['hr_avg'] is not None else '-'
+        print(f"  {i}. {v['start_time'][:16]:16s}  {v['duration_seconds'] // 60:4d} min  {hr:>8s}  "
+              f"distancia {v['distance']:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Sincronización en streaming y procesamiento en pipeline.
+
+DataLink.sessions descarga todas las sesiones por USB y recién entonces
+devuelve la lista completa, así que el parseo no puede empezar hasta que
+termina la transferencia. Aquí:
+
+- LecturaSesiones entrega cada sesión apenas se terminan de recibir sus
+  paquetes (mismo protocolo que DataLink.sessions, sesión por sesión).
+- LecturaCapturas hace lo mismo con uno o más directorios de sesiones crudas
+  guardadas (un JSON por sesión, formato de `polar export raw`), para trabajar
+  sin reloj.
+- iterar_sesiones() construye una TrainingSession (con el stream armado desde
+  un buffer contiguo, ver ensamblado) por sesión cruda y libera
+  sus paquetes y su stream de bits al pasar a la siguiente, así que la memoria
+  queda acotada por la sesión más grande y no por el total del reloj.
+- procesar_en_pipeline() lee esa fuente en un hilo productor, la pasa por una
+  cola acotada y reparte las sesiones en un pool de procesos, de modo que la
+  transferencia USB y el parseo (CPU) se solapan.
+"""
+
+import json
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from polar_rcx5_datalink.exceptions import SyncError
+from polar_rcx5_datalink.utils import report_warning, to_stdout
+
+from ensamblado import SesionContigua
+
+# Sesiones recibidas esperando un worker libre
+MAX_EN_COLA = 4
+
+_FIN = object()
+
+
+class LecturaSesiones(object):
+    """
+    Iterable sobre las sesiones crudas del reloj, leídas de a una.
+
+    `total` queda disponible en cuanto se consulta la cantidad de sesiones
+    (antes de recibir la primera).
+    """
+
+    def __init__(self, dl):
+        self.dl = dl
+        self.total = None
+
+    def __iter__(self):
+        dl = self.dl
+        to_stdout('[sync] Loading training sessions')
+
+        session_count = dl._count_sessions()
+        if session_count is None:
+            raise SyncError('Failed to load training sessions')
+
+        if session_count == 0:
+            raise SyncError('No training sessions found')
+
+        session_sizes = []
+        for num in range(session_count):
+            size = dl._read_session_size(num)
+            if size is None:
+                raise SyncError(f"Can't get a size of session #{num + 1}")
+
+            session_sizes.append(size)
+
+        self.total = session_count
+
+        for num, size in enumerate(session_sizes):
+            session = dl._read_session(num, size)
+            if session is None:
+                report_warning(f"Can't read session #{num + 1}")
+                continue
+
+            yield session
+
+
+class LecturaCapturas(object):
+    """
+    Iterable sobre las sesiones crudas guardadas en uno o más directorios,
+    leídas de a una en orden de nombre de archivo (directorio por directorio).
+    """
+
+    def __init__(self, *directorios):
+        self.directorios = [Path(d) for d in directorios]
+        self.archivos = [a for d in self.directorios for a in sorted(d.glob('*.json'))]
+        self.total = len(self.archivos)
+
+    def __iter__(self):
+        for archivo in self.archivos:
+            with open(archivo, encoding='utf-8') as f:
+                yield json.load(f)
+
+
+def liberar_sesion(sess):
+    """
+    Suelta los datos pesados de una TrainingSession ya procesada: paquetes
+    crudos, buffer reensamblado, stream de bits (un carácter por bit, ~8x el
+    tamaño en bytes) y muestras. Conserva info, fechas y duración.
+    """
+    sess.raw = None
+    sess.ensamblada = None
+    sess._samples_bits = ''
+    sess.samples = []
+
+
+def iterar_sesiones(fuente, clase=SesionContigua):
+    """
+    Entrega de a una las sesiones parseadas (solo header) de una fuente de
+    sesiones crudas, omitiendo las que no se pueden construir.
+
+    La sesión entregada es válida hasta pedir la siguiente: en ese momento se
+    liberan su crudo y su stream de bits. Para conservar una sesión, guardar
+    una referencia a sess.raw antes de avanzar y reconstruirla después.
+    """
+    for raw in fuente:
+        try:
+            sess = clase(raw)
+        except Exception:
+            continue
+        del raw
+
+        yield sess
+        liberar_sesion(sess)
+
+
+def _producir(fuente, cola):
+    """Hilo productor: pone cada elemento de la fuente en la cola."""
+    try:
+        for item in fuente:
+            cola.put(item)
+    except BaseException as e:
+        cola.put(e)
+    finally:
+        cola.put(_FIN)
+
+
+def procesar_en_pipeline(fuente, funcion, workers=None, max_en_cola=MAX_EN_COLA):
+    """
+    Aplica `funcion` a cada elemento de `fuente` en un pool de procesos
+    mientras la fuente se sigue leyendo en otro hilo.
+
+    Entrega los resultados en el mismo orden que la fuente. Como mucho hay
+    `max_en_cola` elementos esperando y `workers` + `max_en_cola` en proceso,
+    así que la memoria no crece con la cantidad de sesiones. Las excepciones de
+    la fuente (p. ej. SyncError) se propagan al consumidor.
+    """
+    workers = workers or os.cpu_count() or 1
+    cola = queue.Queue(maxsize=max_en_cola)
+    productor = threading.Thread(target=_producir, args=(fuente, cola), daemon=True)
+    productor.start()
+
+    pendientes = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            item = cola.get()
+            if item is _FIN:
+                break
+            if isinstance(item, BaseException):
+                raise item
+
+            pendientes.append(pool.submit(funcion, item))
+            del item
+
+            # No dejar que se acumulen resultados sin consumir
+            while len(pendientes) > workers + max_en_cola or (pendientes and pendientes[0].done()):
+                yield pendientes.popleft().result()
+
+        while pendientes:
+            yield pendientes.popleft().result()
@@ -3,11 +3,12 @@ Script para verificar que el cambio de offset corrige el problema de HR.
 """
 
 import sys
-sys.path.insert(0, r'C:\Users\Pablo\AppData\Local\Programs\Python\Python314\Lib\site-packages')
+from collections import deque
 
 from polar_rcx5_datalink.datalink import DataLink
 from polar_rcx5_datalink.parser import TrainingSession
 from polar_rcx5_datalink.exceptions import SyncError
+from sincronizacion import LecturaSesiones, iterar_sesiones
 
 
 def verificar_sesion(sess):
@@ -103,34 +104,31 @@ def main():
         print("\n[1/2] Sincronizando con el reloj...")
         with DataLink() as dl:
             dl.synchronize()
-            raw_sessions = dl.sessions
-        
-        print(f"✓ Sincronización completada: {len(raw_sessions)} sesiones encontradas")
-        
-        # Buscar sesiones con HR
-        print(f"\n[2/2] Verificando sesiones con HR...")
-        sesiones_con_hr = []
-        
-        for i, raw_session in enumerate(raw_sessions):
-            try:
-                sess = TrainingSession(raw_session)
+            lectura = LecturaSesiones(dl)
+            
+            # Buscar sesiones con HR; solo se conserva el crudo de las últimas 3
+            print(f"\n[2/2] Verificando sesiones con HR...")
+            num_con_hr = 0
+            ultimas = deque(maxlen=3)
+            
+            for sess in iterar_sesiones(lectura):
                 if sess.has_hr:
-                    sesiones_con_hr.append((i, sess))
-            except:
-                pass
+                    num_con_hr += 1
+                    ultimas.append(sess.raw)
         
-        print(f"✓ Encontradas {len(sesiones_con_hr)} sesiones con HR")
+        print(f"✓ Sincronización completada: {lectura.total} sesiones encontradas")
+        print(f"✓ Encontradas {num_con_hr} sesiones con HR")
         
-        if len(sesiones_con_hr) == 0:
+        if not ultimas:
             print("\n⚠️ No hay sesiones con HR para verificar.")
             return
         
         # Verificar las últimas 3 sesiones
-        num_verificar = min(3, len(sesiones_con_hr))
-        print(f"\nVerificando las últimas {num_verificar} sesiones...")
+        print(f"\nVerificando las últimas {len(ultimas)} sesiones...")
         
         resultados = []
-        for idx, sess in sesiones_con_hr[-num_verificar:]:
+        while ultimas:
+            sess = TrainingSession(ultimas.popleft())
             resultado = verificar_sesion(sess)
             resultados.append((sess.id, resultado))
         
@@ -0,0 +1,141 @@
+"""
+Conversión a UTC de las fechas locales que guarda el reloj.
+
+El reloj guarda la hora de inicio sin zona horaria, así que la librería llama a
+utils.datetime_to_utc() por cada sesión. La versión original consulta al sistema
+operativo (tzlocal) y vuelve a construir la zona de pytz en cada llamada.
+
+Este módulo resuelve la zona una sola vez por proceso, cachea las zonas de pytz
+y permite forzar una zona explícita (--timezone). La zona resuelta se publica en
+la variable de entorno RCX5_TIMEZONE para que los procesos hijos (workers) la
+hereden sin volver a consultar al sistema.
+"""
+
+import datetime
+import functools
+import os
+
+import pytz
+import tzlocal
+
+import polar_rcx5_datalink.utils as utils
+from polar_rcx5_datalink.utils import bcd_to_int
+
+ENV_TIMEZONE = 'RCX5_TIMEZONE'
+
+
+@functools.lru_cache(maxsize=None)
+def zona_del_sistema():
+    """Nombre de la zona horaria del sistema operativo (se consulta una vez)."""
+    return str(tzlocal.get_localzone())
+
+
+@functools.lru_cache(maxsize=64)
+def obtener_zona(nombre):
+    """Devuelve la zona de pytz para `nombre`, cacheada."""
+    return pytz.timezone(nombre)
+
+
+def nombre_zona(timezone=None):
+    """Zona a usar: la explícita, la forzada por entorno o la del sistema."""
+    if timezone:
+        return timezone
+    return os.environ.get(ENV_TIMEZONE) or zona_del_sistema()
+
+
+# tzlocal >= 3.0 retorna ZoneInfo en lugar de un timezone de pytz,
+# pero la librería llama .localize() que solo existe en pytz.
+def datetime_to_utc(dt, timezone=None):
+    """Reemplazo compatible y cacheado de utils.datetime_to_utc."""
+    tz = obtener_zona(nombre_zona(timezone))
+    return tz.localize(dt, is_dst=None).astimezone(pytz.utc)
+
+
+def convertir_a_utc(fechas, timezone=None):
+    """
+    Convierte una lista de datetimes sin zona a UTC resolviendo la zona una
+    vez. Las entradas None, o con una hora inexistente/ambigua en la zona
+    (cambio de horario), quedan en None.
+    """
+    tz = obtener_zona(nombre_zona(timezone))
+    resultado = []
+    for dt in fechas:
+        try:
+            resultado.append(None if dt is None else tz.localize(dt, is_dst=None).astimezone(pytz.utc))
+        except pytz.exceptions.InvalidTimeError:
+            resultado.append(None)
+    return resultado
+
+
+def inicio_local(raw_session):
+    """Hora de inicio (sin zona) del header del primer paquete, igual que TrainingSession.start_time."""
+    p = raw_session[0]
+    return datetime.datetime(p[44] + 1920, p[43], p[42],
+                             bcd_to_int(p[41]), bcd_to_int(p[40]), bcd_to_int(p[39]))
+
+
+def ids_de_sesiones(crudas, timezone=None):
+    """
+    id de cada sesión cruda leyendo solo el header, sin construir las
+    sesiones: el mismo que TrainingSession.id recién construida, con la zona
+    horaria del reloj. None si el header no tiene una fecha válida.
+
+    Con GPS, parse_samples() recalcula el id con la zona de las primeras
+    coordenadas, así que puede no coincidir con el de la sesión exportada
+    (ver deteccion_gps.id_exportado).
+    """
+    inicios = []
+    for raw in crudas:
+        try:
+            inicios.append(inicio_local(raw))
+        except (ValueError, IndexError, TypeError):
+            inicios.append(None)
+    return [None if utc is None else utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+            for utc in convertir_a_utc(inicios, timezone)]
+
+
+@functools.lru_cache(maxsize=None)
+def _buscador_de_zonas():
+    # Construir un TimezoneFinder carga sus polígonos (~20 ms); se hace una vez
+    from timezonefinder import TimezoneFinder
+    return TimezoneFinder()
+
+
+def timezone_by_coords(lat, lng):
+    """Reemplazo de utils.timezone_by_coords que reutiliza un único
+    TimezoneFinder y tolera coordenadas fuera de rango (GPS corrupto)."""
+    try:
+        zona = _buscador_de_zonas().timezone_at(lat=lat, lng=lng)
+    except ValueError:
+        zona = None
+    return zona or nombre_zona()
+
+
+def parchear():
+    """Reemplaza las funciones de zona horaria de la librería por las cacheadas."""
+    utils.datetime_to_utc = datetime_to_utc
+    utils.timezone_by_coords = timezone_by_coords
+
+
+def instalar(timezone=None):
+    """
+    Parchea la librería y fija la zona para este proceso y sus hijos.
+
+    Con `timezone` se usa esa zona; si no, la del entorno o la del sistema
+    (que se consulta aquí una única vez). Retorna el nombre de la zona en uso.
+    """
+    nombre = nombre_zona(timezone)
+    obtener_zona(nombre)  # valida el nombre antes de publicarlo
+    os.environ[ENV_TIMEZONE] = nombre
+    parchear()
+    return nombre
+
+
+def agregar_argumento(parser):
+    """Agrega la opción --timezone a un argparse.ArgumentParser."""
+    parser.add_argument(
+        '--timezone',
+        default=None,
+        help='Zona horaria del reloj (ej: America/Argentina/Buenos_Aires). '
+             'Por defecto se usa la del sistema.',
+    )